@@ -0,0 +1,194 @@
+/*
+ * 图像质量检测 C 接口（供 Python ctypes 调用）
+ *
+ * 所有函数直接读取调用方传入的灰度缓冲区（uint8，行步长 stride 字节），不拷贝、不解码，
+ * 与 Python 版本（Laplacian.py / 过暗过曝检测.py / 遮挡检测.py）的判定逻辑保持一致。
+ *
+ * 编译:
+ *   Linux:   g++ -O3 -std=c++17 -shared -fPIC quality_capi.cpp -o libquality.so
+ *   Windows: g++ -O3 -std=c++17 -shared quality_capi.cpp -o quality.dll
+ */
+#include <cstdint>
+#include <cmath>
+#include <vector>
+#include <utility>
+
+#if defined(_WIN32)
+#define QC_API extern "C" __declspec(dllexport)
+#else
+#define QC_API extern "C"
+#endif
+
+/* ---------------- Laplacian 方差 ---------------- */
+// 只统计内部 (h-2)*(w-2) 个响应（与 conv2d 无 padding 一致），无偏方差
+QC_API double qc_variance_of_laplacian(const uint8_t* data, int h, int w, int stride) {
+    if (h < 3 || w < 3) return 0.0;
+
+    double sum = 0.0, sum_sq = 0.0;
+    for (int y = 1; y < h - 1; ++y) {
+        const uint8_t* up = data + (y - 1) * stride;
+        const uint8_t* row = data + y * stride;
+        const uint8_t* down = data + (y + 1) * stride;
+        for (int x = 1; x < w - 1; ++x) {
+            double v = up[x] + down[x] + row[x - 1] + row[x + 1] - 4.0 * row[x];
+            sum += v;
+            sum_sq += v * v;
+        }
+    }
+
+    double n = double(h - 2) * double(w - 2);
+    if (n < 2) return 0.0;
+    double mean = sum / n;
+    return (sum_sq - n * mean * mean) / (n - 1);
+}
+
+/* ---------------- 过暗过曝检测 ---------------- */
+// 返回值: 0=normal, 1=underexposed, 2=overexposed
+QC_API int qc_check_brightness(const uint8_t* data, int h, int w, int stride,
+                               int under_t, int over_t,
+                               double under_r, double over_r,
+                               int window_size, int min_area,
+                               double* dark_ratio, double* bright_ratio,
+                               int* num_regions) {
+    // 直方图 + 过曝掩码积分图
+    long long hist[256] = {0};
+    std::vector<int> integral((size_t)(h + 1) * (w + 1), 0);
+    for (int y = 0; y < h; ++y) {
+        const uint8_t* row = data + y * stride;
+        int acc = 0;
+        for (int x = 0; x < w; ++x) {
+            hist[row[x]]++;
+            acc += row[x] > over_t;
+            integral[(size_t)(y + 1) * (w + 1) + x + 1] = integral[(size_t)y * (w + 1) + x + 1] + acc;
+        }
+    }
+
+    long long total = (long long)h * w;
+    long long dark = 0, bright = 0;
+    for (int v = 0; v < 256; ++v) {
+        if (v < under_t) dark += hist[v];
+        if (v > over_t) bright += hist[v];
+    }
+    *dark_ratio = double(dark) / total;
+    *bright_ratio = double(bright) / total;
+
+    // 窗口遍历方式与 Python range(0, h - window_size, window_size) 一致
+    int regions = 0;
+    if (window_size * window_size > min_area) {
+        for (int y = 0; y < h - window_size; y += window_size) {
+            for (int x = 0; x < w - window_size; x += window_size) {
+                int y1 = y + window_size, x1 = x + window_size;
+                int cnt = integral[(size_t)y1 * (w + 1) + x1] - integral[(size_t)y * (w + 1) + x1]
+                        - integral[(size_t)y1 * (w + 1) + x] + integral[(size_t)y * (w + 1) + x];
+                if (double(cnt) / (window_size * window_size) > 0.5) regions++;
+            }
+        }
+    }
+    *num_regions = regions;
+
+    if (*dark_ratio > under_r) return 1;
+    if (*bright_ratio > over_r || regions > 0) return 2;
+    return 0;
+}
+
+/* ---------------- 黑色遮挡检测 ---------------- */
+// 与 detect_black_occlusion_cc 一致：8 连通最大黑色连通域，填充内部空洞后统计面积和标准差
+// 返回值: 1=遮挡, 0=未遮挡
+QC_API int qc_detect_black_occlusion(const uint8_t* data, int h, int w, int stride,
+                                     int black_thresh, double area_ratio_thresh, double std_thresh,
+                                     double* area_ratio, double* block_std) {
+    *area_ratio = 0.0;
+    *block_std = 0.0;
+
+    std::vector<int> labels((size_t)h * w, 0);
+    std::vector<std::pair<int, int>> stack;
+    int best_label = 0;
+    long long best_area = 0;
+    int bx0 = 0, by0 = 0, bx1 = 0, by1 = 0;
+    int current = 0;
+
+    for (int y = 0; y < h; ++y) {
+        for (int x = 0; x < w; ++x) {
+            size_t idx = (size_t)y * w + x;
+            if (labels[idx] != 0 || data[y * stride + x] > black_thresh) continue;
+
+            current++;
+            long long area = 0;
+            int x0 = x, y0 = y, x1 = x, y1 = y;
+            labels[idx] = current;
+            stack.push_back({x, y});
+            while (!stack.empty()) {
+                auto [cx, cy] = stack.back();
+                stack.pop_back();
+                area++;
+                if (cx < x0) x0 = cx;
+                if (cx > x1) x1 = cx;
+                if (cy < y0) y0 = cy;
+                if (cy > y1) y1 = cy;
+                for (int dy = -1; dy <= 1; ++dy) {
+                    for (int dx = -1; dx <= 1; ++dx) {
+                        int nx = cx + dx, ny = cy + dy;
+                        if (nx < 0 || ny < 0 || nx >= w || ny >= h) continue;
+                        size_t nidx = (size_t)ny * w + nx;
+                        if (labels[nidx] != 0 || data[ny * stride + nx] > black_thresh) continue;
+                        labels[nidx] = current;
+                        stack.push_back({nx, ny});
+                    }
+                }
+            }
+
+            if (area > best_area) {
+                best_area = area;
+                best_label = current;
+                bx0 = x0; by0 = y0; bx1 = x1; by1 = y1;
+            }
+        }
+    }
+
+    if (best_label == 0) return 0;
+
+    // 外接矩形外扩一圈，从角点 4 连通填充外部背景，剩下的即连通域 + 内部空洞
+    int rw = bx1 - bx0 + 3, rh = by1 - by0 + 3;
+    std::vector<uint8_t> outside((size_t)rw * rh, 0);
+    auto is_component = [&](int rx, int ry) {
+        int x = rx - 1 + bx0, y = ry - 1 + by0;
+        if (x < bx0 || x > bx1 || y < by0 || y > by1) return false;
+        return labels[(size_t)y * w + x] == best_label;
+    };
+    stack.push_back({0, 0});
+    outside[0] = 1;
+    while (!stack.empty()) {
+        auto [cx, cy] = stack.back();
+        stack.pop_back();
+        const int dxs[4] = {-1, 1, 0, 0}, dys[4] = {0, 0, -1, 1};
+        for (int k = 0; k < 4; ++k) {
+            int nx = cx + dxs[k], ny = cy + dys[k];
+            if (nx < 0 || ny < 0 || nx >= rw || ny >= rh) continue;
+            size_t nidx = (size_t)ny * rw + nx;
+            if (outside[nidx] || is_component(nx, ny)) continue;
+            outside[nidx] = 1;
+            stack.push_back({nx, ny});
+        }
+    }
+
+    long long filled = 0;
+    double sum = 0.0, sum_sq = 0.0;
+    for (int y = by0; y <= by1; ++y) {
+        for (int x = bx0; x <= bx1; ++x) {
+            if (outside[(size_t)(y - by0 + 1) * rw + (x - bx0 + 1)]) continue;
+            double v = data[y * stride + x];
+            filled++;
+            sum += v;
+            sum_sq += v * v;
+        }
+    }
+
+    double mean = sum / filled;
+    double var = sum_sq / filled - mean * mean;
+    *area_ratio = double(filled) / ((double)h * w);
+    *block_std = std::sqrt(var > 0 ? var : 0.0);
+
+    if (*area_ratio < area_ratio_thresh) return 0;
+    if (*block_std > std_thresh) return 0;
+    return 1;
+}
@@ -102,49 +102,100 @@ import torch.nn.functional as F
 from torch.utils.data import Dataset, DataLoader
 import cv2
 
+from decode_flags import GRAY_DECODE_FLAGS
+
 #pytorch
 
-def fourier_blur_detect_torch(img_tensor, threshold=0.02):
+# 低频权重缓存，key = (H, W, radius, device)
+_FREQ_WEIGHTS = {}
+
+
+def _get_freq_weights(H, W, radius, device):
     """
-    输入: img_tensor shape = (1, H, W), uint8 / float32
-    返回: pred_blur(bool), energy_ratio(float)
+    在未 shift 的 rfft2 半谱上构造能量权重，等价于原先 fftshift 后
+    中心 [c-radius, c+radius) 方块置零的 mask：
+    shift 后的中心方块对应未 shift 频谱中行、列频率都落在 [-radius, radius) 内的位置。
+    rfft2 只保留 W//2+1 列，除 0 列和 (W 偶数时) W/2 列外，每一列还代表其共轭对称列
+    (-k, W-l)，因此权重取 0/1/2。
+    返回: (high_weight, total_weight)，shape 均为 (H, W//2+1)
     """
+    key = (H, W, radius, str(device))
+    weights = _FREQ_WEIGHTS.get(key)
+    if weights is not None:
+        return weights
 
-    img = img_tensor.float()
+    rows = torch.arange(H, device=device)
+    cols = torch.arange(W // 2 + 1, device=device)
 
+    def in_low(idx, n):
+        return (idx < radius) | (idx >= n - radius)
 
-    dft = torch.fft.fft2(img)
-    dft_shift = torch.fft.fftshift(dft)
+    low_row = in_low(rows, H)
+    low_row_mirror = in_low((-rows) % H, H)
+    low_col = in_low(cols, W)
+    low_col_mirror = in_low((W - cols) % W, W)
 
+    # 0 列和 Nyquist 列的共轭对称位置仍在半谱内，不重复计数
+    self_mirror = (cols == 0) | ((W % 2 == 0) & (cols == W // 2))
+
+    high = (~(low_row[:, None] & low_col[None, :])).float()
+    high_mirror = (~(low_row_mirror[:, None] & low_col_mirror[None, :])).float()
+    high_weight = high + torch.where(self_mirror[None, :], torch.zeros_like(high_mirror), high_mirror)
+    total_weight = torch.where(self_mirror, 1.0, 2.0).to(high_weight.dtype).expand(H, -1).contiguous()
+
+    weights = (high_weight, total_weight)
+    _FREQ_WEIGHTS[key] = weights
+    return weights
+
+
+def fourier_blur_detect_batch(img_tensor, threshold=0.02, radius=30):
+    """
+    批量傅里叶模糊检测，使用实数 FFT 半谱 + 缓存权重，不做 fftshift
+    输入: img_tensor shape = (N, 1, H, W) 或 (N, H, W), uint8 / float32
+    返回: pred_blur (N,) bool tensor, energy_ratio (N,) float tensor
+    """
+    img = img_tensor.float()
     H, W = img.shape[-2:]
-    crow, ccol = H // 2, W // 2
 
+    high_weight, total_weight = _get_freq_weights(H, W, radius, img.device)
 
-    mask = torch.ones((H, W), device=img.device)
-    mask[crow - 30:crow + 30, ccol - 30:ccol + 30] = 0
+    dft = torch.fft.rfft2(img)
+    power = dft.real ** 2 + dft.imag ** 2
 
+    high_energy = (power * high_weight).sum(dim=(-2, -1))
+    total_energy = (power * total_weight).sum(dim=(-2, -1))
 
-    high_freq = dft_shift * mask
+    energy_ratio = (high_energy / total_energy + 1e-6).reshape(img.shape[0])
 
+    pred_blur = energy_ratio < threshold
 
-    energy_ratio = (torch.sum(torch.abs(high_freq) ** 2) /
-                    torch.sum(torch.abs(dft_shift) ** 2) + 1e-6).item()
+    return pred_blur, energy_ratio
 
 
+def fourier_blur_detect_torch(img_tensor, threshold=0.02):
+    """
+    输入: img_tensor shape = (1, H, W), uint8 / float32
+    返回: pred_blur(bool), energy_ratio(float)
+    """
+    _, energy_ratio = fourier_blur_detect_batch(img_tensor.unsqueeze(0), threshold)
+    energy_ratio = energy_ratio.item()
+
     pred_blur = energy_ratio < threshold
 
     return pred_blur, energy_ratio
 
 
 
+# 注意低频 mask 半径按像素计，reduce>1 时阈值需要重新标定
 class FourierBlurDataset(Dataset):
-    def __init__(self, root):
+    def __init__(self, root, reduce=1):
         self.image_paths = []
         for p in Path(root).rglob("*.*"):
             if p.suffix.lower() in [".jpg", ".png", ".jpeg", ".bmp"]:
                 self.image_paths.append(str(p))
 
         self.blurry_prefix = ["blur"]
+        self.decode_flag = GRAY_DECODE_FLAGS[reduce]
 
     def __len__(self):
         return len(self.image_paths)
@@ -153,29 +204,50 @@ class FourierBlurDataset(Dataset):
         path = self.image_paths[idx]
 
 
-        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        start = time.perf_counter()
+        img = cv2.imread(path, self.decode_flag)
+        decode_time = time.perf_counter() - start
         img_tensor = torch.from_numpy(img).unsqueeze(0)  # (1, H, W)
 
 
         parent = os.path.basename(os.path.dirname(path))
         gt = 1 if any(parent.startswith(p) for p in self.blurry_prefix) else 0
 
-        return img_tensor, gt, path
+        return img_tensor, gt, path, decode_time
+
+
+def make_loader(dataset, num_workers=4, prefetch_factor=2):
+    """
+    并行解码的 DataLoader：num_workers 个解码进程，
+    每个进程最多预取 prefetch_factor 个 batch（有界队列）
+    num_workers=0 时退化为主进程串行解码
+    """
+    return DataLoader(
+        dataset,
+        batch_size=1,
+        shuffle=False,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+    )
 
 
 def evaluate(model_loader, threshold=0.02):
     TP = TN = FP = FN = 0
     total_images = 0
     total_time = 0
+    total_decode_time = 0
+    wall_start = time.perf_counter()
 
-    for img_tensor, gt, path in model_loader:
+    for img_tensor, gt, path, decode_time in model_loader:
         img_tensor = img_tensor.squeeze(0)  # 去掉 batch 维度
         gt = gt.item()
+        total_decode_time += decode_time.sum().item()
 
-        start = time.time()
+        start = time.perf_counter()
 
         pred_blur, ratio = fourier_blur_detect_torch(img_tensor, threshold)
-        total_time += time.time() - start
+        total_time += time.perf_counter() - start
         total_images += 1
 
         pred = 1 if pred_blur else 0
@@ -198,6 +270,8 @@ def evaluate(model_loader, threshold=0.02):
     precision = TP / (TP + FP + 1e-6)
     f1 = 2 * precision * recall / (precision + recall + 1e-6)
     avg_time = total_time / (total_images + 1e-6)
+    avg_decode_time = total_decode_time / (total_images + 1e-6)
+    wall_time = time.perf_counter() - wall_start
 
     print("\n============ Evaluation Result ============")
     print(f"Total Images    : {total_images}")
@@ -206,6 +280,8 @@ def evaluate(model_loader, threshold=0.02):
     print(f"Precision       : {precision:.4f}")
     print(f"F1-score        : {f1:.4f}")
     print(f"Avg Time/Image  : {avg_time * 1000:.2f} ms")
+    print(f"Avg Decode/Image: {avg_decode_time * 1000:.2f} ms")
+    print(f"Wall Time       : {wall_time:.2f} s")
     print("===========================================\n")
 
 
@@ -214,7 +290,10 @@ if __name__ == "__main__":
     root = "/home/amax/XD/Image Blur/datasets/GOPRO_Large/test/GOPR0869_11_00/"
     threshold = 0.018
 
-    dataset = FourierBlurDataset(root)
-    loader = DataLoader(dataset, batch_size=1, shuffle=False)
+    num_workers = 4  # 解码进程数
+    reduce = 1       # 解码降采样倍数 1/2/4/8
+
+    dataset = FourierBlurDataset(root, reduce=reduce)
+    loader = make_loader(dataset, num_workers=num_workers)
 
     evaluate(loader, threshold)
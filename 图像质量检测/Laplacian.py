@@ -95,34 +95,77 @@ import torch
 from torch.utils.data import Dataset, DataLoader
 from imutils import paths
 
+from decode_flags import GRAY_DECODE_FLAGS
+
 #pytorch
 
+# Laplacian 卷积核缓存，按 (device, dtype) 复用，避免每帧重新构造
+_LAPLACIAN_KERNELS = {}
+
+
+def _get_laplacian_kernel(device, dtype=torch.float32):
+    key = (str(device), dtype)
+    kernel = _LAPLACIAN_KERNELS.get(key)
+    if kernel is None:
+        kernel = torch.tensor([[[[0, 1, 0],
+                                 [1, -4, 1],
+                                 [0, 1, 0]]]], dtype=dtype, device=device)
+        _LAPLACIAN_KERNELS[key] = kernel
+    return kernel
+
+
 def variance_of_laplacian(image_tensor):
     """
     PyTorch 版本的 Laplacian 方差计算
     输入: (1, H, W) 的灰度图 tensor，值范围 0~255
     """
+    return variance_of_laplacian_batch(image_tensor.unsqueeze(0))[0].item()
+
+
+def variance_of_laplacian_batch(images):
+    """
+    批量 Laplacian 方差计算
+    输入: (N, 1, H, W) 的灰度图 tensor，值范围 0~255
+    返回: (N,) 的方差 tensor，一次向量化规约得到全部结果
+    """
     # 转成 float32
-    img = image_tensor.float()
-
-    # 使用 PyTorch 的 Laplacian
-    lap = torch.nn.functional.conv2d(
-        img.unsqueeze(0),   # (1,1,H,W)
-        weight=torch.tensor([[[[0, 1, 0],
-                               [1, -4, 1],
-                               [0, 1, 0]]]], dtype=torch.float32)
-    )
+    img = images.float()
+
+    # 复用缓存的卷积核
+    lap = torch.nn.functional.conv2d(img, weight=_get_laplacian_kernel(img.device))
+
+    return lap.flatten(1).var(dim=1)
+
 
-    return lap.var().item()
+def variance_of_laplacian_list(images):
+    """
+    不同分辨率混合的图片列表批量打分
+    输入: list of (1, H, W) tensor
+    返回: 与输入顺序一致的 float 列表
+    按分辨率分桶后逐桶批量计算（不做 padding，padding 会改变方差）
+    """
+    buckets = {}
+    for i, img in enumerate(images):
+        buckets.setdefault(tuple(img.shape[-2:]), []).append(i)
+
+    scores = [0.0] * len(images)
+    for indices in buckets.values():
+        stack = torch.stack([images[i] for i in indices])  # (n,1,H,W)
+        variances = variance_of_laplacian_batch(stack).tolist()
+        for i, v in zip(indices, variances):
+            scores[i] = v
+    return scores
 
 
 # ===========================
 # PyTorch Dataset
 # ===========================
+# 注意 reduce>1 时 Laplacian 方差的量级会变化，阈值需要重新标定
 class BlurDataset(Dataset):
-    def __init__(self, root):
+    def __init__(self, root, reduce=1):
         self.image_paths = list(paths.list_images(root))
         self.blurry_folders = ["blur", "blur_gamma"]
+        self.decode_flag = GRAY_DECODE_FLAGS[reduce]
 
     def __len__(self):
         return len(self.image_paths)
@@ -130,8 +173,10 @@ class BlurDataset(Dataset):
     def __getitem__(self, idx):
         path = self.image_paths[idx]
 
-        img = cv2.imread(path)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        # 直接解码为灰度图，省去 BGR 解码 + cvtColor
+        start_time = time.perf_counter()
+        gray = cv2.imread(path, self.decode_flag)
+        decode_time = time.perf_counter() - start_time
 
         # 转换为 (1, H, W) tensor
         gray_tensor = torch.from_numpy(gray).unsqueeze(0)
@@ -141,41 +186,85 @@ class BlurDataset(Dataset):
 
         gt = 1 if folder in self.blurry_folders else 0  # 1=blurry, 0=sharp
 
-        return gray_tensor, gt, path
+        return gray_tensor, gt, path, decode_time
+
+    @staticmethod
+    def collate_by_shape(batch):
+        """
+        DataLoader 的 collate_fn：按分辨率把一个 batch 分组
+        返回: [(gray (n,1,H,W), gt (n,), paths, decode_time), ...]，每组可直接批量打分
+        """
+        groups = {}
+        for item in batch:
+            groups.setdefault(tuple(item[0].shape), []).append(item)
+
+        buckets = []
+        for items in groups.values():
+            grays = torch.stack([item[0] for item in items])
+            gts = torch.tensor([item[1] for item in items])
+            bucket_paths = [item[2] for item in items]
+            decode_time = sum(item[3] for item in items)
+            buckets.append((grays, gts, bucket_paths, decode_time))
+        return buckets
+
+
+def make_loader(dataset, batch_size=32, num_workers=4, prefetch_factor=2):
+    """
+    并行解码的 DataLoader：num_workers 个解码进程，
+    每个进程最多预取 prefetch_factor 个 batch（有界队列）
+    num_workers=0 时退化为主进程串行解码
+    """
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=False,
+        collate_fn=BlurDataset.collate_by_shape,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+        persistent_workers=False,
+    )
 
 
 # ===========================
 # Evaluation Loop
 # ===========================
 def evaluate(data_loader, threshold=100.0):
+    """
+    data_loader 需使用 BlurDataset.collate_by_shape 作为 collate_fn
+    """
     TP = TN = FP = FN = 0
     total_time = 0
+    total_decode_time = 0
     total_images = 0
+    wall_start = time.perf_counter()
 
-    for gray, gt, path in data_loader:
-        gray = gray.squeeze(0)  # remove batch dim (1)
+    for buckets in data_loader:
+        for gray, gt, path, decode_time in buckets:
+            total_decode_time += decode_time
+            start_time = time.perf_counter()
 
-        start_time = time.time()
+            # Laplacian 模糊得分 (PyTorch)，整组一次计算
+            fms = variance_of_laplacian_batch(gray).tolist()
 
-        # Laplacian 模糊得分 (PyTorch)
-        fm = variance_of_laplacian(gray)
+            total_time += (time.perf_counter() - start_time)
 
-        pred = 1 if fm < threshold else 0  # 1=blurry
+            for fm, gt_i, path_i in zip(fms, gt.tolist(), path):
+                pred = 1 if fm < threshold else 0  # 1=blurry
 
-        # 分类统计
-        if gt.item() == 1 and pred == 1:
-            TP += 1
-        elif gt.item() == 0 and pred == 0:
-            TN += 1
-        elif gt.item() == 0 and pred == 1:
-            FP += 1
-        elif gt.item() == 1 and pred == 0:
-            FN += 1
+                # 分类统计
+                if gt_i == 1 and pred == 1:
+                    TP += 1
+                elif gt_i == 0 and pred == 0:
+                    TN += 1
+                elif gt_i == 0 and pred == 1:
+                    FP += 1
+                elif gt_i == 1 and pred == 0:
+                    FN += 1
 
-        total_time += (time.time() - start_time)
-        total_images += 1
+                total_images += 1
 
-        print(f"{path[0]}  GT={gt.item()}  Pred={pred}  Score={fm:.2f}")
+                print(f"{path_i}  GT={gt_i}  Pred={pred}  Score={fm:.2f}")
 
     # ====== 指标 ======
     accuracy = (TP + TN) / (TP + TN + FP + FN)
@@ -184,6 +273,8 @@ def evaluate(data_loader, threshold=100.0):
     f1 = 2 * precision * recall / (precision + recall + 1e-6)
 
     avg_time = total_time / total_images
+    avg_decode_time = total_decode_time / total_images
+    wall_time = time.perf_counter() - wall_start
 
     print("\n======= Evaluation Result =======")
     print(f"Total images     : {total_images}")
@@ -192,6 +283,8 @@ def evaluate(data_loader, threshold=100.0):
     print(f"Precision        : {precision:.4f}")
     print(f"F1-score         : {f1:.4f}")
     print(f"Avg time/image   : {avg_time * 1000:.2f} ms")
+    print(f"Avg decode/image : {avg_decode_time * 1000:.2f} ms")
+    print(f"Wall time        : {wall_time:.2f} s")
     print("=================================\n")
 
 
@@ -201,7 +294,10 @@ def evaluate(data_loader, threshold=100.0):
 if __name__ == "__main__":
     root = "/home/amax/XD/Image Blur/datasets/GOPRO_Large/train/GOPR0372_07_00/"
 
-    dataset = BlurDataset(root)
-    dataloader = DataLoader(dataset, batch_size=1, shuffle=False)
+    num_workers = 4  # 解码进程数
+    reduce = 1       # 解码降采样倍数 1/2/4/8
+
+    dataset = BlurDataset(root, reduce=reduce)
+    dataloader = make_loader(dataset, batch_size=32, num_workers=num_workers)
 
     evaluate(dataloader, threshold=100.0)
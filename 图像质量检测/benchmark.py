@@ -0,0 +1,299 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(HERE)
+
+# 测试数据集：仓库自带图片 + 合成帧
+IMAGE_SETS = {
+    "light-data": os.path.join(HERE, "light-data"),
+    "目标检测/data": os.path.join(REPO_ROOT, "目标检测", "data"),
+}
+SYNTHETIC_SIZES = {
+    "720p": (720, 1280),
+    "1080p": (1080, 1920),
+    "1440p": (1440, 2560),
+    "4K": (2160, 3840),
+}
+
+
+# ============================================================
+# 检测器注册表：name -> (backend, 构造函数)
+# 构造函数在子进程中调用，返回对单帧执行检测的可调用对象
+# ============================================================
+def _laplacian_torch():
+    import torch
+    from Laplacian import variance_of_laplacian
+    return lambda gray, bgr: variance_of_laplacian(torch.from_numpy(gray).unsqueeze(0))
+
+
+def _laplacian_opencv():
+    return lambda gray, bgr: cv2.Laplacian(gray, cv2.CV_64F).var()
+
+
+def _laplacian_cpp():
+    import quality_native
+    quality_native.load_library()  # 库未编译 / 找不到时在这里抛 OSError，记为跳过
+    return lambda gray, bgr: quality_native.variance_of_laplacian(gray)
+
+
+def _fourier_torch():
+    import torch
+    from Fourier import fourier_blur_detect_torch
+    return lambda gray, bgr: fourier_blur_detect_torch(torch.from_numpy(gray).unsqueeze(0))
+
+
+def _exposure_numpy():
+    import importlib
+    exposure = importlib.import_module("过暗过曝检测")
+
+    def run(gray, bgr):
+        stats = exposure.ExposureStats(gray, overexposed_threshold=240)
+        return stats.dark_ratio(30), stats.bright_ratio(240), stats.local_overexposure(window_size=100)
+    return run
+
+
+def _exposure_cpp():
+    import quality_native
+    quality_native.load_library()  # 库未编译 / 找不到时在这里抛 OSError，记为跳过
+    return lambda gray, bgr: quality_native.check_image_brightness(gray)
+
+
+def _occlusion_contour():
+    import importlib
+    occlusion = importlib.import_module("遮挡检测")
+    return lambda gray, bgr: occlusion.detect_black_occlusion(bgr)
+
+
+def _occlusion_cc():
+    import importlib
+    occlusion = importlib.import_module("遮挡检测")
+    return lambda gray, bgr: occlusion.detect_black_occlusion_cc(gray)
+
+
+def _occlusion_cc_coarse():
+    import importlib
+    occlusion = importlib.import_module("遮挡检测")
+    return lambda gray, bgr: occlusion.detect_black_occlusion_cc(gray, coarse_scale=0.25)
+
+
+def _occlusion_cpp():
+    import quality_native
+    quality_native.load_library()  # 库未编译 / 找不到时在这里抛 OSError，记为跳过
+    return lambda gray, bgr: quality_native.detect_black_occlusion(gray)
+
+
+def _engine_all():
+    from quality_engine import ImageQualityEngine
+    engine = ImageQualityEngine()
+    return lambda gray, bgr: engine.analyze_gray(gray)
+
+
+DETECTORS = {
+    "laplacian/torch": ("torch", _laplacian_torch),
+    "laplacian/opencv": ("numpy", _laplacian_opencv),
+    "laplacian/cpp": ("cpp", _laplacian_cpp),
+    "fourier/torch": ("torch", _fourier_torch),
+    "exposure/numpy": ("numpy", _exposure_numpy),
+    "exposure/cpp": ("cpp", _exposure_cpp),
+    "occlusion_contour/numpy": ("numpy", _occlusion_contour),
+    "occlusion_cc/numpy": ("numpy", _occlusion_cc),
+    "occlusion_cc_coarse/numpy": ("numpy", _occlusion_cc_coarse),
+    "occlusion/cpp": ("cpp", _occlusion_cpp),
+    "engine/torch+numpy": ("torch+numpy", _engine_all),
+}
+
+
+# ============================================================
+# 数据准备
+# ============================================================
+def load_image_set(image_dir):
+    frames = []
+    for path in sorted(glob.glob(os.path.join(image_dir, "*"))):
+        bgr = cv2.imread(path)
+        if bgr is None:
+            continue
+        frames.append((cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY), bgr))
+    return frames
+
+
+def synthetic_frames(h, w, count=3, seed=0):
+    """固定随机种子的合成帧：渐变背景 + 噪声 + 一块黑色区域 + 一块高亮区域"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        base = np.linspace(30, 220, w, dtype=np.float32)[None, :].repeat(h, axis=0)
+        base += rng.normal(0, 12, (h, w)).astype(np.float32)
+        y0, x0 = int(h * 0.1 * (i + 1)), int(w * 0.1 * (i + 1))
+        base[y0:y0 + h // 4, x0:x0 + w // 4] = 10
+        base[h // 2:h // 2 + h // 8, w // 2:w // 2 + w // 8] = 250
+        gray = np.clip(base, 0, 255).astype(np.uint8)
+        frames.append((gray, cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)))
+    return frames
+
+
+def build_cases(include_synthetic=True):
+    cases = {}
+    for name, image_dir in IMAGE_SETS.items():
+        if os.path.isdir(image_dir):
+            frames = load_image_set(image_dir)
+            if frames:
+                cases[name] = frames
+    if include_synthetic:
+        for name, (h, w) in SYNTHETIC_SIZES.items():
+            cases[f"synthetic_{name}"] = synthetic_frames(h, w)
+    return cases
+
+
+# ============================================================
+# 计时
+# ============================================================
+def _proc_status_mb(field):
+    """/proc/self/status 里的 VmRSS / VmHWM（kB），非 Linux 返回 None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Linux 上把 VmHWM 重置为当前 RSS，之后的 peak 不再包含加载数据时的临时分配"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_mb():
+    return _proc_status_mb("VmRSS")
+
+
+def _peak_rss_mb():
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_detector(args):
+    """
+    子进程任务：每个检测器独立进程运行，peak RSS 互不干扰
+    先加载测试数据，以此时的 RSS 为基线（并重置 peak），检测器的内存占用按 peak - 基线计，不含数据集本身；
+    不能重置 peak 的系统上基线取加载后的 peak，加载时的临时分配可能掩盖检测器的占用
+    """
+    detector, include_synthetic, warmup, iters = args
+    sys.path.insert(0, HERE)
+    backend, factory = DETECTORS[detector]
+
+    # 在子进程内准备数据，避免大数组跨进程序列化
+    cases = build_cases(include_synthetic)
+    baseline_rss_mb = _rss_mb() if _reset_peak_rss() else _peak_rss_mb()
+
+    try:
+        fn = factory()
+    except (ImportError, OSError) as e:
+        return {"detector": detector, "backend": backend, "skipped": str(e)}
+
+    results = {"detector": detector, "backend": backend, "cases": {}}
+    for case_name, frames in cases.items():
+        for i in range(warmup):
+            gray, bgr = frames[i % len(frames)]
+            fn(gray, bgr)
+
+        latencies = np.empty(iters, dtype=np.int64)
+        for i in range(iters):
+            gray, bgr = frames[i % len(frames)]
+            start = time.perf_counter_ns()
+            fn(gray, bgr)
+            latencies[i] = time.perf_counter_ns() - start
+
+        latencies_ms = latencies / 1e6
+        results["cases"][case_name] = {
+            "frames": len(frames),
+            "shape": list(frames[0][0].shape),
+            "iters": iters,
+            "p50_ms": float(np.percentile(latencies_ms, 50)),
+            "p95_ms": float(np.percentile(latencies_ms, 95)),
+            "p99_ms": float(np.percentile(latencies_ms, 99)),
+            "mean_ms": float(latencies_ms.mean()),
+            "throughput_fps": float(iters / (latencies.sum() / 1e9)),
+        }
+
+    peak_rss_mb = _peak_rss_mb()
+    results["dataset_rss_mb"] = baseline_rss_mb
+    results["peak_rss_mb"] = peak_rss_mb
+    results["detector_rss_mb"] = None if peak_rss_mb is None or baseline_rss_mb is None \
+        else peak_rss_mb - baseline_rss_mb
+    return results
+
+
+def run_benchmark(detectors=None, warmup=3, iters=20, include_synthetic=True):
+    detectors = detectors or list(DETECTORS)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "warmup": warmup,
+        "iters": iters,
+        "results": [],
+    }
+
+    ctx = multiprocessing.get_context("spawn")
+    for detector in detectors:
+        with ctx.Pool(1) as pool:
+            result = pool.apply(_run_detector, ((detector, include_synthetic, warmup, iters),))
+        report["results"].append(result)
+
+        if "skipped" in result:
+            print(f"[{detector}] 跳过: {result['skipped']}")
+            continue
+        for case_name, r in result["cases"].items():
+            print(f"[{detector}] {case_name:<18} p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms  "
+                  f"p99 {r['p99_ms']:8.2f} ms  {r['throughput_fps']:8.1f} fps")
+        if result["detector_rss_mb"] is not None:
+            print(f"[{detector}] 检测器 RSS +{result['detector_rss_mb']:.1f} MB "
+                  f"(peak {result['peak_rss_mb']:.1f} MB，数据集 {result['dataset_rss_mb']:.1f} MB)")
+
+    return report
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="图像质量检测器性能基准")
+    ap.add_argument("-o", "--output", default="quality_benchmark.json", help="JSON 结果输出路径")
+    ap.add_argument("-d", "--detectors", nargs="*", choices=list(DETECTORS), help="只测指定检测器")
+    ap.add_argument("--warmup", type=int, default=3)
+    ap.add_argument("--iters", type=int, default=20)
+    ap.add_argument("--no-synthetic", action="store_true", help="不测试合成帧")
+    args = ap.parse_args()
+
+    report = run_benchmark(args.detectors, args.warmup, args.iters, not args.no_synthetic)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
@@ -0,0 +1,10 @@
+import cv2
+
+# 灰度解码标志：reduce>1 时由 JPEG 解码器直接输出 1/reduce 分辨率的灰度图（DCT 域缩小，比解码后再缩放快）
+# 降采样后各检测器的分数量级会变化，阈值需要按 reduce 重新标定
+GRAY_DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import cv2
+import torch
+
+from Laplacian import variance_of_laplacian_batch
+from Fourier import fourier_blur_detect_batch
+from 过暗过曝检测 import ExposureStats
+from 遮挡检测 import detect_black_occlusion_cc
+
+
+# ============================================================
+# 单次解码的图像质量检测引擎：模糊 / 过暗过曝 / 遮挡
+# ============================================================
+@dataclass
+class QualityResult:
+    path: str
+    valid: bool = False
+    # 模糊检测
+    laplacian_var: float = 0.0
+    laplacian_blurry: bool = False
+    fourier_ratio: float = 0.0
+    fourier_blurry: bool = False
+    # 过暗过曝检测
+    exposure: str = 'invalid'  # 'underexposed' / 'overexposed' / 'normal' / 'invalid'
+    dark_ratio: float = 0.0
+    bright_ratio: float = 0.0
+    overexposed_regions: List[Tuple[int, int, int, int]] = field(default_factory=list)
+    # 遮挡检测
+    occluded: bool = False
+    occlusion_ratio: float = 0.0
+    # 耗时 (ms)
+    decode_ms: float = 0.0
+    analyze_ms: float = 0.0
+
+
+class ImageQualityEngine:
+    def __init__(self,
+                 laplacian_threshold=100.0,
+                 fourier_threshold=0.018,
+                 underexposed_threshold=30,
+                 overexposed_threshold=240,
+                 underexposed_ratio=0.5,
+                 overexposed_ratio=0.3,
+                 window_size=100,
+                 black_thresh=40,
+                 area_ratio_thresh=0.15,
+                 std_thresh=15.0,
+                 occlusion_coarse_scale=None,
+                 device="cpu"):
+        """
+        阈值含义与各单独脚本一致：
+        Laplacian.py / Fourier.py / 过暗过曝检测.py / 遮挡检测.py
+        """
+        self.laplacian_threshold = laplacian_threshold
+        self.fourier_threshold = fourier_threshold
+        self.underexposed_threshold = underexposed_threshold
+        self.overexposed_threshold = overexposed_threshold
+        self.underexposed_ratio = underexposed_ratio
+        self.overexposed_ratio = overexposed_ratio
+        self.window_size = window_size
+        self.black_thresh = black_thresh
+        self.area_ratio_thresh = area_ratio_thresh
+        self.std_thresh = std_thresh
+        self.occlusion_coarse_scale = occlusion_coarse_scale
+        self.device = torch.device(device)
+
+    def analyze(self, image_path):
+        """解码一次（直接解码为灰度），返回 QualityResult"""
+        start = time.perf_counter()
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        decode_ms = (time.perf_counter() - start) * 1000
+
+        if gray is None:
+            print(f"无法读取图像: {image_path}")
+            return QualityResult(path=image_path, decode_ms=decode_ms)
+
+        result = self.analyze_gray(gray, path=image_path)
+        result.decode_ms = decode_ms
+        return result
+
+    def analyze_gray(self, gray, path=""):
+        """在已解码的灰度图上一次性完成全部检测，灰度缓冲、直方图和积分图共享"""
+        start = time.perf_counter()
+        result = QualityResult(path=path, valid=True)
+
+        # ====== 模糊检测：共用同一个 (1,1,H,W) tensor ======
+        gray_tensor = torch.from_numpy(gray).to(self.device)[None, None]
+        result.laplacian_var = variance_of_laplacian_batch(gray_tensor)[0].item()
+        result.laplacian_blurry = result.laplacian_var < self.laplacian_threshold
+
+        _, ratio = fourier_blur_detect_batch(gray_tensor, self.fourier_threshold)
+        result.fourier_ratio = ratio[0].item()
+        result.fourier_blurry = result.fourier_ratio < self.fourier_threshold
+
+        # ====== 过暗过曝检测：一次直方图 + 一次积分图 ======
+        stats = ExposureStats(gray, overexposed_threshold=self.overexposed_threshold)
+        result.dark_ratio = float(stats.dark_ratio(self.underexposed_threshold))
+        result.bright_ratio = float(stats.bright_ratio(self.overexposed_threshold))
+        result.overexposed_regions = stats.local_overexposure(window_size=self.window_size)
+
+        if result.dark_ratio > self.underexposed_ratio:
+            result.exposure = 'underexposed'
+        elif result.bright_ratio > self.overexposed_ratio or result.overexposed_regions:
+            result.exposure = 'overexposed'
+        else:
+            result.exposure = 'normal'
+
+        # ====== 遮挡检测 ======
+        # 直方图先给出黑色像素总占比的上界，不足面积阈值时任何连通域都不可能超过，
+        # 直接跳过连通域分析（此时 occlusion_ratio 记为 0）
+        black_ratio = stats.dark_ratio(self.black_thresh + 1)
+        if black_ratio >= self.area_ratio_thresh:
+            result.occluded, result.occlusion_ratio = detect_black_occlusion_cc(
+                gray,
+                black_thresh=self.black_thresh,
+                area_ratio_thresh=self.area_ratio_thresh,
+                std_thresh=self.std_thresh,
+                coarse_scale=self.occlusion_coarse_scale,
+            )
+
+        result.analyze_ms = (time.perf_counter() - start) * 1000
+        return result
+
+
+# ============================================================
+if __name__ == "__main__":
+    image_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "light-data")
+
+    engine = ImageQualityEngine()
+    for fn in sorted(os.listdir(image_dir)):
+        if not fn.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
+            continue
+        r = engine.analyze(os.path.join(image_dir, fn))
+        print(f"{fn}: 模糊(Laplacian)={r.laplacian_blurry} Score={r.laplacian_var:.2f}  "
+              f"模糊(Fourier)={r.fourier_blurry} Ratio={r.fourier_ratio:.4f}  "
+              f"曝光={r.exposure}  遮挡={r.occluded} ({r.occlusion_ratio:.2%})  "
+              f"解码 {r.decode_ms:.1f} ms / 检测 {r.analyze_ms:.1f} ms")
@@ -0,0 +1,173 @@
+import ctypes
+import glob
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# ============================================================
+# C++ 图像质量检测的 Python 绑定（ctypes，见 C++/quality_capi.cpp）
+# 直接传入 NumPy 灰度数组的内存地址，不拷贝；ctypes 调用 CDLL 时会释放 GIL，
+# 因此可以在线程池中并行调用
+# ============================================================
+CPP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "C++")
+LIB_NAME = "quality.dll" if sys.platform == "win32" else "libquality.so"
+LIB_PATH = os.path.join(CPP_DIR, LIB_NAME)
+
+_u8_p = ctypes.POINTER(ctypes.c_uint8)
+_double_p = ctypes.POINTER(ctypes.c_double)
+_int_p = ctypes.POINTER(ctypes.c_int)
+_lib = None
+
+
+def build_library():
+    """用 g++ 编译共享库"""
+    cmd = ["g++", "-O3", "-std=c++17", "-shared", "quality_capi.cpp", "-o", LIB_NAME]
+    if sys.platform != "win32":
+        cmd.insert(4, "-fPIC")
+    subprocess.run(cmd, cwd=CPP_DIR, check=True)
+
+
+def load_library():
+    global _lib
+    if _lib is not None:
+        return _lib
+
+    if not os.path.exists(LIB_PATH):
+        raise OSError(f"未找到 {LIB_PATH}，请先执行 build_library() 或按 quality_capi.cpp 顶部说明编译")
+
+    lib = ctypes.CDLL(LIB_PATH)
+
+    lib.qc_variance_of_laplacian.restype = ctypes.c_double
+    lib.qc_variance_of_laplacian.argtypes = [_u8_p, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+
+    lib.qc_check_brightness.restype = ctypes.c_int
+    lib.qc_check_brightness.argtypes = [_u8_p, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                        ctypes.c_int, ctypes.c_int, ctypes.c_double, ctypes.c_double,
+                                        ctypes.c_int, ctypes.c_int,
+                                        _double_p, _double_p, _int_p]
+
+    lib.qc_detect_black_occlusion.restype = ctypes.c_int
+    lib.qc_detect_black_occlusion.argtypes = [_u8_p, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                              ctypes.c_int, ctypes.c_double, ctypes.c_double,
+                                              _double_p, _double_p]
+
+    _lib = lib
+    return _lib
+
+
+def _as_gray_buffer(gray):
+    """
+    检查灰度图并返回 (指针, H, W, 行步长)
+    uint8 且行内连续的数组（包括行切片视图）不会发生拷贝
+    """
+    if gray.ndim != 2:
+        raise ValueError("需要 (H, W) 灰度图")
+    if gray.dtype != np.uint8 or gray.strides[1] != 1:
+        gray = np.ascontiguousarray(gray, dtype=np.uint8)
+    h, w = gray.shape
+    return gray, gray.ctypes.data_as(_u8_p), h, w, gray.strides[0]
+
+
+def variance_of_laplacian(gray):
+    """Laplacian 方差，与 Laplacian.variance_of_laplacian 一致"""
+    lib = load_library()
+    gray, ptr, h, w, stride = _as_gray_buffer(gray)
+    return lib.qc_variance_of_laplacian(ptr, h, w, stride)
+
+
+def check_image_brightness(gray, underexposed_threshold=30, overexposed_threshold=240, underexposed_ratio=0.5,
+                           overexposed_ratio=0.3, window_size=100, min_area=100):
+    """
+    过暗过曝检测，判定逻辑同 过暗过曝检测.analyze_image_brightness
+    :return: (verdict, dark_ratio, bright_ratio, 过曝窗口数)
+    """
+    lib = load_library()
+    gray, ptr, h, w, stride = _as_gray_buffer(gray)
+    dark_ratio = ctypes.c_double()
+    bright_ratio = ctypes.c_double()
+    num_regions = ctypes.c_int()
+    code = lib.qc_check_brightness(ptr, h, w, stride,
+                                   int(underexposed_threshold), int(overexposed_threshold),
+                                   underexposed_ratio, overexposed_ratio,
+                                   window_size, min_area,
+                                   ctypes.byref(dark_ratio), ctypes.byref(bright_ratio), ctypes.byref(num_regions))
+    verdict = ('normal', 'underexposed', 'overexposed')[code]
+    return verdict, dark_ratio.value, bright_ratio.value, num_regions.value
+
+
+def detect_black_occlusion(gray, black_thresh=40, area_ratio_thresh=0.15, std_thresh=15.0):
+    """
+    黑色遮挡检测，判定逻辑同 遮挡检测.detect_black_occlusion_cc
+    返回: (is_occluded, occlusion_ratio) 元组
+    """
+    lib = load_library()
+    gray, ptr, h, w, stride = _as_gray_buffer(gray)
+    area_ratio = ctypes.c_double()
+    block_std = ctypes.c_double()
+    is_occ = lib.qc_detect_black_occlusion(ptr, h, w, stride, black_thresh, area_ratio_thresh, std_thresh,
+                                           ctypes.byref(area_ratio), ctypes.byref(block_std))
+    return bool(is_occ), area_ratio.value
+
+
+# ============================================================
+# 与 Python 版本的一致性检查（light-data）
+# ============================================================
+def parity_check(image_dir, num_threads=4):
+    import cv2
+    import torch
+    import importlib
+    from Laplacian import variance_of_laplacian as py_laplacian
+    exposure = importlib.import_module("过暗过曝检测")
+    occlusion = importlib.import_module("遮挡检测")
+
+    image_paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))
+    grays = [cv2.imread(p, cv2.IMREAD_GRAYSCALE) for p in image_paths]
+
+    # 原生实现在线程池中并行执行
+    with ThreadPoolExecutor(max_workers=num_threads) as pool:
+        native_lap = list(pool.map(variance_of_laplacian, grays))
+        native_exp = list(pool.map(check_image_brightness, grays))
+        native_occ = list(pool.map(detect_black_occlusion, grays))
+
+    all_ok = True
+    for path, gray, lap, exp, occ in zip(image_paths, grays, native_lap, native_exp, native_occ):
+        ref_lap = py_laplacian(torch.from_numpy(gray).unsqueeze(0))
+
+        stats = exposure.ExposureStats(gray, overexposed_threshold=240)
+        ref_dark, ref_bright = stats.dark_ratio(30), stats.bright_ratio(240)
+        ref_regions = stats.local_overexposure(window_size=100)
+        if ref_dark > 0.5:
+            ref_verdict = 'underexposed'
+        elif ref_bright > 0.3 or ref_regions:
+            ref_verdict = 'overexposed'
+        else:
+            ref_verdict = 'normal'
+
+        ref_occ = occlusion.detect_black_occlusion_cc(gray)
+
+        ok = (abs(lap - ref_lap) <= 1e-3 * max(1.0, abs(ref_lap))
+              and exp[0] == ref_verdict
+              and abs(exp[1] - ref_dark) < 1e-9 and abs(exp[2] - ref_bright) < 1e-9
+              and exp[3] == len(ref_regions)
+              and occ[0] == ref_occ[0] and abs(occ[1] - ref_occ[1]) < 1e-6)
+        all_ok = all_ok and ok
+
+        print(f"{os.path.basename(path)}: {'OK' if ok else 'MISMATCH'}  "
+              f"Laplacian {lap:.2f}/{ref_lap:.2f}  曝光 {exp[0]}/{ref_verdict}  "
+              f"遮挡 {occ[0]}({occ[1]:.4f})/{ref_occ[0]}({ref_occ[1]:.4f})")
+
+    return all_ok
+
+
+if __name__ == "__main__":
+    if not os.path.exists(LIB_PATH):
+        build_library()
+
+    image_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "light-data")
+    ok = parity_check(image_dir)
+    print("一致性检查通过" if ok else "一致性检查未通过")
+    sys.exit(0 if ok else 1)
@@ -1,6 +1,8 @@
 import cv2
 import os
+import json
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 
 # 过暗检测
@@ -41,6 +43,65 @@ def is_overexposed(image, threshold=240, overexposed_ratio=0.3):
     return False
 
 
+# 单帧亮度统计引擎：一次直方图 + 一次积分图，所有比例都由 O(1) 查表得到
+class ExposureStats:
+    def __init__(self, image, overexposed_threshold=240):
+        """
+        :param image: 输入的灰度图像 (uint8)
+        :param overexposed_threshold: 积分图使用的过曝亮度阈值
+        """
+        self.height, self.width = image.shape
+        self.total_pixels = image.size
+        self.overexposed_threshold = overexposed_threshold
+
+        # 256-bin 直方图及其累积和，cum_hist[v] = 亮度 <= v 的像素数
+        hist = np.bincount(image.ravel(), minlength=256)
+        self.cum_hist = np.cumsum(hist)
+
+        # 过曝掩码的积分图，shape = (H+1, W+1)
+        mask = (image > overexposed_threshold).astype(np.uint8)
+        self.integral = cv2.integral(mask, sdepth=cv2.CV_32S)
+
+    def dark_ratio(self, threshold):
+        """亮度 < threshold 的像素比例"""
+        if threshold <= 0:
+            return 0.0
+        threshold = min(int(np.ceil(threshold)), 256)
+        return self.cum_hist[threshold - 1] / self.total_pixels
+
+    def bright_ratio(self, threshold):
+        """亮度 > threshold 的像素比例"""
+        if threshold < 0:
+            return 1.0
+        threshold = min(int(np.floor(threshold)), 255)
+        return (self.total_pixels - self.cum_hist[threshold]) / self.total_pixels
+
+    def window_ratios(self, window_size):
+        """
+        按滑动窗口网格（与 detect_local_overexposure 的遍历方式一致）计算每个窗口的过曝比例
+        :return: (xs, ys, ratios)，ratios shape = (len(ys), len(xs))
+        """
+        ys = np.arange(0, self.height - window_size, window_size)
+        xs = np.arange(0, self.width - window_size, window_size)
+        if len(ys) == 0 or len(xs) == 0:
+            return xs, ys, np.zeros((len(ys), len(xs)))
+
+        ii = self.integral
+        y0, y1 = ys[:, None], ys[:, None] + window_size
+        x0, x1 = xs[None, :], xs[None, :] + window_size
+        counts = ii[y1, x1] - ii[y0, x1] - ii[y1, x0] + ii[y0, x0]
+        return xs, ys, counts / (window_size * window_size)
+
+    def local_overexposure(self, min_area=100, window_size=100, region_ratio=0.5):
+        """返回过曝窗口列表 [(x, y, w, h), ...]"""
+        if window_size * window_size <= min_area:
+            return []
+
+        xs, ys, ratios = self.window_ratios(window_size)
+        yi, xi = np.nonzero(ratios > region_ratio)
+        return [(int(xs[j]), int(ys[i]), window_size, window_size) for i, j in zip(yi, xi)]
+
+
 # 计算图像的亮度直方图并检测局部过曝区域
 def detect_local_overexposure(image, threshold=240, min_area=100, window_size=100):
     """
@@ -51,27 +112,9 @@ def detect_local_overexposure(image, threshold=240, min_area=100, window_size=10
     :param window_size: 滑动窗口的大小（每次分析图像的一小块区域）
     :return: 返回过曝的区域（如果有的话）
     """
-    overexposed_regions = []
-    height, width = image.shape
-
-    # 使用滑动窗口检测局部区域
-    for y in range(0, height - window_size, window_size):
-        for x in range(0, width - window_size, window_size):
-            # 截取当前窗口区域
-            window = image[y:y + window_size, x:x + window_size]
-
-            # 统计窗口中高于阈值的像素
-            overexposed_pixels = np.sum(window > threshold)
-            total_pixels = window.size
-            overexposed_percentage = overexposed_pixels / total_pixels
-
-            # 如果该窗口的过曝像素比例超过阈值，认为该区域过曝
-            if overexposed_percentage > 0.5:  # 可以调整比例
-                # 如果该区域的面积超过最小面积阈值，认为是过曝区域
-                if window.size > min_area:
-                    overexposed_regions.append((x, y, window_size, window_size))
-
-    return overexposed_regions
+    # 窗口过曝比例由积分图一次性向量化求得
+    stats = ExposureStats(image, overexposed_threshold=threshold)
+    return stats.local_overexposure(min_area=min_area, window_size=window_size)
 
 
 # 处理单张图像，分开判断过暗和过曝
@@ -87,28 +130,51 @@ def check_image_brightness(image_path, underexposed_threshold=30, overexposed_th
     :param window_size: 滑动窗口大小
     :return: 'underexposed', 'overexposed', 'normal'，分别表示过暗，过曝，和正常图片
     """
+    result = analyze_image_brightness(image_path, underexposed_threshold, overexposed_threshold,
+                                      underexposed_ratio, overexposed_ratio, window_size)
+    return result['verdict']
+
+
+# 处理单张图像，返回结构化结果
+def analyze_image_brightness(image_path, underexposed_threshold=30, overexposed_threshold=240, underexposed_ratio=0.3,
+                             overexposed_ratio=0.3, window_size=100):
+    """
+    检查图像是否过暗或过曝，并返回完整的统计信息
+    参数含义同 check_image_brightness
+    :return: dict，包含 path, verdict, dark_ratio, bright_ratio, overexposed_regions
+    """
+    result = {
+        'path': image_path,
+        'verdict': 'invalid',
+        'dark_ratio': None,
+        'bright_ratio': None,
+        'overexposed_regions': [],
+    }
+
     image = cv2.imread(image_path)
     if image is None:
         print(f"无法读取图像: {image_path}")
-        return 'invalid'
+        return result
 
     gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)  # 转为灰度图
 
-    # 判断图像是否过暗
-    if is_underexposed(gray_image, threshold=underexposed_threshold, underexposed_ratio=underexposed_ratio):
-        return 'underexposed'
+    # 每帧只构建一次直方图和积分图
+    stats = ExposureStats(gray_image, overexposed_threshold=overexposed_threshold)
 
-    # 先进行全图过曝检测
-    if is_overexposed(gray_image, threshold=overexposed_threshold, overexposed_ratio=overexposed_ratio):
-        return 'overexposed'
+    result['dark_ratio'] = float(stats.dark_ratio(underexposed_threshold))
+    result['bright_ratio'] = float(stats.bright_ratio(overexposed_threshold))
+    result['overexposed_regions'] = stats.local_overexposure(window_size=window_size)
 
-    # 然后进行局部区域过曝检测
-    overexposed_regions = detect_local_overexposure(gray_image, overexposed_threshold, window_size=window_size)
-
-    if overexposed_regions:
-        return 'overexposed'
+    # 判断图像是否过暗
+    if result['dark_ratio'] > underexposed_ratio:
+        result['verdict'] = 'underexposed'
+    # 先进行全图过曝检测，然后进行局部区域过曝检测
+    elif result['bright_ratio'] > overexposed_ratio or result['overexposed_regions']:
+        result['verdict'] = 'overexposed'
+    else:
+        result['verdict'] = 'normal'
 
-    return 'normal'
+    return result
 
 
 # 处理单个文件夹中的图片并按要求格式输出
@@ -235,6 +301,96 @@ def process_pic1_folders(base_dir, underexposed_threshold=30, overexposed_thresh
         )
 
 
+# ============================================================
+# 并行批处理：进程池 + 分块 + 有序合并 + 断点续跑
+# ============================================================
+def list_pic1_images(base_dir):
+    """
+    按 process_pic1_folders 的规则收集图片：优先遍历子目录，没有子目录时直接处理基础目录
+    :return: 排序后的图片路径列表
+    """
+    folders = [os.path.join(base_dir, name) for name in sorted(os.listdir(base_dir))
+               if os.path.isdir(os.path.join(base_dir, name))]
+    if not folders:
+        folders = [base_dir]
+
+    image_paths = []
+    for folder in folders:
+        for filename in sorted(os.listdir(folder)):
+            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+                image_paths.append(os.path.join(folder, filename))
+    return image_paths
+
+
+def _analyze_chunk(args):
+    """进程池任务：处理一块图片路径"""
+    chunk, params = args
+    return [analyze_image_brightness(path, **params) for path in chunk]
+
+
+def _load_checkpoint(checkpoint_path):
+    """读取断点文件（JSON Lines），返回 {path: result}"""
+    done = {}
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 中断时可能写了半行，忽略
+                    continue
+                record['overexposed_regions'] = [tuple(r) for r in record['overexposed_regions']]
+                done[record['path']] = record
+    return done
+
+
+def process_pic1_folders_parallel(base_dir, underexposed_threshold=30, overexposed_threshold=240,
+                                  underexposed_ratio=0.5, overexposed_ratio=0.3, window_size=100,
+                                  num_workers=4, chunk_size=64, checkpoint_path=None):
+    """
+    并行版本的 process_pic1_folders，不打印逐张结果，而是返回结构化结果
+    :param base_dir: pic1.py生成的基准目录路径
+    :param num_workers: 进程数
+    :param chunk_size: 每个任务处理的图片数
+    :param checkpoint_path: 断点文件路径（JSON Lines），中断后重跑会跳过已完成的图片
+    其余参数同 process_pic1_folders
+    :return: 按文件顺序排列的结果列表，每项为 analyze_image_brightness 的返回值
+    """
+    params = {
+        'underexposed_threshold': underexposed_threshold,
+        'overexposed_threshold': overexposed_threshold,
+        'underexposed_ratio': underexposed_ratio,
+        'overexposed_ratio': overexposed_ratio,
+        'window_size': window_size,
+    }
+
+    image_paths = list_pic1_images(base_dir)
+    done = _load_checkpoint(checkpoint_path)
+    pending = [path for path in image_paths if path not in done]
+    print(f"共 {len(image_paths)} 张图片，已完成 {len(image_paths) - len(pending)} 张，待处理 {len(pending)} 张")
+
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    checkpoint_file = open(checkpoint_path, 'a', encoding='utf-8') if checkpoint_path else None
+    try:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            # executor.map 按提交顺序返回结果
+            for results in executor.map(_analyze_chunk, [(chunk, params) for chunk in chunks]):
+                for result in results:
+                    done[result['path']] = result
+                    if checkpoint_file:
+                        checkpoint_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+                if checkpoint_file:
+                    checkpoint_file.flush()
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    return [done[path] for path in image_paths]
+
+
 # 主程序入口
 if __name__ == "__main__":
     # 设置pic1.py生成的基准目录路径
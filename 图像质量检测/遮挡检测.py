@@ -1,6 +1,11 @@
 import cv2
 import numpy as np
 import os
+import csv
+import shutil
+from multiprocessing import Pool
+
+from decode_flags import GRAY_DECODE_FLAGS
 
 
 def detect_black_occlusion(
@@ -71,6 +76,90 @@ def detect_black_occlusion(
     return True, area_ratio
 
 
+def _largest_black_component(gray, black_thresh):
+    """
+    连通域分析，返回最大黑色连通域的 (面积, 均值, 标准差, 外接矩形 (x, y, w, h))，不存在时返回 None
+    与 RETR_EXTERNAL 轮廓填充一致，连通域内部的空洞计入面积和纹理统计
+    标签图与输入同尺寸，其余掩码运算只在该连通域的外接矩形内进行
+    """
+    _, mask = cv2.threshold(gray, black_thresh, 255, cv2.THRESH_BINARY_INV)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8, ltype=cv2.CV_32S)
+    if n <= 1:
+        return None
+
+    # 0 号是背景，直接在 stats 数组上取最大面积
+    k = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    x, y, bw, bh = stats[k, :4]
+
+    # 外接矩形外扩一圈后从角点漫水填充外部背景，剩下的就是连通域 + 内部空洞
+    region = np.zeros((bh + 2, bw + 2), np.uint8)
+    region[1:-1, 1:-1][labels[y:y + bh, x:x + bw] == k] = 255
+    cv2.floodFill(region, None, (0, 0), 128)
+    filled = (region != 128).view(np.uint8)[1:-1, 1:-1]
+
+    area = cv2.countNonZero(filled)
+    mean, std = cv2.meanStdDev(gray[y:y + bh, x:x + bw], mask=filled)
+    return area, float(mean[0, 0]), float(std[0, 0]), (int(x), int(y), int(bw), int(bh))
+
+
+def detect_black_occlusion_cc(
+        img,
+        black_thresh=40,
+        area_ratio_thresh=0.15,
+        std_thresh=15.0,
+        coarse_scale=None,
+        coarse_margin=0.8
+):
+    """
+    基于 connectedComponentsWithStats 的黑色遮挡检测（相当于 select_mode="largest"）
+    与轮廓版本的差别：按连通域像素数选最大块，面积按填充后的像素数计
+    :param img: BGR 图像或灰度图像
+    :param coarse_scale: 粗检缩放系数（如 0.25 表示宽高各缩到 1/4），不为 None 时先在缩放后的图上粗检，
+                         粗检命中后只在该连通域外接矩形映射回原分辨率的范围内确认，不分配整帧标签图；
+                         若原图上的连通域经由粗检图上看不到的细缝连到范围外，面积按范围内部分计
+    :param coarse_margin: 粗检时面积阈值的放宽系数，避免缩放误差导致漏检
+    返回: (is_occluded, occlusion_ratio) 元组
+    """
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    # 粗检：缩小后的图上判断，未命中直接返回
+    region = gray
+    if coarse_scale is not None:
+        small = cv2.resize(gray, None, fx=coarse_scale, fy=coarse_scale, interpolation=cv2.INTER_AREA)
+        component = _largest_black_component(small, black_thresh)
+        if component is None:
+            return False, 0.0
+        area, _, block_std, (x, y, bw, bh) = component
+        area_ratio = area / small.size
+        if area_ratio < area_ratio_thresh * coarse_margin or block_std > std_thresh:
+            return False, area_ratio
+
+        # 外接矩形映射回原分辨率，外扩一个粗检像素抵消缩放取整
+        h, w = gray.shape
+        sx, sy = w / small.shape[1], h / small.shape[0]
+        x1, y1 = max(int((x - 1) * sx), 0), max(int((y - 1) * sy), 0)
+        x2, y2 = min(int(np.ceil((x + bw + 1) * sx)), w), min(int(np.ceil((y + bh + 1) * sy)), h)
+        region = gray[y1:y2, x1:x2]
+
+    # 原分辨率确认
+    component = _largest_black_component(region, black_thresh)
+    if component is None:
+        return False, 0.0
+
+    area, _, block_std, _ = component
+    area_ratio = area / gray.size
+
+    # 面积过滤
+    if area_ratio < area_ratio_thresh:
+        return False, area_ratio
+
+    # 遮挡区域纹理检测
+    if block_std > std_thresh:
+        return False, area_ratio
+
+    return True, area_ratio
+
+
 # ============================================================
 # 按 is_occluded() 输出格式修改 remove_occluded_images
 # ============================================================
@@ -117,8 +206,106 @@ def remove_occluded_images(input_dir, output_dir):
     print(f"  - 保留图片数: {total_images - occluded_non_G - occluded_G}")
 
 
+# ============================================================
+# 流式遮挡过滤：降分辨率解码只用于检测，保留原始文件字节，不重新编码
+# ============================================================
+MANIFEST_FIELDS = ["filename", "is_G", "occluded", "occlusion_ratio", "block_std"]
+
+
+def _scan_occlusion(args):
+    """进程池任务：降分辨率灰度解码 + 连通域遮挡检测"""
+    path, reduce, black_thresh, area_ratio_thresh, std_thresh = args
+    gray = cv2.imread(path, GRAY_DECODE_FLAGS[reduce])
+    if gray is None:
+        return None
+
+    component = _largest_black_component(gray, black_thresh)
+    if component is None:
+        return False, 0.0, 0.0
+
+    area, _, block_std, _ = component
+    area_ratio = area / gray.size
+    is_occ = area_ratio >= area_ratio_thresh and block_std <= std_thresh
+    return is_occ, area_ratio, block_std
+
+
+def _keep_file(src, dst):
+    """
+    优先硬链接保留原文件，跨设备等情况退化为内核态拷贝（copy_file_range/sendfile）
+    先写到临时名再 os.replace 覆盖 dst，dst 原有内容在新文件就绪前不会被删除
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+
+
+def filter_occluded_images(input_dir, output_dir, manifest_path=None, reduce=2, num_workers=4,
+                           black_thresh=40, area_ratio_thresh=0.15, std_thresh=15.0):
+    """
+    remove_occluded_images 的流式版本
+    :param input_dir: 输入目录
+    :param output_dir: 保留图片的输出目录（硬链接或拷贝原文件，不重新编码）
+    :param manifest_path: 遮挡清单 CSV 路径，默认写到 output_dir/occlusion_manifest.csv
+    :param reduce: 检测用的解码降采样倍数 1/2/4/8
+    :param num_workers: 解码/检测进程数
+    """
+    if os.path.exists(output_dir) and os.path.samefile(input_dir, output_dir):
+        raise ValueError(f"输出目录不能与输入目录相同: {output_dir}")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    if manifest_path is None:
+        manifest_path = os.path.join(output_dir, "occlusion_manifest.csv")
+
+    filenames = sorted(fn for fn in os.listdir(input_dir)
+                       if os.path.isfile(os.path.join(input_dir, fn)))
+    tasks = [(os.path.join(input_dir, fn), reduce, black_thresh, area_ratio_thresh, std_thresh)
+             for fn in filenames]
+
+    total_images = 0
+    kept_images = 0
+
+    with open(manifest_path, "w", newline="", encoding="utf-8") as f, Pool(num_workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+
+        # imap 保持输入顺序，同时以流水方式消费结果
+        for fn, result in zip(filenames, pool.imap(_scan_occlusion, tasks, chunksize=16)):
+            if result is None:
+                continue
+
+            total_images += 1
+            is_occ, occlusion_ratio, block_std = result
+            is_G_image = os.path.splitext(fn)[0].endswith('_G')
+
+            writer.writerow({
+                "filename": fn,
+                "is_G": int(is_G_image),
+                "occluded": int(is_occ),
+                "occlusion_ratio": f"{occlusion_ratio:.6f}",
+                "block_std": f"{block_std:.4f}",
+            })
+
+            if not is_occ:
+                kept_images += 1
+                _keep_file(os.path.join(input_dir, fn), os.path.join(output_dir, fn))
+
+    print(f"\n处理完成:")
+    print(f"  - 输入图片总数: {total_images}")
+    print(f"  - 保留图片数: {kept_images}")
+    print(f"  - 遮挡清单: {manifest_path}")
+
+
 # ============================================================
 if __name__ == "__main__":
     input_dir = "E:/archive/G2"
     output_dir = "E:/archive/R1"
-    remove_occluded_images(input_dir, output_dir)
+    filter_occluded_images(input_dir, output_dir)
@@ -0,0 +1,262 @@
+import collections
+
+import numpy as np
+
+from tracker import greedy_match, iou_matrix
+
+
+def drift_metrics(reference, predicted, iou_thresh=0.5):
+    """
+    外推框相对真实检测的偏差
+    :param reference: (n, 4) 真实检测（全帧率检测 / 本帧检测）
+    :param predicted: (m, 4) 外推出的框
+    :return: (召回率, 匹配上的平均 IoU)；reference 为空时返回 (None, None)
+    """
+    if len(reference) == 0:
+        return None, None
+    iou = iou_matrix(reference, predicted)
+    r, c = greedy_match(iou, iou_thresh)
+    recall = len(r) / len(reference)
+    mean_iou = float(iou[r, c].mean()) if len(r) else 0.0
+    return recall, mean_iou
+
+
+class SamplerCounters:
+    __slots__ = ("frames", "detections", "propagated", "k_sum", "audits", "drift_recall", "drift_iou", "replayed")
+
+    def __init__(self):
+        self.frames = 0          # 经过采样判断的帧
+        self.detections = 0      # 其中送检的帧
+        self.propagated = 0      # 用轨迹外推出结果的帧
+        self.k_sum = 0           # 每次送检时的 K 之和，求平均 K
+        self.audits = 0          # 做过偏差核对的送检帧（前面至少外推过一帧）
+        self.drift_recall = None  # 外推框对本帧检测的召回率（指数平均）
+        self.drift_iou = None     # 外推框与本帧检测匹配上的平均 IoU（指数平均）
+        self.replayed = 0        # 检测结果晚到时重新外推的帧数之和，除以 detections 即平均结果延迟（帧）
+
+    def as_dict(self):
+        return {
+            "frames": self.frames,
+            "detections": self.detections,
+            "propagated": self.propagated,
+            "effective_rate": round(self.detections / self.frames, 3) if self.frames else 0.0,
+            "avg_k": round(self.k_sum / self.detections, 2) if self.detections else 0.0,
+            "audits": self.audits,
+            "drift_recall": None if self.drift_recall is None else round(self.drift_recall, 3),
+            "drift_iou": None if self.drift_iou is None else round(self.drift_iou, 3),
+            "avg_result_delay": round(self.replayed / self.detections, 2) if self.detections else 0.0,
+        }
+
+
+class AdaptiveSampler:
+    """
+    自适应抽帧检测：每路每 K 帧检测一次，中间帧由跟踪器按匀速模型外推出框。
+    每次检测后按下面几项重新定 K：
+    - 场景活跃度：轨迹的最大速度（相对框高）越大，K 越小，使 K 帧内外推误差不超过 max_drift 个框高；
+    - 轨迹数：目标越多越容易出错，K 按 1 / (1 + 轨迹数 / track_scale) 缩小；
+    - 新目标出现：K 直接回到 k_min；
+    - 推理队列压力：积压超过 pressure_high 时 K 翻倍（不超过 k_max），用精度换路数。
+    K 变小立即生效，变大每次最多 +1。
+    每个送检帧先用外推框和本帧检测比一次，得到外推带来的召回率 / IoU 偏差。
+
+    检测是异步的：送检帧 t 的结果回来之前，解码线程已经在外推 t+1、t+2……。
+    因此送检时（begin_detection）记下帧号和跟踪器快照，结果回来时先回退到 t 的快照，
+    在 t 上核对偏差、更新跟踪器，再把 t 之后已经走过的帧重新外推一遍，跟踪器回到当前帧；
+    其间仍在途的送检帧的快照也在重放时按新状态重取。
+    """
+
+    def __init__(self, tracking, num_streams, k_min=1, k_max=8, max_drift=0.25, track_scale=20,
+                 pressure_high=0.5, ema=0.1):
+        """
+        :param tracking: tracker.TrackingStage，外推和检测后的更新都经过它
+        :param max_drift: 允许的外推位移（框高的倍数）
+        :param ema: 偏差指标的指数平均系数
+        """
+        self.tracking = tracking
+        self.k_min = k_min
+        self.k_max = k_max
+        self.max_drift = max_drift
+        self.track_scale = track_scale
+        self.pressure_high = pressure_high
+        self.ema = ema
+
+        self.k = [k_min] * num_streams
+        self.since = [k_min] * num_streams       # 距上次送检的帧数，初始即送检
+        self.pressure = [0.0] * num_streams
+        self.counters = [SamplerCounters() for _ in range(num_streams)]
+        self.head = [0] * num_streams            # 跟踪器当前推进到的帧号
+        # 在途的送检帧 [帧号, 帧, 送检前的跟踪器快照]，按送检顺序；结果按同一顺序回来，丢掉的帧在后面的结果回来时清掉
+        self.pending = [collections.deque() for _ in range(num_streams)]
+
+    def should_detect(self, stream_index, queue_ratio=0.0):
+        """
+        解码线程每帧调用一次
+        :param queue_ratio: 推理队列占用比例
+        :return: True 送检（提交给推理前调用 begin_detection()）；False 调用 propagate() 取外推结果
+        """
+        c = self.counters[stream_index]
+        c.frames += 1
+        self.pressure[stream_index] = queue_ratio
+        if self.since[stream_index] >= self.k[stream_index]:
+            self.since[stream_index] = 1
+            c.detections += 1
+            c.k_sum += self.k[stream_index]
+            return True
+        self.since[stream_index] += 1
+        return False
+
+    def propagate(self, stream_index):
+        """中间帧（以及送检判断为 True 但没有送检的帧）：轨迹外推一帧，返回 backends.Detections"""
+        self.counters[stream_index].propagated += 1
+        with self.tracking.locks[stream_index]:
+            self.head[stream_index] += 1
+            return self.tracking.predict(stream_index).as_detections()
+
+    def begin_detection(self, stream_index, frame):
+        """
+        送检帧提交给推理之前调用：记下帧号和跟踪器快照，跟踪器先按预测推进到这一帧，后面的帧照常外推
+        :param frame: 送检的帧对象，结果回来时按对象本身（is）认出是哪一帧
+        """
+        tracking = self.tracking
+        with tracking.locks[stream_index]:
+            tracker = tracking.tracker(stream_index)
+            self.head[stream_index] += 1
+            self.pending[stream_index].append([self.head[stream_index], frame, tracker.snapshot()])
+            tracker.predict()
+
+    def on_detection(self, stream_index, det, frame_shape, ts, frame=None):
+        """
+        送检帧的结果：回退到送检那一帧，核对外推偏差，更新跟踪器，重放之后的外推，重新定 K
+        :param frame: begin_detection() 时传入的帧；找不到对应的在途记录时直接在当前帧上更新
+        :return: tracker.Tracks（送检那一帧的轨迹）
+        """
+        tracking = self.tracking
+        with tracking.locks[stream_index]:
+            tracker = tracking.tracker(stream_index)
+            entry = self._pop_pending(stream_index, frame)
+            if entry is None:
+                frame_index = self.head[stream_index] = self.head[stream_index] + 1
+            else:
+                frame_index, _, state = entry
+                tracker.restore(state)
+
+            gap = int(tracker.misses[:tracker.n].min()) + 1 if tracker.n else 1
+            if gap > 1:
+                ref = det.xyxy[det.conf >= tracker.high_thresh]
+                self._audit(stream_index, ref, tracker.peek())
+            next_id = tracker.next_id
+            tracks = tracking.update(stream_index, det, frame_shape, ts)
+            self._retarget(stream_index, tracker, tracker.next_id > next_id)
+            self._replay(stream_index, tracker, frame_index)
+        return tracks
+
+    def _pop_pending(self, stream_index, frame):
+        pending = self.pending[stream_index]
+        for i, entry in enumerate(pending):
+            if entry[1] is frame:
+                # 排在前面的送检帧（被背压丢掉 / 提交失败）不会再有结果了
+                for _ in range(i + 1):
+                    pending.popleft()
+                return entry
+        return None
+
+    def _replay(self, stream_index, tracker, frame_index):
+        """跟踪器刚在 frame_index 上更新过：重新外推到当前帧，途中重取仍在途送检帧的快照"""
+        replayed = self.head[stream_index] - frame_index
+        for entry in self.pending[stream_index]:
+            for _ in range(entry[0] - 1 - frame_index):
+                tracker.predict()
+            entry[2] = tracker.snapshot()
+            tracker.predict()
+            frame_index = entry[0]
+        for _ in range(self.head[stream_index] - frame_index):
+            tracker.predict()
+        self.counters[stream_index].replayed += replayed
+
+    def _audit(self, stream_index, reference, predicted):
+        recall, mean_iou = drift_metrics(reference, predicted)
+        if recall is None:
+            return
+        c = self.counters[stream_index]
+        c.audits += 1
+        a = self.ema
+        c.drift_recall = recall if c.drift_recall is None else (1 - a) * c.drift_recall + a * recall
+        c.drift_iou = mean_iou if c.drift_iou is None else (1 - a) * c.drift_iou + a * mean_iou
+
+    def _retarget(self, stream_index, tracker, new_tracks):
+        confirmed = np.nonzero(tracker.confirmed())[0]
+        if new_tracks:
+            target = self.k_min
+        elif len(confirmed) == 0:
+            target = self.k_max
+        else:
+            xyxy, vel = tracker.xyxy[confirmed], tracker.vel[confirmed]
+            height = np.maximum(xyxy[:, 3] - xyxy[:, 1], 1.0)
+            speed = np.hypot(vel[:, 0] + vel[:, 2], vel[:, 1] + vel[:, 3]) * 0.5 / height
+            target = self.max_drift / max(float(speed.max()), 1e-3)
+            target /= 1.0 + len(confirmed) / self.track_scale
+        if self.pressure[stream_index] > self.pressure_high:
+            target *= 2
+        target = int(min(max(target, self.k_min), self.k_max))
+
+        k = self.k[stream_index]
+        self.k[stream_index] = target if target < k else min(k + 1, target)
+
+    def stats(self):
+        return [dict(c.as_dict(), k=self.k[i]) for i, c in enumerate(self.counters)]
+
+
+if __name__ == "__main__":
+    # 自检：空场景 K 升到上限；目标快速移动 / 新目标出现时 K 降下来；外推偏差可测
+    from backends import Detections
+    from tracker import TrackingStage
+
+    tracking = TrackingStage(1)
+    sampler = AdaptiveSampler(tracking, 1, k_min=1, k_max=8)
+    empty = Detections.empty()
+    for f in range(40):
+        if sampler.should_detect(0):
+            sampler.on_detection(0, empty, (720, 1280, 3), f)
+        else:
+            sampler.propagate(0)
+    assert sampler.k[0] == 8, sampler.k
+
+    ks = []
+    for f in range(40, 200):
+        x = 100 + (f - 40) * 3.0          # 每帧 3 像素，框高 80
+        det = Detections(np.float32([[x, 100, x + 40, 180]]), np.float32([0.9]), np.int32([0]))
+        if sampler.should_detect(0):
+            sampler.on_detection(0, det, (720, 1280, 3), f)
+        else:
+            sampler.propagate(0)
+        ks.append(sampler.k[0])
+    assert min(ks) == 1 and 3 <= ks[-1] <= 8, ks
+    stats = sampler.stats()[0]
+    assert stats["drift_recall"] > 0.9 and stats["drift_iou"] > 0.8, stats
+
+
+    # 结果晚到 delay 帧（推理排队）：回退 + 重放后，外推框仍对齐真实位置
+    for delay in (2, 3):
+        tracking = TrackingStage(1)
+        sampler = AdaptiveSampler(tracking, 1, k_min=1, k_max=4)
+        in_flight, errors = collections.deque(), []
+        for f in range(200):
+            while in_flight and in_flight[0][0] <= f:
+                _, det, token = in_flight.popleft()
+                sampler.on_detection(0, det, (720, 1280, 3), f, token)
+            x = 100 + f * 6.0
+            if sampler.should_detect(0):
+                token = object()
+                sampler.begin_detection(0, token)
+                det = Detections(np.float32([[x, 100, x + 40, 180]]), np.float32([0.9]), np.int32([0]))
+                in_flight.append((f + delay, det, token))
+            else:
+                boxes = sampler.propagate(0).xyxy
+                if len(boxes) and f > 20:
+                    errors.append(abs(float(boxes[0, 0]) - x))
+        stats = sampler.stats()[0]
+        assert errors and max(errors) < 1.0, (delay, max(errors))
+        # 第 f + delay 帧之前结果到达，其间外推了 delay - 1 帧
+        assert abs(stats["avg_result_delay"] - (delay - 1)) < 0.05 and stats["drift_iou"] > 0.95, stats
+
+    print("adaptive_sampling 自检通过", stats)
@@ -0,0 +1,234 @@
+import socket
+import threading
+import time
+
+from tracing import write_json_atomic
+
+
+class StreamControl:
+    """解码线程每帧读取的控制量：active=False 时停止解码，every_n 为动态抽帧间隔"""
+    __slots__ = ("active", "every_n")
+
+    def __init__(self, active=True, every_n=1):
+        self.active = active
+        self.every_n = every_n
+
+
+class SharedStreamControl:
+    """
+    跨进程的 StreamControl（进程解码模式）：两个量放在共享内存里，
+    主进程的准入控制改写后，解码进程下一帧就能读到
+    """
+    __slots__ = ("_active", "_every_n")
+
+    def __init__(self, ctx, active=True, every_n=1):
+        self._active = ctx.RawValue("b", bool(active))
+        self._every_n = ctx.RawValue("i", every_n)
+
+    @property
+    def active(self):
+        return bool(self._active.value)
+
+    @active.setter
+    def active(self, value):
+        self._active.value = bool(value)
+
+    @property
+    def every_n(self):
+        return self._every_n.value
+
+    @every_n.setter
+    def every_n(self, value):
+        self._every_n.value = value
+
+
+class AdmissionController:
+    """
+    按实测容量决定接入几路、每路抽几帧：
+    - 每个窗口统计各路实际推理帧率、推理线程占用率（busy_time 增量 / 窗口时长）和推理队列深度；
+    - 容量估计 capacity_fps = 总推理帧率 / 占用率（推理线程跑满时能处理的帧率），
+      capacity_streams = capacity_fps * headroom / target_fps；
+    - 有路低于目标帧率且推理已饱和（队列积压或占用率高）时过载：
+      action="shed" 停掉优先级最低（路号最大）的一路，action="degrade" 先把各路抽帧间隔翻倍，到上限后再停路；
+    - 连续 stable_windows 个窗口不过载且容量有富余时，先恢复抽帧，再接入下一路。
+    路号越小优先级越高。
+    """
+
+    def __init__(self, controls, target_fps, min_streams=1, headroom=0.9, tolerance=0.15,
+                 action="shed", max_every_n=4, stable_windows=2):
+        """
+        :param controls: 每路一个 StreamControl，初始 active 的路数即起始接入数
+        :param target_fps: 每路期望的推理帧率（every_n=1 时）
+        :param headroom: 容量只用到这个比例，留出余量
+        :param tolerance: 帧率低于目标的 (1 - tolerance) 才算不达标
+        """
+        if action not in ("shed", "degrade"):
+            raise ValueError(f"未知的过载处理方式 {action}")
+        self.controls = controls
+        self.target_fps = target_fps
+        self.min_streams = min_streams
+        self.headroom = headroom
+        self.tolerance = tolerance
+        self.action = action
+        self.max_every_n = max_every_n
+        self.stable_windows = stable_windows
+
+        self.capacity_fps = None
+        self.utilization = 0.0
+        self.stream_fps = [0.0] * len(controls)
+        self.queue_ratio = 0.0
+        self._stable = 0
+        self._last = None
+        self._grace = set()   # 刚接入 / 刚恢复抽帧的路，下一个窗口还在打开视频源，不参与达标判断
+        # 被停掉的路在若干窗口内不再接入，同一路反复被停时冷却时间翻倍，避免在容量边界来回抖动
+        self._window = 0
+        self._shed_count = [0] * len(controls)
+        self._blocked_until = [0] * len(controls)
+
+    def active_streams(self):
+        return [i for i, c in enumerate(self.controls) if c.active]
+
+    def capacity_streams(self):
+        if not self.capacity_fps:
+            return None
+        return int(self.capacity_fps * self.headroom / self.target_fps)
+
+    def update(self, processed, busy_time, queue_depth, queue_capacity, now=None):
+        """
+        每个窗口调用一次
+        :param processed: 各路累计已推理帧数
+        :param busy_time: 推理线程累计忙碌秒数
+        :return: 本次做出的调整 [(动作, 路号, 参数), ...]
+        """
+        now = time.perf_counter() if now is None else now
+        if self._last is None:
+            self._last = (now, list(processed), busy_time)
+            return []
+        last_t, last_processed, last_busy = self._last
+        dt = now - last_t
+        if dt <= 0:
+            return []
+        self._last = (now, list(processed), busy_time)
+        self._window += 1
+
+        active = self.active_streams()
+        self.stream_fps = [(p - lp) / dt for p, lp in zip(processed, last_processed)]
+        total_fps = sum(self.stream_fps[i] for i in active)
+        self.utilization = min(max((busy_time - last_busy) / dt, 0.0), 1.0)
+        self.queue_ratio = queue_depth / queue_capacity if queue_capacity else 0.0
+        if total_fps > 0 and self.utilization > 0.05:
+            estimate = total_fps / self.utilization
+            self.capacity_fps = estimate if self.capacity_fps is None else 0.5 * self.capacity_fps + 0.5 * estimate
+
+        saturated = self.queue_ratio > 0.5 or self.utilization > 0.9
+        below_target = any(self.stream_fps[i] < self.target_fps / self.controls[i].every_n * (1 - self.tolerance)
+                           for i in active if i not in self._grace)
+        self._grace.clear()
+        if saturated and below_target:
+            self._stable = 0
+            return self._shed_or_degrade(active)
+
+        self._stable += 1
+        if self._stable < self.stable_windows:
+            return []
+        self._stable = 0
+        return self._restore_or_admit(active)
+
+    def _shed_or_degrade(self, active):
+        if self.action == "degrade":
+            degradable = [i for i in active if self.controls[i].every_n < self.max_every_n]
+            if degradable:
+                actions = []
+                for i in degradable:
+                    self.controls[i].every_n = min(self.controls[i].every_n * 2, self.max_every_n)
+                    actions.append(("every_n", i, self.controls[i].every_n))
+                return actions
+        if len(active) > self.min_streams:
+            i = active[-1]
+            self.controls[i].active = False
+            self._blocked_until[i] = self._window + self.stable_windows * 2 ** min(self._shed_count[i] + 1, 5)
+            self._shed_count[i] += 1
+            return [("shed", i, None)]
+        return []
+
+    def _restore_or_admit(self, active):
+        capacity = self.capacity_streams()
+        if capacity is None:
+            return []
+        # 按当前各路抽帧后的需求估算还能否多承担
+        demand = sum(1.0 / self.controls[i].every_n for i in active)
+        degraded = [i for i in active if self.controls[i].every_n > 1]
+        if degraded:
+            i = degraded[0]
+            if demand + 1.0 / self.controls[i].every_n <= capacity:
+                self.controls[i].every_n //= 2
+                self._grace.add(i)
+                return [("every_n", i, self.controls[i].every_n)]
+            return []
+        inactive = [i for i, c in enumerate(self.controls) if not c.active]
+        if inactive and demand + 1 <= capacity and self._window >= self._blocked_until[inactive[0]]:
+            self.controls[inactive[0]].active = True
+            self._grace.add(inactive[0])
+            return [("admit", inactive[0], None)]
+        return []
+
+    def estimate(self):
+        """本节点容量估计，供上报"""
+        capacity = self.capacity_streams()
+        return {
+            "node": socket.gethostname(),
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "target_fps": self.target_fps,
+            "active_streams": self.active_streams(),
+            "capacity_fps": round(self.capacity_fps, 2) if self.capacity_fps else None,
+            "capacity_streams": capacity,
+            "utilization": round(self.utilization, 3),
+            "queue_ratio": round(self.queue_ratio, 3),
+            "stream_fps": {i: round(self.stream_fps[i], 2) for i in self.active_streams()},
+            "every_n": {i: self.controls[i].every_n for i in self.active_streams()},
+        }
+
+
+def run_admission(controller, scheduler, stop_event, interval_s=10.0, publish_path=None):
+    """后台线程：按窗口采样调度器计数并调整接入，顺带写出容量估计"""
+    def loop():
+        while not stop_event.wait(interval_s):
+            requests = scheduler.requests
+            actions = controller.update(
+                [c.processed for c in requests.counters],
+                scheduler.busy_time,
+                requests.qsize(),
+                requests.capacity,
+            )
+            for action, stream_index, value in actions:
+                print(f"[Admission] {action} stream {stream_index}" + (f" -> {value}" if value else ""))
+            if publish_path:
+                write_json_atomic(publish_path, controller.estimate())
+
+    t = threading.Thread(target=loop, name="admission", daemon=True)
+    t.start()
+    return t
+
+
+if __name__ == "__main__":
+    # 模拟：推理容量 50 FPS，每路源 25 FPS，目标每路 10 FPS，应稳定在 50*0.9/10 = 4 路
+    controls = [StreamControl(active=i < 2) for i in range(12)]
+    controller = AdmissionController(controls, target_fps=10, stable_windows=1)
+    processed = [0.0] * 12
+    busy = 0.0
+    for step in range(40):
+        active = controller.active_streams()
+        demand = sum(25.0 / controls[i].every_n for i in active)
+        served = min(demand, 50.0)
+        for i in active:
+            processed[i] += 25.0 / controls[i].every_n * served / demand
+        busy += served / 50.0
+        controller.update(processed, busy, 16 if demand > 50 else 2, 16, now=float(step))
+    assert len(controller.active_streams()) == 4, controller.estimate()
+
+    controls = [StreamControl(active=i < 8) for i in range(8)]
+    controller = AdmissionController(controls, target_fps=10, action="degrade", stable_windows=1)
+    controller.update([0] * 8, 0.0, 16, 16, now=0.0)
+    controller.update([5] * 8, 1.0, 16, 16, now=1.0)
+    assert all(c.every_n == 2 for c in controls)
+    print("admission 自检通过", controller.estimate())
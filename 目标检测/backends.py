@@ -0,0 +1,316 @@
+import ast
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+# ============================================================
+# 检测结果：紧凑的数组表示（不持有帧的引用）
+# ============================================================
+class Detections:
+    __slots__ = ("xyxy", "conf", "cls")
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy    # (n, 4) float32，送检帧的坐标（解码端缩放过的帧需用 scaled() 映射回原图）
+        self.conf = conf    # (n,)   float32
+        self.cls = cls      # (n,)   int32
+
+    def __len__(self):
+        return len(self.conf)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int32))
+
+    def scaled(self, sx, sy):
+        """框坐标按 (sx, sy) 缩放后的新结果，如 capture 的 source_size / size 映射回原图"""
+        return Detections(self.xyxy * np.float32([sx, sy, sx, sy]), self.conf, self.cls)
+
+
+# ============================================================
+# 共享的前处理 / 后处理
+# ============================================================
+def letterbox_batch(frames, imgsz=640, out=None, pad_to=None):
+    """
+    批量 letterbox：等比缩放 + 居中填充 114，BGR->RGB，归一化到 0~1
+    :param frames: BGR uint8 帧列表，尺寸可以不同
+    :param out: 可复用的 (N, imgsz, imgsz, 3) uint8 缓冲区
+    :param pad_to: 输入补齐到该行数（静态 batch 的模型），补出来的行是全 114 的空图
+    :return: (max(N, pad_to), 3, imgsz, imgsz) float32 输入, [(scale, pad_x, pad_y), ...]（只含真实帧）
+    """
+    n = max(len(frames), pad_to or 0)
+    if out is None or out.shape[0] < n:
+        out = np.empty((n, imgsz, imgsz, 3), np.uint8)
+    canvas = out[:n]
+    canvas.fill(114)
+
+    metas = []
+    for i, frame in enumerate(frames):
+        h, w = frame.shape[:2]
+        scale = min(imgsz / h, imgsz / w)
+        nh, nw = int(round(h * scale)), int(round(w * scale))
+        pad_y, pad_x = (imgsz - nh) // 2, (imgsz - nw) // 2
+        if (nh, nw) == (h, w):
+            canvas[i, pad_y:pad_y + nh, pad_x:pad_x + nw] = frame
+        else:
+            cv2.resize(frame, (nw, nh), dst=canvas[i, pad_y:pad_y + nh, pad_x:pad_x + nw],
+                       interpolation=cv2.INTER_LINEAR)
+        metas.append((scale, pad_x, pad_y))
+
+    # BGR->RGB + HWC->CHW + 归一化，整批一次完成
+    blob = np.ascontiguousarray(canvas[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+    blob *= 1.0 / 255.0
+    return blob, metas
+
+
+def nms(boxes, scores, iou_thres=0.45):
+    """贪心 NMS，每轮对剩余框做一次向量化 IoU"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        if rest.size == 0:
+            break
+        w = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        h = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess_yolo(pred, metas, frame_shapes, conf_thres=0.25, iou_thres=0.45, max_det=300, max_nms=3000):
+    """
+    YOLOv8/11 输出后处理
+    :param pred: (N, 4+nc, A) 原始输出（xywh，输入尺度）；
+                 或端到端模型的 (N, K, 6) 输出（xyxy, conf, cls）
+    :param metas: letterbox_batch 返回的 (scale, pad_x, pad_y)
+    :param frame_shapes: 原图 (h, w) 列表
+    :return: Detections 列表
+    """
+    end2end = pred.ndim == 3 and pred.shape[-1] == 6 and pred.shape[1] != 6
+    outputs = []
+    for i, (scale, pad_x, pad_y) in enumerate(metas):
+        if end2end:
+            p = pred[i]
+            p = p[p[:, 4] > conf_thres]
+            boxes, conf, cls = p[:, :4].copy(), p[:, 4], p[:, 5].astype(np.int32)
+        else:
+            p = pred[i].T  # (A, 4+nc)
+            scores = p[:, 4:]
+            cls = scores.argmax(axis=1)
+            conf = scores[np.arange(len(cls)), cls]
+            mask = conf > conf_thres
+            p, cls, conf = p[mask], cls[mask].astype(np.int32), conf[mask]
+
+            if len(conf) > max_nms:
+                top = conf.argsort()[::-1][:max_nms]
+                p, cls, conf = p[top], cls[top], conf[top]
+
+            boxes = np.empty((len(p), 4), np.float32)
+            boxes[:, 0] = p[:, 0] - p[:, 2] / 2
+            boxes[:, 1] = p[:, 1] - p[:, 3] / 2
+            boxes[:, 2] = p[:, 0] + p[:, 2] / 2
+            boxes[:, 3] = p[:, 1] + p[:, 3] / 2
+
+            # 按类别做 NMS：不同类别的框平移到互不重叠的位置
+            keep = nms(boxes + cls[:, None] * 7680.0, conf, iou_thres)[:max_det]
+            boxes, conf, cls = boxes[keep], conf[keep], cls[keep]
+
+        # 映射回输入帧坐标
+        h, w = frame_shapes[i]
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / scale).clip(0, w)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / scale).clip(0, h)
+        outputs.append(Detections(boxes.astype(np.float32), conf.astype(np.float32), cls))
+    return outputs
+
+
+def _parse_names(names):
+    if isinstance(names, str):
+        names = ast.literal_eval(names)
+    if isinstance(names, (list, tuple)):
+        names = dict(enumerate(names))
+    return {int(k): v for k, v in names.items()}
+
+
+# ============================================================
+# 推理后端：只负责 (N,3,S,S) -> 原始输出，前后处理共用
+# ============================================================
+class DetectorBackend:
+    name = "base"
+
+    def __init__(self, imgsz=640, conf_thres=0.25, iou_thres=0.45, max_batch_size=None):
+        self.imgsz = imgsz
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+        self.max_batch_size = max_batch_size  # 静态 batch 的模型需要分块
+        self.names = {}
+        self._buffer = None
+        # 最近一次 detect 的分段时间 {stage: (start_ns, end_ns)}，供 tracing 使用
+        self.last_timings = {}
+
+    def forward(self, blob):
+        """(N, 3, S, S) float32 -> (N, 4+nc, A) numpy"""
+        raise NotImplementedError
+
+    def detect(self, frames):
+        """BGR 帧列表 -> Detections 列表"""
+        if not frames:
+            return []
+        t0 = time.perf_counter_ns()
+        n = len(frames)
+        step = self.max_batch_size or n
+        # 静态 batch：补齐到 step 的整数倍，每块都是完整 batch，输出只取真实帧
+        rows = -(-n // step) * step
+        if self._buffer is None or self._buffer.shape[0] < rows:
+            self._buffer = np.empty((rows, self.imgsz, self.imgsz, 3), np.uint8)
+        blob, metas = letterbox_batch(frames, self.imgsz, self._buffer, pad_to=rows)
+
+        t1 = time.perf_counter_ns()
+        preds = [self.forward(blob[i:i + step]) for i in range(0, rows, step)]
+        pred = (preds[0] if len(preds) == 1 else np.concatenate(preds, axis=0))[:n]
+
+        t2 = time.perf_counter_ns()
+        outputs = postprocess_yolo(pred, metas, [f.shape[:2] for f in frames],
+                                   self.conf_thres, self.iou_thres)
+        self.last_timings = {"preprocess": (t0, t1), "inference": (t1, t2),
+                             "postprocess": (t2, time.perf_counter_ns())}
+        return outputs
+
+
+class OnnxRuntimeBackend(DetectorBackend):
+    name = "onnxruntime"
+
+    def __init__(self, model_path, providers=None, num_threads=None, **kwargs):
+        super().__init__(**kwargs)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options,
+                                            providers=providers or ["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        if isinstance(model_input.shape[0], int):
+            self.max_batch_size = model_input.shape[0]
+        if isinstance(model_input.shape[2], int):
+            self.imgsz = model_input.shape[2]
+
+        meta = self.session.get_modelmeta().custom_metadata_map
+        if "names" in meta:
+            self.names = _parse_names(meta["names"])
+
+    def forward(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVINOBackend(DetectorBackend):
+    name = "openvino"
+
+    def __init__(self, model_path, device="CPU", **kwargs):
+        super().__init__(**kwargs)
+        import openvino as ov
+
+        core = ov.Core()
+        if os.path.isdir(model_path):
+            model_path = next(os.path.join(model_path, f) for f in os.listdir(model_path) if f.endswith(".xml"))
+        model = core.read_model(model_path)
+        self.compiled = core.compile_model(model, device, {"PERFORMANCE_HINT": "THROUGHPUT"})
+        shape = model.inputs[0].get_partial_shape()
+        if shape[0].is_static:
+            self.max_batch_size = shape[0].get_length()
+        if shape[2].is_static:
+            self.imgsz = shape[2].get_length()
+
+        rt_info = model.get_rt_info()
+        if rt_info.get("model_info") is not None and "names" in rt_info["model_info"]:
+            self.names = _parse_names(rt_info["model_info"]["names"].astype(str))
+
+    def forward(self, blob):
+        return self.compiled(blob)[0]
+
+
+class TorchBackend(DetectorBackend):
+    name = "torch"
+
+    def __init__(self, model_path, device="cpu", **kwargs):
+        super().__init__(**kwargs)
+        import torch
+        from ultralytics import YOLO
+
+        self.torch = torch
+        self.device = torch.device(device)
+        yolo = YOLO(model_path)
+        self.names = _parse_names(yolo.names)
+        self.model = yolo.model.fuse().float().eval().to(self.device)
+
+    def forward(self, blob):
+        with self.torch.inference_mode():
+            out = self.model(self.torch.from_numpy(blob).to(self.device))
+        if isinstance(out, (list, tuple)):
+            out = out[0]
+        return out.cpu().numpy()
+
+
+class TensorRTBackend(DetectorBackend):
+    name = "tensorrt"
+
+    def __init__(self, model_path, device="cuda:0", **kwargs):
+        super().__init__(**kwargs)
+        import torch
+        from ultralytics.nn.autobackend import AutoBackend
+
+        self.torch = torch
+        self.device = torch.device(device)
+        # 引擎的绑定/显存管理交给 AutoBackend，本类只取原始输出
+        self.model = AutoBackend(model_path, device=self.device, verbose=False)
+        self.names = _parse_names(self.model.names)
+        self.fp16 = getattr(self.model, "fp16", False)
+        if not getattr(self.model, "dynamic", True):
+            self.max_batch_size = getattr(self.model, "batch", None)
+
+    def forward(self, blob):
+        x = self.torch.from_numpy(blob).to(self.device)
+        if self.fp16:
+            x = x.half()
+        with self.torch.inference_mode():
+            out = self.model(x)
+        if isinstance(out, (list, tuple)):
+            out = out[0]
+        return out.float().cpu().numpy()
+
+
+BACKENDS = {
+    "tensorrt": TensorRTBackend,
+    "onnxruntime": OnnxRuntimeBackend,
+    "openvino": OpenVINOBackend,
+    "torch": TorchBackend,
+}
+
+
+def create_backend(candidates, **kwargs):
+    """
+    按顺序尝试创建后端，失败（文件不存在、依赖未安装、引擎加载失败）时回退到下一个
+    :param candidates: [(backend 名称, 模型路径), ...]
+    """
+    errors = []
+    for kind, model_path in candidates:
+        if not os.path.exists(model_path):
+            errors.append(f"{kind}: 未找到 {model_path}")
+            continue
+        try:
+            backend = BACKENDS[kind](model_path, **kwargs)
+            print(f"使用推理后端 {kind}: {model_path}")
+            return backend
+        except Exception as e:
+            errors.append(f"{kind}: {e}")
+            print(f"推理后端 {kind} 加载失败，尝试下一个: {e}")
+    raise RuntimeError("没有可用的推理后端:\n  " + "\n  ".join(errors))
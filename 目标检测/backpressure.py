@@ -0,0 +1,219 @@
+import collections
+import queue
+import threading
+import time
+
+# block:        与 queue.Queue 一致，满了阻塞等待（超时抛 queue.Full）
+# drop_oldest:  从不阻塞，满了丢掉该路最旧的一帧
+# latest_only:  每路只保留最新一帧，新帧直接覆盖未取走的旧帧
+# bounded_lag:  同 drop_oldest，另外取帧时丢弃排队超过 max_lag_ms 的帧；
+#               该路积压（排队数达到每路份额或最旧帧超时）时 should_skip() 通知解码端跳过解码
+POLICIES = ("block", "drop_oldest", "latest_only", "bounded_lag")
+
+
+class StreamCounters:
+    __slots__ = ("processed", "dropped", "skipped", "discarded")
+
+    def __init__(self):
+        self.processed = 0  # 被消费者取走
+        self.dropped = 0    # 入队后被挤掉 / 超时丢弃
+        self.skipped = 0    # 解码端按 should_skip() 跳过，未解码
+        self.discarded = 0  # 解码端按 should_skip() 跳过，但后端不支持跳过解码（如 OpenCV），解码后丢弃
+
+    def as_dict(self):
+        return {"processed": self.processed, "dropped": self.dropped, "skipped": self.skipped,
+                "discarded": self.discarded}
+
+
+class FrameBuffer:
+    """
+    按路分队列的有界帧缓冲，接口兼容 queue.Queue（put / get / put_nowait / get_nowait / qsize），
+    可以直接替换 frame_queue 或 InferenceScheduler 的请求队列。
+    元素约定为元组，第 0 项是 stream_index；get 时各路轮流取，避免某一路占满输出。
+    """
+
+    def __init__(self, policy, num_streams, capacity, max_lag_ms=200.0, on_drop=None):
+        """
+        :param policy: POLICIES 之一
+        :param capacity: 所有路合计的容量上限（latest_only 时每路固定为 1）
+        :param max_lag_ms: bounded_lag 策略允许的最长排队时间
+        :param on_drop: 帧被丢弃时的回调 on_drop(item)，用于归还共享内存槽位等资源
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"未知的背压策略 {policy}，可选: {', '.join(POLICIES)}")
+        self.policy = policy
+        self.num_streams = num_streams
+        self.capacity = capacity
+        self.max_lag = max_lag_ms / 1000.0
+        self.on_drop = on_drop
+
+        self.pending = [collections.deque() for _ in range(num_streams)]  # 每路 (入队时间, item)
+        self.counters = [StreamCounters() for _ in range(num_streams)]
+        self.size = 0
+        self.next_stream = 0
+        self.cond = threading.Condition()
+
+    # ---------- 生产者 ----------
+    def put(self, item, block=True, timeout=None):
+        stream_index = item[0]
+        dropped = []
+        with self.cond:
+            if self.policy == "block":
+                if not block:
+                    timeout = 0
+                if not self.cond.wait_for(lambda: self.size < self.capacity, timeout):
+                    self.counters[stream_index].dropped += 1
+                    raise queue.Full
+            elif self.policy == "latest_only":
+                dropped.extend(self._evict(stream_index, len(self.pending[stream_index])))
+            elif self.size >= self.capacity:
+                # 优先挤掉本路最旧的帧，本路没有排队时挤掉全局最旧的
+                victim = stream_index if self.pending[stream_index] else self._oldest_stream()
+                dropped.extend(self._evict(victim, 1))
+
+            self.pending[stream_index].append((time.perf_counter(), item))
+            self.size += 1
+            self.cond.notify_all()
+
+        self._notify_dropped(dropped)
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def should_skip(self, stream_index):
+        """
+        bounded_lag 下该路积压时返回 True，解码端应跳过解码（capture 的 skip()）：
+        再解出的帧多半会挤掉排队中的帧或在排队中超时，解码白做
+        """
+        if self.policy != "bounded_lag":
+            return False
+        with self.cond:
+            pending = self.pending[stream_index]
+            if not pending:
+                return False
+            share = max(1, self.capacity // self.num_streams)
+            return len(pending) >= share or time.perf_counter() - pending[0][0] > self.max_lag
+
+    def record_skip(self, stream_index, count=1, decoded=False):
+        """
+        :param count: 跳过的帧数（capture.skip() 一次可能跳过一整个 GOP）
+        :param decoded: 跳过的帧实际已经解码（capture 后端的 skips_decode 为 False）
+        """
+        if decoded:
+            self.counters[stream_index].discarded += count
+        else:
+            self.counters[stream_index].skipped += count
+
+    # ---------- 消费者 ----------
+    def get(self, block=True, timeout=None):
+        dropped = []
+        try:
+            with self.cond:
+                deadline = None if timeout is None else time.perf_counter() + timeout
+                while True:
+                    if self.policy == "bounded_lag":
+                        dropped.extend(self._expire())
+                    if self.size:
+                        return self._pop_round_robin()
+                    remaining = None if deadline is None else deadline - time.perf_counter()
+                    if not block or (remaining is not None and remaining <= 0):
+                        raise queue.Empty
+                    self.cond.wait(remaining)
+        finally:
+            self._notify_dropped(dropped)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        return self.size
+
+    def empty(self):
+        return self.size == 0
+
+    def full(self):
+        return self.size >= self.capacity
+
+    def stats(self):
+        return [c.as_dict() for c in self.counters]
+
+    # ---------- 内部（调用方持有 cond） ----------
+    def _pop_round_robin(self):
+        for i in range(self.num_streams):
+            s = (self.next_stream + i) % self.num_streams
+            if self.pending[s]:
+                self.next_stream = (s + 1) % self.num_streams
+                _, item = self.pending[s].popleft()
+                self.size -= 1
+                self.counters[s].processed += 1
+                self.cond.notify_all()
+                return item
+        raise queue.Empty
+
+    def _oldest_stream(self):
+        candidates = [s for s in range(self.num_streams) if self.pending[s]]
+        return min(candidates, key=lambda s: self.pending[s][0][0])
+
+    def _evict(self, stream_index, n):
+        pending = self.pending[stream_index]
+        evicted = [pending.popleft()[1] for _ in range(min(n, len(pending)))]
+        self.size -= len(evicted)
+        self.counters[stream_index].dropped += len(evicted)
+        return evicted
+
+    def _expire(self):
+        now = time.perf_counter()
+        expired = []
+        for s, pending in enumerate(self.pending):
+            n = 0
+            for t, _ in pending:
+                if now - t <= self.max_lag:
+                    break
+                n += 1
+            if n:
+                expired.extend(self._evict(s, n))
+        return expired
+
+    def _notify_dropped(self, items):
+        # 回调放在锁外执行，避免回调里再访问本缓冲时死锁
+        if self.on_drop is not None:
+            for item in items:
+                self.on_drop(item)
+
+
+if __name__ == "__main__":
+    # 自检：各策略的丢帧 / 计数行为
+    buf = FrameBuffer("latest_only", 2, capacity=8)
+    for i in range(5):
+        buf.put((0, i))
+    buf.put((1, 100))
+    assert buf.get() == (0, 4) and buf.get() == (1, 100)
+    assert buf.stats()[0] == {"processed": 1, "dropped": 4, "skipped": 0, "discarded": 0}
+    # 后端不支持跳过解码时计为解码后丢弃
+    buf.record_skip(1, 12)
+    buf.record_skip(1, decoded=True)
+    assert buf.stats()[1]["skipped"] == 12 and buf.stats()[1]["discarded"] == 1
+
+    dropped = []
+    buf = FrameBuffer("drop_oldest", 2, capacity=3, on_drop=dropped.append)
+    for i in range(4):
+        buf.put((0, i))
+    buf.put((1, 0))
+    assert dropped == [(0, 0), (0, 1)] and buf.qsize() == 3
+
+    buf = FrameBuffer("bounded_lag", 1, capacity=8, max_lag_ms=20)
+    buf.put((0, "old"))
+    assert not buf.should_skip(0)
+    time.sleep(0.05)
+    assert buf.should_skip(0)
+    buf.put((0, "new"))
+    assert buf.get() == (0, "new") and buf.stats()[0]["dropped"] == 1
+
+    buf = FrameBuffer("block", 1, capacity=1)
+    buf.put((0, 1))
+    try:
+        buf.put((0, 2), timeout=0.01)
+        raise AssertionError("block 策略满时应抛 queue.Full")
+    except queue.Full:
+        pass
+    print("backpressure 自检通过")
@@ -0,0 +1,431 @@
+import os
+import subprocess
+import threading
+import time
+
+import cv2
+import numpy as np
+
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+
+
+def is_stream_url(source):
+    return isinstance(source, str) and source.split("://", 1)[0].lower() in ("rtsp", "rtmp", "http", "https", "udp")
+
+
+def fit_size(width, height, max_side):
+    """等比缩放到长边不超过 max_side，宽高取偶数（部分缩放器要求）"""
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(2, int(round(width * scale / 2)) * 2), max(2, int(round(height * scale / 2)) * 2)
+
+
+def probe_source(source):
+    """用 OpenCV 取源的宽、高、帧率（文件和 RTSP 都适用）"""
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"无法打开视频源 {source}")
+    w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return w, h, fps if fps and fps > 0 else 25.0
+
+
+# ============================================================
+# 解码后端：统一的 grab / retrieve / read / rewind 接口
+#   grab():      取下一帧（every_n > 1 时先跳过 n-1 帧），只解码不转换
+#   retrieve():  把 grab 到的帧转成 BGR，并已缩放到 size
+#   skip():      积压时跳帧，skips_decode 为 True 的后端只解关键帧，其余后端等同 grab()
+#   size:        输出 (w, h)；source_size: 源分辨率，检测框乘 source_size/size 可映射回原图
+# ============================================================
+class Capture:
+    name = "base"
+    skips_decode = False  # skip() 能否真正省掉解码
+
+    def __init__(self, source, max_side=None, every_n=1, keyframes_only=False, rate=None):
+        """
+        :param max_side: 输出长边上限，一般取模型输入尺寸，None 为原分辨率
+        :param every_n: 每 N 帧只输出 1 帧
+        :param keyframes_only: 只解码关键帧（I 帧），其余帧不解码
+        :param rate: 按该帧率回放，覆盖源帧率（回放压测用），None 为源帧率
+        """
+        self.source = source
+        self.every_n = max(1, int(every_n))
+        self.keyframes_only = keyframes_only
+        self.rate = rate
+        self.is_file = not is_stream_url(source) and os.path.isfile(str(source))
+        self.max_side = max_side
+        self.source_size = (0, 0)
+        self.size = (0, 0)
+        self.fps = 25.0
+
+    def grab(self):
+        raise NotImplementedError
+
+    def retrieve(self):
+        raise NotImplementedError
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def skip(self):
+        """
+        解码端积压时跳帧，返回跳过的输出帧数（按 every_n 计），0 为读到结尾；
+        默认就是 grab()，帧照样解码
+        """
+        return 1 if self.grab() else 0
+
+    def rewind(self):
+        """文件源回到开头；实时流重新连接"""
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+    def output_fps(self):
+        return (self.rate or self.fps) / self.every_n
+
+
+class OpenCVCapture(Capture):
+    """
+    cv2.VideoCapture：请求硬件解码（不支持时自动退回软解），缩放在解码之后做；
+    grab() 总会解码，没有跳过非关键帧的接口，积压时 skip() 只省掉转换
+    """
+    name = "opencv"
+
+    def __init__(self, source, **kwargs):
+        super().__init__(source, **kwargs)
+        if self.keyframes_only:
+            raise ValueError("OpenCV 后端不支持只解码关键帧")
+        self.cap = self._open()
+        self.source_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.size = fit_size(*self.source_size, self.max_side)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 25.0
+
+    def _open(self):
+        params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        cap = cv2.VideoCapture(self.source, cv2.CAP_ANY, params)
+        if not cap.isOpened():
+            raise IOError(f"无法打开视频源 {self.source}")
+        return cap
+
+    def grab(self):
+        for _ in range(self.every_n - 1):
+            if not self.cap.grab():
+                return False
+        return self.cap.grab()
+
+    def retrieve(self):
+        ok, frame = self.cap.retrieve()
+        if ok and self.size != self.source_size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return ok, frame
+
+    def rewind(self):
+        if self.is_file:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        else:
+            self.cap.release()
+            self.cap = self._open()
+
+    def release(self):
+        self.cap.release()
+
+
+class PyAVCapture(Capture):
+    """
+    PyAV（libavcodec）：多线程解码；keyframes_only 用 skip_frame=NONKEY 让解码器直接丢弃非关键帧；
+    缩放和转 BGR 在 swscale 里一步完成，跳过的帧只解码不转换。
+    skip() 临时打开 skip_frame=NONKEY，直接跳到下一个关键帧，下一次 grab() 恢复逐帧解码
+    """
+    name = "pyav"
+    skips_decode = True
+
+    def __init__(self, source, **kwargs):
+        super().__init__(source, **kwargs)
+        import av
+        self.av = av
+        self._open()
+        self._frame = None
+
+    def _open(self):
+        options = {"rtsp_transport": "tcp"} if str(self.source).startswith("rtsp") else {}
+        self.container = self.av.open(self.source, options=options)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        if self.keyframes_only:
+            self.stream.codec_context.skip_frame = "NONKEY"
+        self._skipping = False
+        ctx = self.stream.codec_context
+        self.source_size = (ctx.width, ctx.height)
+        self.size = fit_size(ctx.width, ctx.height, self.max_side)
+        if self.stream.average_rate:
+            self.fps = float(self.stream.average_rate)
+        self.frames = self.container.decode(self.stream)
+
+    def grab(self):
+        if self._skipping:
+            self.stream.codec_context.skip_frame = "DEFAULT"
+            self._skipping = False
+        try:
+            for _ in range(self.every_n):
+                self._frame = next(self.frames)
+        except (StopIteration, self.av.error.EOFError):
+            self._frame = None
+            return False
+        return True
+
+    def skip(self):
+        if self.keyframes_only:
+            return super().skip()
+        if not self._skipping:
+            self.stream.codec_context.skip_frame = "NONKEY"
+            self._skipping = True
+        prev = self._frame
+        try:
+            self._frame = next(self.frames)
+        except (StopIteration, self.av.error.EOFError):
+            self._frame = None
+            return 0
+        # 按时间戳折算跳过了多少帧，文件源限速时据此补上节拍
+        if prev is None or prev.pts is None or self._frame.pts is None or not self.stream.time_base:
+            return 1
+        passed = (self._frame.pts - prev.pts) * float(self.stream.time_base) * self.fps
+        return max(1, int(round(passed / self.every_n)))
+
+    def retrieve(self):
+        if self._frame is None:
+            return False, None
+        w, h = self.size
+        return True, self._frame.to_ndarray(width=w, height=h, format="bgr24")
+
+    def rewind(self):
+        if self.is_file:
+            self.container.seek(0)
+            self.frames = self.container.decode(self.stream)
+        else:
+            self.container.close()
+            self._open()
+
+    def release(self):
+        self.container.close()
+
+    def output_fps(self):
+        # 只解关键帧时输出帧率取决于 GOP，无法预知
+        return None if self.keyframes_only else super().output_fps()
+
+
+class FFmpegPipeCapture(Capture):
+    """
+    ffmpeg 子进程：解码、抽帧（select）、缩放都在 ffmpeg 里完成，管道里只传缩放后的 BGR 原始帧；
+    解码在独立进程里，不占 Python 进程的 GIL
+    """
+    name = "ffmpeg"
+
+    def __init__(self, source, hwaccel=None, **kwargs):
+        super().__init__(source, **kwargs)
+        w, h, self.fps = probe_source(source)
+        self.source_size = (w, h)
+        self.size = fit_size(w, h, self.max_side)
+        self.frame_bytes = self.size[0] * self.size[1] * 3
+        self.hwaccel = hwaccel
+        self.proc = None
+        self._buffer = None
+        self._start()
+
+    def _command(self):
+        cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-nostdin"]
+        if self.hwaccel:
+            cmd += ["-hwaccel", self.hwaccel]
+        if self.keyframes_only:
+            cmd += ["-skip_frame", "nokey"]
+        if str(self.source).startswith("rtsp"):
+            cmd += ["-rtsp_transport", "tcp"]
+        cmd += ["-i", str(self.source)]
+
+        filters = []
+        if self.every_n > 1:
+            filters.append(f"select=not(mod(n\\,{self.every_n}))")
+        if self.size != self.source_size:
+            filters.append(f"scale={self.size[0]}:{self.size[1]}:flags=area")
+        if filters:
+            cmd += ["-vf", ",".join(filters)]
+        # -vsync 0 即 passthrough，新旧版本 ffmpeg 都认
+        cmd += ["-an", "-vsync", "0", "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"]
+        return cmd
+
+    def _start(self):
+        self.proc = subprocess.Popen(self._command(), stdout=subprocess.PIPE, bufsize=self.frame_bytes)
+
+    def grab(self):
+        # 每帧一块新内存：帧会被放进队列，不能复用缓冲区
+        self._buffer = np.empty((self.size[1], self.size[0], 3), np.uint8)
+        view = memoryview(self._buffer).cast("B")
+        got = 0
+        while got < self.frame_bytes:
+            n = self.proc.stdout.readinto(view[got:])
+            if not n:
+                self._buffer = None
+                return False
+            got += n
+        return True
+
+    def retrieve(self):
+        return self._buffer is not None, self._buffer
+
+    def rewind(self):
+        self.release()
+        self._start()
+
+    def release(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.stdout.close()
+            self.proc.wait()
+            self.proc = None
+
+    def output_fps(self):
+        return None if self.keyframes_only else super().output_fps()
+
+
+class ImageFolderCapture(Capture):
+    """
+    图片目录按文件名顺序循环播放（回放压测用）：图片在打开时一次解码并缩放好，
+    之后每帧只是一次拷贝；所有帧统一成第一张图缩放后的尺寸。
+    当作文件源按 rate（默认 25）限速；播完直接从头接上，不经过 rewind（图片少时每轮都 rewind 会丢节拍）。
+    同一目录、同一 max_side 在进程内只解码一次，多路共享只读的缓存帧
+    """
+    name = "images"
+    EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+    _cache = {}                  # (目录, max_side) -> (帧列表, source_size, size)
+    _cache_lock = threading.Lock()
+
+    def __init__(self, source, **kwargs):
+        super().__init__(source, **kwargs)
+        if self.keyframes_only:
+            raise ValueError("图片目录没有关键帧")
+        if not os.path.isdir(str(source)):
+            raise IOError(f"不是图片目录 {source}")
+        key = (os.path.abspath(source), self.max_side)
+        # 加锁期间其他路等第一路解码完，而不是各自再解一遍
+        with self._cache_lock:
+            if key not in self._cache:
+                self._cache[key] = self._load(source, self.max_side)
+            self.frames, self.source_size, self.size = self._cache[key]
+        self.is_file = True
+        self.index = -1
+
+    @classmethod
+    def _load(cls, source, max_side):
+        frames, source_size, size = [], None, None
+        for name in sorted(os.listdir(source)):
+            if not name.lower().endswith(cls.EXTENSIONS):
+                continue
+            # imdecode 支持中文路径
+            image = cv2.imdecode(np.fromfile(os.path.join(source, name), np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            if not frames:
+                source_size = (image.shape[1], image.shape[0])
+                size = fit_size(*source_size, max_side)
+            if (image.shape[1], image.shape[0]) != size:
+                image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            image.flags.writeable = False
+            frames.append(image)
+        if not frames:
+            raise IOError(f"目录里没有可读的图片 {source}")
+        return frames, source_size, size
+
+    def grab(self):
+        self.index = (self.index + self.every_n) % len(self.frames)
+        return True
+
+    def retrieve(self):
+        if self.index < 0:
+            return False, None
+        # 帧会被放进队列、可能被就地画框，不能直接交出缓存的图
+        return True, self.frames[self.index].copy()
+
+    def rewind(self):
+        self.index = -1
+
+
+CAPTURE_BACKENDS = {
+    "pyav": PyAVCapture,
+    "ffmpeg": FFmpegPipeCapture,
+    "opencv": OpenCVCapture,
+    "images": ImageFolderCapture,
+}
+
+
+def open_capture(source, candidates=("pyav", "ffmpeg", "opencv"), **kwargs):
+    """
+    按顺序尝试解码后端，依赖缺失或打不开时回退到下一个
+    :param kwargs: max_side / every_n / keyframes_only / rate，见 Capture
+    """
+    errors = []
+    for kind in candidates:
+        try:
+            cap = CAPTURE_BACKENDS[kind](source, **kwargs)
+            if cap.is_file:
+                # 文件源先试读一帧，能打开但解不了码（如缺编解码器）时也回退
+                if not cap.grab():
+                    cap.release()
+                    raise IOError("读不到第一帧")
+                cap.rewind()
+            return cap
+        except Exception as e:
+            errors.append(f"{kind}: {e}")
+    raise RuntimeError(f"没有可用的解码后端 ({source}):\n  " + "\n  ".join(errors))
+
+
+def make_pacer(cap, enabled=True):
+    """返回每读一帧调用一次的节拍函数：文件源按输出帧率限速，实时流不限速（只取关键帧时帧率未知，也不限速）"""
+    fps = cap.output_fps()
+    if not enabled or not cap.is_file or not fps or fps <= 0:
+        return lambda frames=1: None
+
+    interval = 1.0 / fps
+    next_t = [time.perf_counter()]
+
+    def pace(frames=1):
+        """:param frames: 本次读过的输出帧数（skip() 一次跳过多帧时按实际帧数限速）"""
+        next_t[0] += interval * frames
+        delay = next_t[0] - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1.0:
+            # 落后太多（如被阻塞）时重新对齐，不追帧
+            next_t[0] = time.perf_counter()
+    return pace
+
+
+if __name__ == "__main__":
+    # 对比各后端的单帧解码耗时：python capture.py test1.mp4 640
+    import sys
+    import time
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "test1.mp4"
+    max_side = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    for kind in CAPTURE_BACKENDS:
+        for every_n, keyframes_only in ((1, False), (5, False), (1, True)):
+            try:
+                cap = CAPTURE_BACKENDS[kind](source, max_side=max_side, every_n=every_n, keyframes_only=keyframes_only)
+            except Exception as e:
+                print(f"{kind:<7} every_n={every_n} keyframes_only={keyframes_only}: 不可用 ({e})")
+                continue
+            n = 0
+            start = time.perf_counter()
+            while n < 200:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                n += 1
+            dt = time.perf_counter() - start
+            cap.release()
+            print(f"{kind:<7} every_n={every_n} keyframes_only={keyframes_only}: "
+                  f"{n} 帧 {cap.size[0]}x{cap.size[1]}，{dt / max(n, 1) * 1000:.2f} ms/帧")
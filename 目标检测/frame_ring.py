@@ -0,0 +1,225 @@
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from capture import make_pacer, open_capture
+
+
+class FrameRing:
+    """
+    解码与推理之间的共享内存帧环：每路 num_slots 个预分配的 HxWx3 槽位
+    生产者（解码进程）从该路的 free 队列取空槽，直接解码写入槽位，
+    再把 (stream_index, slot, 时间戳) 放进 ready 队列；消费者用完槽位后 release 归还。
+    队列里只传槽位索引，帧数据不经过 pickle，也没有逐帧分配。
+    """
+
+    def __init__(self, num_streams, num_slots, height, width, ctx=None):
+        ctx = ctx or mp.get_context()
+        self.num_streams = num_streams
+        self.num_slots = num_slots
+        self.shape = (num_streams, num_slots, height, width, 3)
+
+        size = int(np.prod(self.shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.frames = np.ndarray(self.shape, np.uint8, buffer=self.shm.buf)
+        self._owner = True
+
+        self.ready = ctx.Queue()
+        self.free = [ctx.Queue() for _ in range(num_streams)]
+        for s in range(num_streams):
+            for k in range(num_slots):
+                self.free[s].put(k)
+
+    # ---------- 跨进程传递：子进程按名字重新映射同一块共享内存 ----------
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["shm"], state["frames"]
+        state["shm_name"] = self.shm.name
+        return state
+
+    def __setstate__(self, state):
+        shm_name = state.pop("shm_name")
+        self.__dict__.update(state)
+        self._owner = False
+        try:
+            self.shm = shared_memory.SharedMemory(name=shm_name, track=False)
+        except TypeError:  # Python < 3.13
+            # 子进程与父进程共用同一个 resource_tracker，重复登记同名内存无副作用，
+            # 回收仍由父进程 close() 时 unlink 完成
+            self.shm = shared_memory.SharedMemory(name=shm_name)
+        self.frames = np.ndarray(self.shape, np.uint8, buffer=self.shm.buf)
+
+    # ---------- 生产者 ----------
+    def acquire(self, stream_index, timeout=None):
+        """取一个空槽，没有空槽（消费者跟不上）时返回 None"""
+        try:
+            return self.free[stream_index].get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def slot(self, stream_index, slot):
+        return self.frames[stream_index, slot]
+
+    def publish(self, stream_index, slot, ts=None):
+        self.ready.put((stream_index, slot, time.time() if ts is None else ts))
+
+    # ---------- 消费者 ----------
+    def get(self, timeout=None):
+        """返回 (stream_index, slot, ts)，超时抛 queue.Empty"""
+        return self.ready.get(timeout=timeout)
+
+    def release(self, stream_index, slot):
+        self.free[stream_index].put(slot)
+
+    def close(self):
+        # 解码进程已退出后，队列里残留的索引不必再送达
+        for q in [self.ready] + self.free:
+            q.cancel_join_thread()
+        self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # 仍有槽位视图未释放（如调度队列里的帧），映射随进程退出回收
+            pass
+        if self._owner:
+            self.shm.unlink()
+
+
+def read_into_slot(cap, slot_view):
+    """
+    解码一帧写入槽位：cap 为 capture.Capture，解码端已按 max_side 缩放，
+    尺寸与槽位一致时直接拷贝，否则缩放到槽位尺寸（不额外分配目标缓冲）
+    """
+    ok, frame = cap.read()
+    if not ok:
+        return False
+    h, w = slot_view.shape[:2]
+    if frame.shape[:2] == (h, w):
+        np.copyto(slot_view, frame)
+    else:
+        cv2.resize(frame, (w, h), dst=slot_view, interpolation=cv2.INTER_LINEAR)
+    return True
+
+
+def decode_worker(stream_index, video_path, ring, stop_event, candidates=("pyav", "ffmpeg", "opencv"),
+                  capture_options=None, pace_files=True, control=None):
+    """
+    解码进程：读视频 -> 写共享内存槽位 -> 发布槽位索引
+    与线程解码模式走同一条取帧路径：open_capture 按 candidates 回退，
+    capture_options（max_side / every_n / keyframes_only / rate）交给解码后端，文件源按输出帧率限速
+    :param control: admission.SharedStreamControl，准入控制停掉该路或调整抽帧间隔，为空时不受控
+    """
+    capture_options = capture_options or {}
+
+    def open_():
+        try:
+            return open_capture(video_path, candidates, **capture_options)
+        except RuntimeError as e:
+            print(f"[Stream {stream_index}] 无法打开视频 {video_path}: {e}")
+            return None
+
+    cap = open_()
+    if cap is None:
+        return
+    print(f"[Stream {stream_index}] 解码进程后端 {cap.name}，{cap.source_size[0]}x{cap.source_size[1]} -> "
+          f"{cap.size[0]}x{cap.size[1]}")
+    pace = make_pacer(cap, pace_files)
+
+    frame_index = 0
+    dropped = 0
+    try:
+        while not stop_event.is_set():
+            if control is not None and not control.active:
+                # 被准入控制停掉：断开视频源，等重新接入后再打开
+                cap.release()
+                cap = None
+                while not control.active and not stop_event.wait(0.5):
+                    pass
+                if stop_event.is_set():
+                    break
+                cap = open_()
+                if cap is None:
+                    break
+                pace = make_pacer(cap, pace_files)
+
+            pace()
+            # 准入控制降采样：只 grab 不转换
+            frame_index += 1
+            if control is not None and frame_index % control.every_n:
+                if not cap.grab():
+                    cap.rewind()
+                continue
+
+            slot = ring.acquire(stream_index, timeout=0.1)
+            if slot is None:
+                # 消费者跟不上，跳帧保持实时（PyAV 只解关键帧，其余后端照样解码）
+                passed = cap.skip()
+                if not passed:
+                    cap.rewind()
+                elif passed > 1:
+                    pace(passed - 1)
+                dropped += passed or 1
+                continue
+
+            if not read_into_slot(cap, ring.slot(stream_index, slot)):
+                ring.release(stream_index, slot)
+                cap.rewind()
+                continue
+
+            ring.publish(stream_index, slot)
+    finally:
+        if cap is not None:
+            cap.release()
+        print(f"[Stream {stream_index}] 解码进程已停止，丢帧 {dropped}")
+
+
+if __name__ == "__main__":
+    # 自检：spawn 出的解码进程经 open_capture 读图片目录写入槽位，主进程取出校验后归还
+    import os
+    import tempfile
+
+    from admission import SharedStreamControl
+
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as folder:
+        # 8 张 64x48 的纯色图，第 i 张像素值 i*10；解码端缩到长边 32
+        for i in range(8):
+            cv2.imwrite(os.path.join(folder, f"{i:02d}.png"), np.full((48, 64, 3), i * 10, np.uint8))
+
+        ring = FrameRing(1, 2, 24, 32, ctx=ctx)
+        stop = ctx.Event()
+        control = SharedStreamControl(ctx, every_n=2)
+        worker = ctx.Process(target=decode_worker, daemon=True,
+                             args=(0, folder, ring, stop, ("images",), {"max_side": 32, "rate": 200.0}, True, control))
+        worker.start()
+
+        values = []
+        while len(values) < 12:
+            stream_index, slot, _ = ring.get(timeout=30)
+            values.append(int(ring.slot(stream_index, slot)[0, 0, 0]))
+            ring.release(stream_index, slot)
+        stop.set()
+        worker.join(10)
+        assert worker.exitcode == 0
+
+        # every_n=2：只取第 1、3、5、7 张
+        assert set(values) <= {10, 30, 50, 70} and values[:4] == [10, 30, 50, 70], values
+        # 解码进程退出后，已发布未取走的槽位归还，所有槽位都应回到 free 队列
+        while True:
+            try:
+                stream_index, slot, _ = ring.get(timeout=0.5)
+            except queue.Empty:
+                break
+            ring.release(stream_index, slot)
+        free = []
+        k = ring.acquire(0, timeout=0.5)
+        while k is not None:
+            free.append(k)
+            k = ring.acquire(0, timeout=0.5)
+        assert sorted(free) == [0, 1], free
+        ring.close()
+    print(f"跨进程槽位自检通过：{values}")
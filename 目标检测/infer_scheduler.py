@@ -0,0 +1,207 @@
+import queue
+import threading
+import time
+
+
+class InferenceScheduler:
+    """
+    多路共享一个模型的推理调度器：
+    各路线程只负责解码并 submit 帧，单个推理线程按 max_batch_size / max_wait_ms
+    动态组 batch，推理后把结果按路回调给 on_result(stream_index, frame, result, meta)
+    """
+
+    def __init__(self, infer_fn, on_result, max_batch_size=8, max_wait_ms=10.0, max_queue=64, requests=None,
+                 tracer=None, stage_timings=None, roi=None, on_drop=None):
+        """
+        :param infer_fn: 批量推理函数，输入帧列表，返回等长的结果列表
+        :param on_result: 结果回调，在推理线程中调用，不要在里面做耗时操作
+        :param max_batch_size: 最大 batch
+        :param max_wait_ms: 凑 batch 的最长等待时间（从本 batch 第一帧到达开始计）
+        :param max_queue: 待推理队列长度上限
+        :param requests: 自定义的待推理队列（如 backpressure.FrameBuffer），为空时用 max_queue 建普通队列
+        :param tracer: tracing.Tracer，记录每帧的排队时间和推理各阶段耗时
+        :param stage_timings: 返回上一个 batch 分段时间 {stage: (start_ns, end_ns)} 的函数，
+                              为空时整个 infer_fn 记为 inference 阶段
+        :param roi: roi.RoiEngine，推理前把各帧裁到感兴趣区域，推理后映射回原图并按区域过滤
+        :param on_drop: 推理失败、整批没有结果或 on_result 抛异常时对该帧调用
+                        on_drop((stream_index, frame, t_submit_ns, meta))，
+                        与 backpressure.FrameBuffer 的 on_drop 同一约定，用于归还共享内存槽位等资源
+        """
+        self.infer_fn = infer_fn
+        self.on_result = on_result
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = requests if requests is not None else queue.Queue(maxsize=max_queue)
+        self.tracer = tracer
+        self.stage_timings = stage_timings
+        self.roi = roi
+        self.on_drop = on_drop
+        self.stop_event = threading.Event()
+        self.worker = threading.Thread(target=self._run, name="inference", daemon=True)
+
+        # 统计
+        self.num_batches = 0
+        self.num_frames = 0
+        self.num_rejected = 0
+        self.num_failed = 0     # 推理失败丢掉的帧
+        self.num_callback_errors = 0  # on_result 抛异常的帧
+        self.busy_time = 0.0    # 推理累计耗时（秒），用于估计推理线程占用率
+
+    def start(self):
+        self.worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        self.worker.join(timeout)
+
+    def submit(self, stream_index, frame, timeout=None, meta=None):
+        """
+        提交一帧，队列满时返回 False（由调用方决定丢帧还是重试）
+        :param meta: 随结果原样回传的附加信息（如共享内存槽位号）
+        """
+        try:
+            self.requests.put((stream_index, frame, time.perf_counter_ns(), meta), timeout=timeout)
+            return True
+        except queue.Full:
+            self.num_rejected += 1
+            return False
+
+    def qsize(self):
+        return self.requests.qsize()
+
+    def avg_batch_size(self):
+        return self.num_frames / self.num_batches if self.num_batches else 0.0
+
+    def _collect_batch(self):
+        """阻塞等第一帧，然后在截止时间前尽量凑满 batch"""
+        try:
+            first = self.requests.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self.requests.get_nowait())
+                else:
+                    batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            frames = [frame for _, frame, _, _ in batch]
+            started = time.perf_counter_ns()
+            try:
+                if self.roi is None:
+                    results = self.infer_fn(frames)
+                else:
+                    results = self.roi.detect(self.infer_fn, [s for s, _, _, _ in batch], frames)
+            except Exception as e:
+                print(f"[Scheduler] 推理失败，丢弃 {len(batch)} 帧: {e}")
+                self.num_failed += len(batch)
+                if self.on_drop is not None:
+                    for item in batch:
+                        self.on_drop(item)
+                continue
+            finished = time.perf_counter_ns()
+            self.busy_time += (finished - started) / 1e9
+
+            self.num_batches += 1
+            self.num_frames += len(batch)
+
+            if self.tracer is not None:
+                stages = self.stage_timings() if self.stage_timings else {"inference": (started, finished)}
+                for stream_index, _, submitted, _ in batch:
+                    self.tracer.record(stream_index, "queue_wait", submitted, started)
+                    self.tracer.record_stages(stream_index, stages)
+
+            for item, result in zip(batch, results):
+                stream_index, frame, _, meta = item
+                try:
+                    self.on_result(stream_index, frame, result, meta)
+                except Exception as e:
+                    # 回调出错只丢这一帧，推理线程不能跟着退出
+                    print(f"[Scheduler] 第 {stream_index} 路结果回调失败，丢弃该帧: {e!r}")
+                    self.num_callback_errors += 1
+                    if self.on_drop is not None:
+                        self.on_drop(item)
+
+
+if __name__ == "__main__":
+    # CPU 上的简单自检：用假推理函数验证组 batch 和按路分发
+    received = []
+
+    def fake_infer(frames):
+        time.sleep(0.005)
+        return [f * 10 for f in frames]
+
+    scheduler = InferenceScheduler(fake_infer, lambda s, f, r, m: received.append((s, f, r)),
+                                   max_batch_size=4, max_wait_ms=5).start()
+    for i in range(20):
+        scheduler.submit(i % 4, i)
+    time.sleep(0.5)
+    scheduler.stop()
+
+    assert sorted(f for _, f, _ in received) == list(range(20))
+    assert all(r == f * 10 and s == f % 4 for s, f, r in received)
+
+    # 推理失败的帧交给 on_drop，不会悄悄丢掉
+    dropped = []
+
+    def failing_infer(frames):
+        raise RuntimeError("boom")
+
+    failing = InferenceScheduler(failing_infer, lambda s, f, r, m: None, max_batch_size=4, max_wait_ms=5,
+                                 on_drop=dropped.append).start()
+    for i in range(6):
+        failing.submit(i % 2, i, meta=i)
+    time.sleep(0.3)
+    failing.stop()
+    assert sorted(m for _, _, _, m in dropped) == list(range(6)) and failing.num_failed == 6
+
+    # 用真实后端跑一遍：on_result 抛异常时推理线程继续工作，出错的帧交给 on_drop
+    # python infer_scheduler.py best.onnx
+    import os
+    import sys
+
+    import numpy as np
+
+    from backends import create_backend
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else "best.onnx"
+    try:
+        backend = create_backend([("onnxruntime", model_path), ("torch", os.path.splitext(model_path)[0] + ".pt")])
+    except RuntimeError as e:
+        print(f"跳过真实后端自检: {e}")
+    else:
+        results, callback_dropped = [], []
+
+        def flaky_result(s, f, r, m):
+            if m % 3 == 0:
+                raise ValueError(f"bad result {m}")
+            results.append(m)
+
+        real = InferenceScheduler(backend.detect, flaky_result, max_batch_size=4, max_wait_ms=5,
+                                  on_drop=callback_dropped.append).start()
+        frames = [np.full((360, 640, 3), i * 20, np.uint8) for i in range(12)]
+        for i, frame in enumerate(frames):
+            real.submit(i % 2, frame, meta=i)
+        deadline = time.time() + 60
+        while real.num_frames < len(frames) and time.time() < deadline:
+            time.sleep(0.05)
+        real.stop()
+        assert real.num_frames == len(frames)
+        assert sorted(results) == [i for i in range(12) if i % 3]
+        assert sorted(m for _, _, _, m in callback_dropped) == [0, 3, 6, 9] and real.num_callback_errors == 4
+        print(f"真实后端 {backend.name}：{real.num_batches} 个 batch，{real.num_callback_errors} 帧回调失败已归还")
+    print(f"批次数 {scheduler.num_batches}，平均 batch {scheduler.avg_batch_size():.2f}")
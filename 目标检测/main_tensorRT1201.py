@@ -1,52 +1,303 @@
 import cv2
+import json
 import threading
 import queue
 import os
 import time
-from ultralytics import YOLO
+import multiprocessing as mp
+
+from backends import create_backend
+from backpressure import FrameBuffer
+from adaptive_sampling import AdaptiveSampler
+from admission import AdmissionController, SharedStreamControl, StreamControl, run_admission
+from capture import open_capture, make_pacer
+from frame_ring import FrameRing, decode_worker
+from infer_scheduler import InferenceScheduler
+from motion_gate import MotionGate
+from render import RenderPool, VideoRecorder, MjpegServer
+from roi import RoiEngine, load_regions_from_db, load_regions_from_json
+from sharding import ShardSupervisor
+from sinks import ResultWriter, create_sink
+from tracker import TrackingStage
+from tracing import Tracer
 
 VIDEO_FILE = "test1.mp4"
 NUM_STREAMS = 4          # 先别直接 12，先试 4 看上限
 ENGINE_FILE = "best.engine"
 
-if not os.path.exists(VIDEO_FILE):
-    print(f"错误: 视频文件未找到: {VIDEO_FILE}")
-    exit()
+# 推理后端按顺序尝试，前一个不可用（文件不存在 / 依赖缺失 / 加载失败）时回退到下一个
+BACKEND_CANDIDATES = [
+    ("tensorrt", ENGINE_FILE),
+    ("onnxruntime", "best.onnx"),
+    ("openvino", "best_openvino_model"),
+    ("torch", "best.pt"),
+]
+IMGSZ = 640
+CONF_THRES = 0.25
+IOU_THRES = 0.45
+
+# 共享模型批量推理（False 时退回每路线程各自加载引擎）
+USE_SCHEDULER = True
+MAX_BATCH_SIZE = 8       # 模型最好按 dynamic batch 导出；静态 batch 的模型按其 batch 分块、不足一块时补空图，
+                         # 静态 batch 与 MAX_BATCH_SIZE 不一致时每块都有浪费
+MAX_WAIT_MS = 10         # 凑 batch 的最长等待时间
+
+# 解码方式（仅 USE_SCHEDULER 时生效）："thread" 同进程线程解码；
+# "process" 每路一个解码进程，帧写入共享内存环，进程间只传槽位索引
+DECODE_MODE = "thread"
+RING_SLOTS = 6           # 每路槽位数，需大于 推理队列 + 显示队列 中该路可能占用的帧数
+
+# 背压策略（见 backpressure.POLICIES），同时作用于推理队列和显示队列：
+# "block" 为旧行为；"drop_oldest" / "latest_only" 丢旧帧保实时；
+# "bounded_lag" 丢弃排队超过 MAX_LAG_MS 的帧，并让解码端跳过解码追上实时
+BACKPRESSURE = "bounded_lag"
+MAX_LAG_MS = 200
+# 视频文件按原始帧率读取，模拟实时摄像头（否则解码线程空转抢占推理的 CPU）
+PACE_FILE_SOURCES = True
+
+# 解码后端按顺序尝试（见 capture.CAPTURE_BACKENDS），依赖缺失或打不开时回退
+CAPTURE_CANDIDATES = ("pyav", "ffmpeg", "opencv")
+DECODE_MAX_SIDE = IMGSZ  # 解码端直接缩放到长边 = 模型输入尺寸，前处理不再缩放；None 保持原分辨率
+DECODE_EVERY_N = 1       # 每 N 帧只取 1 帧
+DECODE_KEYFRAMES_ONLY = False  # 只解码关键帧（OpenCV 后端不支持，会回退到其他后端）
+DECODE_RATE = None       # 按固定帧率回放文件源（回放压测用，见 replay_bench.py），None 为源帧率
+
+# 推理前的变化门控（见 motion_gate.METHODS）：画面无明显变化时不送检，复用该路上次的检测结果，
+# 但至少每 MOTION_KEEPALIVE_S 秒送检一次；夜间 / 空场景下可省下大部分推理
+MOTION_GATE = False
+MOTION_METHOD = "diff"
+MOTION_THRESHOLD = 0.004     # 变化像素占比阈值（在 160 宽的灰度小图上计算）
+MOTION_KEEPALIVE_S = 2.0
+
+# 感兴趣区域（见 roi.RoiEngine）：按配置界面 region_camera_ranges 中各摄像头的区域多边形，
+# 推理前只裁出区域附近（区域相距较远时拼成一张图），推理后只保留落点在区域内的检测。
+# ROI_SOURCE 为 "mysql" 时从配置库读取，否则为导出的 region_camera_ranges 行列表 JSON 文件；None 关闭
+ROI_SOURCE = None
+STREAM_CAMERAS = []      # 每路对应的 camera_id，如 ["cam_01", "cam_02", "cam_03", "cam_04"]
+ROI_DB = {"host": "localhost", "user": "root", "password": "1234", "database": "test_db"}
+ROI_FILL_OUTSIDE = False  # 裁剪范围内、区域外的像素涂灰
+
+# 跟踪（见 tracker.TrackingStage）：推理后给检测分配轨迹 ID；配置了 ROI 区域的路同时统计各区域
+# （等待区 / 行人区 / 禁行区）按类别的实时占用和进出事件，事件逐行写入 TRACK_EVENTS_PATH（JSONL）
+TRACKING = False
+TRACK_EVENTS_PATH = "track_events.jsonl"
+
+# 自适应抽帧检测（见 adaptive_sampling.AdaptiveSampler，会同时启用跟踪）：每路每 K 帧检测一次，
+# 中间帧用轨迹外推出框；K 随场景活跃度、轨迹数和推理队列压力在 [ADAPTIVE_K_MIN, ADAPTIVE_K_MAX] 之间变化
+ADAPTIVE_SAMPLING = False
+ADAPTIVE_K_MIN = 1
+ADAPTIVE_K_MAX = 8
+ADAPTIVE_MAX_DRIFT = 0.25  # K 帧内允许的外推位移（框高的倍数）
+
+# 显示方式："window" 渲染线程池画框、主线程 imshow；"headless" 不开窗口，
+# 没有录像 / MJPEG 输出时完全不画框。渲染按 DISPLAY_FPS 限速，与推理帧率解耦
+DISPLAY_MODE = "window"
+RENDER_WORKERS = 2
+DISPLAY_FPS = 15         # 每路渲染帧率上限
+RECORD_PATH = None       # 录像输出，如 "output/stream_{stream}.mp4"
+MJPEG_PORT = None        # MJPEG 推流端口，如 8080
+
+# 逐帧分阶段打点（见 tracing.STAGES）；进程解码模式下解码进程内的 capture/decode 不记录
+TRACE = True
+TRACE_DUMP_PATH = "trace_metrics.json"   # 周期性写出各路各阶段延迟分位数
+TRACE_DUMP_INTERVAL = 5.0
+TRACE_PORT = None                        # 拉取接口端口，如 9100：/metrics、/trace
+TRACE_EVENTS_PATH = "trace_events.json"  # 退出时导出最近的逐帧事件（Chrome trace 格式）
+
+# 准入控制（共享模型模式，线程 / 进程解码均可）：从 INITIAL_STREAMS 路起步，按实测容量增减路数（最多 NUM_STREAMS 路），
+# 或在 ADMISSION_ACTION="degrade" 时先降低各路抽帧率，尽量让每路推理帧率不低于 TARGET_STREAM_FPS
+ADMISSION = False
+INITIAL_STREAMS = 2
+TARGET_STREAM_FPS = 10
+ADMISSION_ACTION = "shed"
+ADMISSION_INTERVAL = 10.0
+CAPACITY_PATH = "node_capacity.json"    # 本节点容量估计，供上层调度读取
+
+# 执行方式："single" 单进程（上面的线程 / 解码进程模式）；
+# "sharded" 按路分到 NUM_SHARDS 个工作进程，各自加载模型、解码、推理并绑定一组 CPU，
+# 崩溃自动重启，结果（不含帧）和指标汇总到主进程，不开窗口
+EXECUTION_MODE = "single"
+NUM_SHARDS = 2
+SHARD_CPUS = None        # 如 [[0, 1, 2, 3], [4, 5, 6, 7]]，为空时均分可用核
+SHARD_METRICS_INTERVAL = 2.0
+
+# 检测结果输出（见 sinks.create_sink）：列式攒批后由后台线程写出，待写数据超过内存上限时丢弃新批次，不阻塞推理
+# 写出的框坐标为原图（摄像头分辨率）坐标，不受 DECODE_MAX_SIDE 影响
+# 如 [("jsonl", "detections.jsonl"), ("sqlite", "detections.db"), ("parquet", "detections_parquet"), ("mqtt", "local")]
+RESULT_SINKS = []
+RESULT_BATCH_ROWS = 4096
+RESULT_FLUSH_INTERVAL = 1.0
+RESULT_MAX_PENDING_MB = 64
+
+
+def release_dropped(item):
+    """背压丢帧回调：进程解码模式下归还被丢帧占用的共享内存槽位（槽位号在元组最后一项）"""
+    if ring is not None and item[-1] is not None:
+        ring.release(item[0], item[-1])
 
-if not os.path.exists(ENGINE_FILE):
-    print(f"错误: TensorRT引擎文件未找到: {ENGINE_FILE}")
-    exit()
 
-frame_queue = queue.Queue(maxsize=NUM_STREAMS * 5)
+frame_queue = FrameBuffer(BACKPRESSURE, NUM_STREAMS, capacity=NUM_STREAMS * 5,
+                          max_lag_ms=MAX_LAG_MS, on_drop=release_dropped)
 stop_event = threading.Event()
+ring = None
+stream_controls = [StreamControl(active=not ADMISSION or i < INITIAL_STREAMS) for i in range(NUM_STREAMS)]
+tracer = Tracer(NUM_STREAMS, enabled=TRACE)
+source_scales = [None] * NUM_STREAMS   # 每路解码帧 -> 原图的 (sx, sy)，写出结果时把框映射回原图
+result_writer = None
+motion_gate = MotionGate(NUM_STREAMS, MOTION_METHOD, MOTION_THRESHOLD,
+                         keepalive_s=MOTION_KEEPALIVE_S) if MOTION_GATE else None
+roi_engine = None
+tracking = None
+sampler = None
+
+
+def create_result_writer():
+    return ResultWriter([create_sink(kind, target) for kind, target in RESULT_SINKS],
+                        batch_rows=RESULT_BATCH_ROWS, flush_interval=RESULT_FLUSH_INTERVAL,
+                        max_pending_bytes=RESULT_MAX_PENDING_MB * 1024 * 1024).start()
+
+
+def create_roi_engine():
+    if ROI_SOURCE == "mysql":
+        regions = load_regions_from_db(STREAM_CAMERAS, **ROI_DB)
+    else:
+        regions = load_regions_from_json(ROI_SOURCE)
+    stream_regions = []
+    for i in range(NUM_STREAMS):
+        camera_id = STREAM_CAMERAS[i] if i < len(STREAM_CAMERAS) else None
+        stream_regions.append(regions.get(camera_id, []))
+        print(f"[Stream {i}] 摄像头 {camera_id}，ROI 区域 {len(stream_regions[-1])} 个")
+    return RoiEngine(stream_regions, fill_outside=ROI_FILL_OUTSIDE)
+
+
+def create_tracking(names, events_path):
+    events = open(events_path, "a", encoding="utf-8", buffering=1) if events_path else None
+    on_event = (lambda e: events.write(json.dumps(e, ensure_ascii=False) + "\n")) if events else None
+    return TrackingStage(NUM_STREAMS, roi=roi_engine, names=names, on_event=on_event), events
+
+
+def create_sampler():
+    return AdaptiveSampler(tracking, NUM_STREAMS, k_min=ADAPTIVE_K_MIN, k_max=ADAPTIVE_K_MAX,
+                           max_drift=ADAPTIVE_MAX_DRIFT)
+
+
+def load_backend():
+    return create_backend(BACKEND_CANDIDATES, imgsz=IMGSZ, conf_thres=CONF_THRES, iou_thres=IOU_THRES)
+
+
+def capture_options():
+    """解码参数，线程解码和进程解码（frame_ring.decode_worker）共用"""
+    return {"max_side": DECODE_MAX_SIDE, "every_n": DECODE_EVERY_N,
+            "keyframes_only": DECODE_KEYFRAMES_ONLY, "rate": DECODE_RATE}
+
+
+def open_stream(stream_index, video_path):
+    try:
+        cap = open_capture(video_path, CAPTURE_CANDIDATES, **capture_options())
+    except RuntimeError as e:
+        print(f"[Stream {stream_index}] 无法打开视频 {video_path}: {e}")
+        return None
+    print(f"[Stream {stream_index}] 解码后端 {cap.name}，{cap.source_size[0]}x{cap.source_size[1]} -> "
+          f"{cap.size[0]}x{cap.size[1]}")
+    source_scales[stream_index] = (cap.source_size[0] / cap.size[0], cap.source_size[1] / cap.size[1])
+    if roi_engine is not None:
+        roi_engine.set_source_size(stream_index, cap.source_size)
+    return cap
+
+
+def to_source(stream_index, det):
+    """
+    检测框从解码帧坐标映射回原图坐标，用于写出 / 上报；
+    画框、跟踪、ROI 判定都在解码帧上进行，仍用帧坐标
+    """
+    scale = source_scales[stream_index]
+    if scale is None or scale == (1.0, 1.0) or not len(det):
+        return det
+    return det.scaled(*scale)
+
+
+def read_frame(cap, stream_index):
+    """grab + retrieve 分开计时，等价于 cap.read()"""
+    t0 = time.perf_counter_ns()
+    if not cap.grab():
+        return False, None
+    t1 = time.perf_counter_ns()
+    ok, frame = cap.retrieve()
+    t2 = time.perf_counter_ns()
+    tracer.record(stream_index, "capture", t0, t1)
+    tracer.record(stream_index, "decode", t1, t2)
+    return ok, frame
+
+
+def skip_frame(cap, pace, buffer, stream_index):
+    """
+    积压时跳帧：PyAV 后端只解关键帧，直接跳到下一个 GOP，并按跳过的帧数补上文件源的节拍；
+    OpenCV 等后端没有跳过解码的接口，帧照样解码，计为解码后丢弃（discarded）而不是跳过解码（skipped）
+    """
+    passed = cap.skip()
+    if not passed:
+        cap.rewind()
+        return
+    if passed > 1:
+        pace(passed - 1)
+    buffer.record_skip(stream_index, passed, decoded=not cap.skips_decode)
 
 
 def process_stream(stream_index, video_path):
-    """每个线程自己加载一个 YOLO(engine)，只做推理，不做可视化"""
+    """每个线程自己加载一个推理后端，只做推理，不做可视化"""
     print(f"[Stream {stream_index}] 正在加载引擎...")
-    model = YOLO(ENGINE_FILE)
+    backend = load_backend()
     print(f"[Stream {stream_index}] 引擎加载完成")
+    if tracking is not None:
+        tracking.names = backend.names
 
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"[Stream {stream_index}] 无法打开视频 {video_path}")
+    cap = open_stream(stream_index, video_path)
+    if cap is None:
         return
 
+    pace = make_pacer(cap, PACE_FILE_SOURCES)
     frame_counter = 0
     start_time = time.time()
     try:
         while not stop_event.is_set():
-            ok, frame = cap.read()
+            pace()
+            # 显示端积压时跳帧追上实时
+            if frame_queue.should_skip(stream_index):
+                skip_frame(cap, pace, frame_queue, stream_index)
+                continue
+
+            ok, frame = read_frame(cap, stream_index)
             if not ok:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                cap.rewind()
                 continue
 
-            # 纯推理
-            results = model(frame, verbose=False)
+            if sampler is not None and not sampler.should_detect(stream_index):
+                # 中间帧：轨迹外推
+                results = [sampler.propagate(stream_index)]
+            elif motion_gate is not None and not motion_gate.check(stream_index, frame):
+                # 画面没变，复用上次结果
+                results = [gated_result(stream_index)]
+            else:
+                # 纯推理
+                if sampler is not None:
+                    sampler.begin_detection(stream_index, frame)
+                if roi_engine is not None:
+                    results = roi_engine.detect(backend.detect, [stream_index], [frame])
+                else:
+                    results = backend.detect([frame])
+                tracer.record_stages(stream_index, backend.last_timings)
+                if motion_gate is not None:
+                    motion_gate.remember(stream_index, results[0])
+                if sampler is not None:
+                    sampler.on_detection(stream_index, results[0], frame.shape, time.time(), frame)
+                elif tracking is not None:
+                    tracking.update(stream_index, results[0], frame.shape, time.time())
+            if result_writer is not None:
+                result_writer.add(stream_index, time.time(), to_source(stream_index, results[0]))
 
             # 把 原始帧 + 结果 交给主线程画
             try:
-                frame_queue.put((stream_index, frame, results[0]), timeout=1)
+                frame_queue.put((stream_index, frame, results[0], None), timeout=1)
             except queue.Full:
                 pass
 
@@ -61,40 +312,419 @@ def process_stream(stream_index, video_path):
         print(f"[Stream {stream_index}] 已停止")
 
 
-if __name__ == "__main__":
-    # 创建显示窗口
-    for i in range(NUM_STREAMS):
-        cv2.namedWindow(f"Stream {i}", cv2.WINDOW_NORMAL)
+def decode_stream(stream_index, video_path, scheduler):
+    """共享模型模式：线程只解码并提交给调度器，推理由调度器统一组 batch 完成"""
+    cap = open_stream(stream_index, video_path)
+    if cap is None:
+        return
 
-    threads = []
+    requests = scheduler.requests
+    control = stream_controls[stream_index]
+    pace = make_pacer(cap, PACE_FILE_SOURCES)
+    frame_index = 0
+    frame_counter = 0
+    start_time = time.time()
+    try:
+        while not stop_event.is_set():
+            if not control.active:
+                # 被准入控制停掉：断开视频源，等重新接入后再打开
+                cap.release()
+                cap = None
+                while not control.active and not stop_event.wait(0.5):
+                    pass
+                if stop_event.is_set():
+                    break
+                cap = open_stream(stream_index, video_path)
+                if cap is None:
+                    break
+                pace = make_pacer(cap, PACE_FILE_SOURCES)
+
+            pace()
+            # 准入控制降采样：只 grab 不转换
+            frame_index += 1
+            if frame_index % control.every_n:
+                if not cap.grab():
+                    cap.rewind()
+                continue
+            # 推理积压时跳帧追上实时
+            if requests.should_skip(stream_index):
+                skip_frame(cap, pace, requests, stream_index)
+                continue
+
+            ok, frame = read_frame(cap, stream_index)
+            if not ok:
+                cap.rewind()
+                continue
+
+            if sampler is not None and not sampler.should_detect(stream_index, requests.qsize() / requests.capacity):
+                publish_result(stream_index, frame, sampler.propagate(stream_index))
+                continue
+            if motion_gate is not None and not motion_gate.check(stream_index, frame):
+                publish_result(stream_index, frame, gated_result(stream_index))
+                continue
+            if sampler is not None:
+                sampler.begin_detection(stream_index, frame)
+
+            # 推理队列满时按背压策略丢帧
+            if not scheduler.submit(stream_index, frame, timeout=1):
+                continue
+
+            frame_counter += 1
+            if time.time() - start_time > 1:
+                fps = frame_counter / (time.time() - start_time)
+                c = requests.counters[stream_index]
+                print(f"[Stream {stream_index}] 提交 FPS: {fps:.2f}，"
+                      f"推理队列 {scheduler.qsize()}，平均 batch {scheduler.avg_batch_size():.2f}，"
+                      f"已推理 {c.processed} 丢帧 {c.dropped} 跳过解码 {c.skipped} 解码后丢弃 {c.discarded}"
+                      + (f"，门控跳过 {motion_gate.counters[stream_index].gated}" if motion_gate is not None else "")
+                      + (f"，检测间隔 K={sampler.k[stream_index]}" if sampler is not None else ""))
+                frame_counter = 0
+                start_time = time.time()
+    finally:
+        if cap is not None:
+            cap.release()
+        print(f"[Stream {stream_index}] 已停止")
+
+
+def probe_frame_size(video_path):
+    """
+    共享内存槽位尺寸：用解码进程同样的后端和参数试开一次（与线程解码模式一样按 DECODE_MAX_SIDE 缩放），
+    顺带设置各路映射回原图的比例
+    """
+    cap = open_stream(0, video_path)
+    if cap is None:
+        raise RuntimeError(f"无法打开视频 {video_path}")
+    cap.release()
     for i in range(NUM_STREAMS):
-        t = threading.Thread(target=process_stream, args=(i, VIDEO_FILE))
+        source_scales[i] = source_scales[0]
+        if roi_engine is not None:
+            roi_engine.set_source_size(i, cap.source_size)
+    return cap.size[1], cap.size[0]
+
+
+def feed_from_ring(ring, scheduler):
+    """进程解码模式：把共享内存环里就绪的槽位（零拷贝视图）提交给调度器"""
+    while not stop_event.is_set():
+        try:
+            stream_index, slot, _ = ring.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        frame = ring.slot(stream_index, slot)
+        requests = scheduler.requests
+        if sampler is not None and not sampler.should_detect(stream_index, requests.qsize() / requests.capacity):
+            publish_result(stream_index, frame, sampler.propagate(stream_index), slot)
+            continue
+        if motion_gate is not None and not motion_gate.check(stream_index, frame):
+            publish_result(stream_index, frame, gated_result(stream_index), slot)
+            continue
+        if sampler is not None:
+            sampler.begin_detection(stream_index, frame)
+        if not scheduler.submit(stream_index, frame, timeout=1, meta=slot):
+            ring.release(stream_index, slot)
+
+
+def create_scheduler(backend):
+    return InferenceScheduler(
+        backend.detect,
+        on_inference_result,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait_ms=MAX_WAIT_MS,
+        requests=FrameBuffer(BACKPRESSURE, NUM_STREAMS, capacity=MAX_BATCH_SIZE * 2,
+                             max_lag_ms=MAX_LAG_MS, on_drop=release_dropped),
+        tracer=tracer,
+        stage_timings=lambda: backend.last_timings,
+        roi=roi_engine,
+        on_drop=release_dropped,
+    ).start()
+
+
+def on_inference_result(stream_index, frame, result, slot=None):
+    """调度器回调"""
+    if motion_gate is not None:
+        motion_gate.remember(stream_index, result)
+    if sampler is not None:
+        sampler.on_detection(stream_index, result, frame.shape, time.time(), frame)
+    elif tracking is not None:
+        tracking.update(stream_index, result, frame.shape, time.time())
+    publish_result(stream_index, frame, result, slot)
+
+
+def gated_result(stream_index):
+    """被变化门控跳过的帧：复用上次结果；开了自适应抽帧时改为外推，跟踪器的帧号要跟上"""
+    if sampler is not None:
+        return sampler.propagate(stream_index)
+    return motion_gate.last(stream_index)
+
+
+def publish_result(stream_index, frame, result, slot=None):
+    """结果写出，原始帧 + 结果 交给主线程画"""
+    if result_writer is not None:
+        result_writer.add(stream_index, time.time(), to_source(stream_index, result))
+    try:
+        frame_queue.put_nowait((stream_index, frame, result, slot))
+    except queue.Full:
+        if slot is not None:
+            ring.release(stream_index, slot)
+
+
+def collect_shard_metrics(scheduler, stream_indexes):
+    latency = tracer.snapshot()["streams"]
+    streams = {}
+    for i in stream_indexes:
+        streams[str(i)] = {
+            "inference": scheduler.requests.counters[i].as_dict(),
+            "results": frame_queue.counters[i].as_dict(),
+            "latency": latency.get(str(i), {}),
+        }
+        if motion_gate is not None:
+            streams[str(i)]["motion_gate"] = motion_gate.counters[i].as_dict()
+        if tracking is not None:
+            streams[str(i)]["tracking"] = {**tracking.stats()[i], "occupancy": tracking.occupancy(i)}
+        if sampler is not None:
+            streams[str(i)]["sampling"] = sampler.stats()[i]
+    return {"avg_batch_size": scheduler.avg_batch_size(), "num_batches": scheduler.num_batches,
+            "failed_frames": scheduler.num_failed, "callback_errors": scheduler.num_callback_errors,
+            "streams": streams}
+
+
+def shard_worker(shard_id, stream_indexes, result_queue, shard_stop):
+    """分片工作进程：只处理分到的几路，检测结果（不含帧）和指标发回主进程"""
+    global roi_engine, tracking, sampler
+    if ROI_SOURCE:
+        roi_engine = create_roi_engine()
+    backend = load_backend()
+    events = None
+    if TRACKING or ADAPTIVE_SAMPLING:
+        # 各分片各写一个事件文件
+        root, ext = os.path.splitext(TRACK_EVENTS_PATH) if TRACKING and TRACK_EVENTS_PATH else (None, None)
+        tracking, events = create_tracking(backend.names, root and f"{root}.shard{shard_id}{ext}")
+    if ADAPTIVE_SAMPLING:
+        sampler = create_sampler()
+    scheduler = create_scheduler(backend)
+    threads = [threading.Thread(target=decode_stream, args=(i, VIDEO_FILE, scheduler)) for i in stream_indexes]
+    for t in threads:
         t.start()
-        threads.append(t)
 
-    total_frames = 0
-    t0 = time.time()
+    last_report = time.time()
     try:
-        while True:
+        while not shard_stop.is_set():
             try:
-                stream_index, frame, result = frame_queue.get(timeout=1)
+                stream_index, _, result, _ = frame_queue.get(timeout=0.1)
             except queue.Empty:
-                if not any(t.is_alive() for t in threads):
-                    break
-                continue
+                pass
+            else:
+                try:
+                    result_queue.put_nowait(("result", stream_index, time.time(), to_source(stream_index, result)))
+                except queue.Full:
+                    pass
+            if time.time() - last_report > SHARD_METRICS_INTERVAL:
+                last_report = time.time()
+                try:
+                    result_queue.put_nowait(("metrics", shard_id, collect_shard_metrics(scheduler, stream_indexes)))
+                except queue.Full:
+                    pass
+    finally:
+        stop_event.set()
+        for t in threads:
+            t.join()
+        scheduler.stop()
+        if events is not None:
+            events.close()
 
-            annotated = result.plot(img=frame)
-            total_frames += 1
 
-            cv2.imshow(f"Stream {stream_index}", annotated)
+def run_sharded():
+    on_result = result_writer.add if result_writer is not None else None
+    supervisor = ShardSupervisor(shard_worker, NUM_STREAMS, NUM_SHARDS, cpus=SHARD_CPUS, on_result=on_result).start()
+    t0 = time.time()
+    try:
+        while True:
+            time.sleep(5)
+            metrics = supervisor.metrics()
+            for shard_id, m in metrics["shards"].items():
+                print(f"[Shard {shard_id}] alive={m['alive']} 重启 {m['restarts']} 次，"
+                      f"平均 batch {m.get('avg_batch_size', 0):.2f}")
+            for i, m in sorted(metrics["streams"].items(), key=lambda kv: int(kv[0])):
+                print(f"[Stream {i}] 结果 FPS: {m['collected'] / (time.time() - t0):.2f}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+
+
+def consume_results(render_pool, threads, show=True):
+    """
+    主线程：取推理结果交给渲染线程池（或直接丢弃），并显示渲染好的画面
+    推理线程只往 frame_queue 放结果，这里慢了只会按背压策略丢结果，不会拖慢推理
+    :return: 取到的结果帧数
+    """
+    total_frames = 0
+    while not stop_event.is_set():
+        try:
+            stream_index, frame, result, slot = frame_queue.get(timeout=0.005 if show else 0.5)
+        except queue.Empty:
+            if not any(t.is_alive() for t in threads):
+                break
+        else:
+            total_frames += 1
+            release = None if slot is None else (lambda s=stream_index, k=slot: ring.release(s, k))
+            accepted = render_pool is not None and render_pool.submit(stream_index, frame, result, release)
+            if not accepted and release is not None:
+                release()
 
+        if show:
+            for i, image in render_pool.pop_latest():
+                cv2.imshow(f"Stream {i}", image)
             if cv2.waitKey(1) & 0xFF == ord('q'):
-                stop_event.set()
                 break
+    return total_frames
+
+
+if __name__ == "__main__":
+    if not os.path.exists(VIDEO_FILE):
+        print(f"错误: 视频文件未找到: {VIDEO_FILE}")
+        exit()
+
+    if RESULT_SINKS:
+        result_writer = create_result_writer()
+    if ROI_SOURCE and EXECUTION_MODE != "sharded":
+        roi_engine = create_roi_engine()
+
+    if EXECUTION_MODE == "sharded":
+        try:
+            run_sharded()
+        finally:
+            if result_writer is not None:
+                result_writer.close()
+        exit()
+
+    # 创建显示窗口
+    if DISPLAY_MODE == "window":
+        for i in range(NUM_STREAMS):
+            cv2.namedWindow(f"Stream {i}", cv2.WINDOW_NORMAL)
+
+    scheduler = None
+    threads = []
+    names = {}
+    track_events = None
+    if TRACKING or ADAPTIVE_SAMPLING:
+        tracking, track_events = create_tracking(names, TRACK_EVENTS_PATH if TRACKING else None)
+    if ADAPTIVE_SAMPLING:
+        sampler = create_sampler()
+    if USE_SCHEDULER:
+        print("正在加载引擎...")
+        backend = load_backend()
+        names = backend.names
+        if tracking is not None:
+            tracking.names = names
+        print("引擎加载完成")
+        scheduler = create_scheduler(backend)
+        if DECODE_MODE == "process":
+            # spawn：避免 fork 出已初始化 CUDA 的进程
+            ctx = mp.get_context("spawn")
+            decode_stop = ctx.Event()
+            frame_h, frame_w = probe_frame_size(VIDEO_FILE)
+            ring = FrameRing(NUM_STREAMS, RING_SLOTS, frame_h, frame_w, ctx=ctx)
+            # 准入控制的开关和抽帧间隔放进共享内存，解码进程逐帧读取
+            stream_controls = [SharedStreamControl(ctx, c.active, c.every_n) for c in stream_controls]
+            for i in range(NUM_STREAMS):
+                p = ctx.Process(target=decode_worker, daemon=True,
+                                args=(i, VIDEO_FILE, ring, decode_stop, CAPTURE_CANDIDATES, capture_options(),
+                                      PACE_FILE_SOURCES, stream_controls[i]))
+                p.start()
+                threads.append(p)
+            t = threading.Thread(target=feed_from_ring, args=(ring, scheduler))
+            t.start()
+            threads.append(t)
+        else:
+            for i in range(NUM_STREAMS):
+                t = threading.Thread(target=decode_stream, args=(i, VIDEO_FILE, scheduler))
+                t.start()
+                threads.append(t)
+        if ADMISSION:
+            controller = AdmissionController(stream_controls, TARGET_STREAM_FPS, action=ADMISSION_ACTION)
+            run_admission(controller, scheduler, stop_event, ADMISSION_INTERVAL, CAPACITY_PATH)
+    else:
+        for i in range(NUM_STREAMS):
+            t = threading.Thread(target=process_stream, args=(i, VIDEO_FILE))
+            t.start()
+            threads.append(t)
+
+    render_pool = None
+    outputs = []
+    if RECORD_PATH:
+        outputs.append(VideoRecorder(RECORD_PATH, fps=DISPLAY_FPS))
+    if MJPEG_PORT:
+        outputs.append(MjpegServer(port=MJPEG_PORT))
+        print(f"MJPEG: http://<本机IP>:{MJPEG_PORT}/stream/0 ~ /stream/{NUM_STREAMS - 1}")
+    if DISPLAY_MODE == "window" or outputs:
+        render_pool = RenderPool(NUM_STREAMS, names, RENDER_WORKERS, DISPLAY_FPS, outputs, tracer=tracer).start()
+    if TRACE:
+        if TRACE_DUMP_PATH:
+            tracer.start_periodic_dump(TRACE_DUMP_PATH, TRACE_DUMP_INTERVAL)
+        if TRACE_PORT:
+            tracer.serve(port=TRACE_PORT)
+            print(f"延迟指标: http://<本机IP>:{TRACE_PORT}/metrics")
+
+    total_frames = 0
+    t0 = time.time()
+    try:
+        total_frames = consume_results(render_pool, threads, show=DISPLAY_MODE == "window")
     finally:
+        stop_event.set()
+        if ring is not None:
+            decode_stop.set()
         for t in threads:
             t.join()
-        cv2.destroyAllWindows()
+        if scheduler is not None:
+            scheduler.stop()
+        if render_pool is not None:
+            render_pool.stop()
+        if ring is not None:
+            ring.close()
+        if result_writer is not None:
+            result_writer.close()
+        if track_events is not None:
+            track_events.close()
+        if DISPLAY_MODE == "window":
+            cv2.destroyAllWindows()
+        if TRACE:
+            tracer.close()
+            if TRACE_DUMP_PATH:
+                tracer.dump_json(TRACE_DUMP_PATH)
+            if TRACE_EVENTS_PATH:
+                tracer.export_chrome_trace(TRACE_EVENTS_PATH)
+            for stage, s in tracer.snapshot()["total"].items():
+                print(f"[{stage:<11}] p50 {s['p50_ms']:7.2f} ms  p99 {s['p99_ms']:7.2f} ms  "
+                      f"max {s['max_ms']:7.2f} ms  ({s['count']} 次)")
         dt = time.time() - t0
         if dt > 0:
-            print(f"\n总帧数: {total_frames}, 总时间: {dt:.2f}s, 平均显示 FPS: {total_frames/dt:.2f}")
+            print(f"\n总帧数: {total_frames}, 总时间: {dt:.2f}s, 平均结果 FPS: {total_frames/dt:.2f}")
+        if result_writer is not None:
+            print(f"结果写出 {result_writer.rows_written} 条，内存超限丢弃 {result_writer.rows_dropped} 条")
+        if render_pool is not None:
+            print(f"渲染 {render_pool.num_rendered} 帧，限速跳过 {render_pool.num_skipped}，"
+                  f"渲染队列满丢弃 {render_pool.num_dropped}")
+        for i, c in enumerate(frame_queue.stats()):
+            line = f"[Stream {i}] 结果 {c['processed']} 结果丢帧 {c['dropped']}"
+            if scheduler is not None:
+                r = scheduler.requests.counters[i]
+                line += f"，推理 {r.processed} 推理丢帧 {r.dropped} 跳过解码 {r.skipped} 解码后丢弃 {r.discarded}"
+            else:
+                line += f" 跳过解码 {c['skipped']} 解码后丢弃 {c['discarded']}"
+            if roi_engine is not None:
+                r = roi_engine.stats()[i]
+                line += f"，ROI {r['mode']} 像素占比 {r['pixel_ratio']} 保留 {r['kept']} 区域外过滤 {r['filtered']}"
+            if motion_gate is not None:
+                g = motion_gate.counters[i].as_dict()
+                line += f"，门控送检 {g['passed']}（保活 {g['keepalive']}）跳过 {g['gated']}，送检比例 {g['pass_ratio']:.0%}"
+            if sampler is not None:
+                a = sampler.stats()[i]
+                line += (f"，送检比例 {a['effective_rate']:.0%}（平均 K {a['avg_k']}），"
+                         f"外推召回 {a['drift_recall']} IoU {a['drift_iou']}")
+            if tracking is not None:
+                t = tracking.stats()[i]
+                line += f"，轨迹 {t['next_id'] - 1} 条（当前 {t['tracks']}），区域进出事件 {t['events']}"
+            print(line)
+            if tracking is not None:
+                for region_id, o in tracking.occupancy(i).items():
+                    print(f"    区域 {region_id}（{o['category']}）当前: {o['counts']}")
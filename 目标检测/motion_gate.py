@@ -0,0 +1,141 @@
+import time
+
+import cv2
+import numpy as np
+
+# diff:        与上次送检那一帧比较（而不是上一帧），缓慢移动的目标也会逐渐累积出差异，
+#              复用的检测结果始终对应“自上次检测以来画面没怎么变”
+# background:  滑动平均背景模型，长时间静止的目标会融入背景，适合光照缓变的场景
+METHODS = ("diff", "background")
+
+
+class GateCounters:
+    __slots__ = ("passed", "gated", "keepalive")
+
+    def __init__(self):
+        self.passed = 0     # 送检（含保活）
+        self.gated = 0      # 画面无变化，复用上次结果
+        self.keepalive = 0  # 无变化但到了保活间隔，仍送检
+
+    def as_dict(self):
+        total = self.passed + self.gated
+        return {"passed": self.passed, "gated": self.gated, "keepalive": self.keepalive,
+                "pass_ratio": round(self.passed / total, 3) if total else 0.0}
+
+
+class MotionGate:
+    """
+    推理前的变化门控：每路把帧缩到 width 宽的灰度小图，与参考图做差，
+    变化像素占比超过 threshold 才送检，否则复用该路上次的检测结果；
+    至少每 keepalive_s 秒送检一次，检测到变化后再连续送检 hold_frames 帧（目标离开画面的尾巴）
+    """
+
+    def __init__(self, num_streams, method="diff", threshold=0.004, pixel_threshold=25, width=160,
+                 alpha=0.05, keepalive_s=2.0, hold_frames=5):
+        """
+        :param threshold: 变化像素占比阈值
+        :param pixel_threshold: 灰度差超过该值的像素算变化
+        :param alpha: background 方法的背景更新速率
+        """
+        if method not in METHODS:
+            raise ValueError(f"未知的门控方法 {method}，可选: {', '.join(METHODS)}")
+        self.method = method
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.width = width
+        self.alpha = alpha
+        self.keepalive_s = keepalive_s
+        self.hold_frames = hold_frames
+
+        self.reference = [None] * num_streams   # diff: uint8 小图；background: float32 背景
+        self.last_pass = [0.0] * num_streams
+        self.hold = [0] * num_streams
+        self.last_result = [None] * num_streams
+        self.counters = [GateCounters() for _ in range(num_streams)]
+        self.change = [0.0] * num_streams       # 最近一次的变化像素占比
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, round(h * self.width / w)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def check(self, stream_index, frame, now=None):
+        """
+        :return: True 表示需要送检；False 表示复用 last(stream_index)
+        同一路只能在一个线程里调用
+        """
+        now = time.perf_counter() if now is None else now
+        small = self._small(frame)
+        ref = self.reference[stream_index]
+        c = self.counters[stream_index]
+
+        if ref is None or ref.shape != small.shape or self.last_result[stream_index] is None:
+            self._reset_reference(stream_index, small)
+            return self._pass(stream_index, now)
+
+        if self.method == "background":
+            diff = cv2.absdiff(small, cv2.convertScaleAbs(ref))
+            cv2.accumulateWeighted(small, ref, self.alpha)
+        else:
+            diff = cv2.absdiff(small, ref)
+        change = np.count_nonzero(diff > self.pixel_threshold) / diff.size
+        self.change[stream_index] = change
+
+        if change > self.threshold:
+            self.hold[stream_index] = self.hold_frames
+        elif self.hold[stream_index] > 0:
+            self.hold[stream_index] -= 1
+        elif now - self.last_pass[stream_index] >= self.keepalive_s:
+            c.keepalive += 1
+        else:
+            c.gated += 1
+            return False
+
+        if self.method == "diff":
+            self.reference[stream_index] = small
+        return self._pass(stream_index, now)
+
+    def _reset_reference(self, stream_index, small):
+        self.reference[stream_index] = small.astype(np.float32) if self.method == "background" else small
+
+    def _pass(self, stream_index, now):
+        self.last_pass[stream_index] = now
+        self.counters[stream_index].passed += 1
+        return True
+
+    def remember(self, stream_index, result):
+        """记下该路最新的检测结果，供被门控的帧复用"""
+        self.last_result[stream_index] = result
+
+    def last(self, stream_index):
+        return self.last_result[stream_index]
+
+    def stats(self):
+        return [c.as_dict() for c in self.counters]
+
+
+if __name__ == "__main__":
+    # 自检：静止画面只按保活间隔送检，出现运动目标时逐帧送检，目标离开后再送检 hold_frames 帧
+    rng = np.random.default_rng(0)
+    base = rng.integers(60, 120, (360, 640, 3), dtype=np.uint8)
+    for method in METHODS:
+        gate = MotionGate(1, method=method, keepalive_s=1.0, hold_frames=3)
+        decisions = []
+        for i in range(100):
+            frame = base.copy()
+            # 传感器噪声
+            frame = cv2.add(frame, rng.integers(0, 6, frame.shape, dtype=np.uint8))
+            if 40 <= i < 60:
+                x = 100 + (i - 40) * 15
+                frame[150:250, x:x + 60] = 255
+            passed = gate.check(0, frame, now=i * 0.04)
+            if passed:
+                gate.remember(0, "det")
+            decisions.append(passed)
+        assert all(decisions[40:63]), method
+        # background 方法下目标经过处会留下逐渐淡去的残影，多等几帧
+        assert not any(decisions[70:85]), method
+        assert sum(decisions[:40]) <= 3, (method, sum(decisions[:40]))
+        print(f"motion_gate 自检通过 ({method})", gate.stats()[0])
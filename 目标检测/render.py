@@ -0,0 +1,236 @@
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+
+def _class_color(cls_id):
+    # 固定的按类别取色
+    return (int(37 * cls_id + 80) % 256, int(17 * cls_id + 160) % 256, int(101 * cls_id + 40) % 256)
+
+
+def draw_detections(frame, det, names=None, copy=True, out=None):
+    """
+    在帧上画检测框
+    :param det: backends.Detections
+    :param copy: False 时直接画在 frame 上
+    :param out: 预分配的同尺寸画布，给出时把 frame 拷进去再画（不分配新内存）
+    """
+    if out is not None:
+        np.copyto(out, frame)
+        img = out
+    else:
+        img = frame.copy() if copy else frame
+    names = names or {}
+    for (x1, y1, x2, y2), conf, cls_id in zip(det.xyxy.astype(int), det.conf, det.cls):
+        color = _class_color(int(cls_id))
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
+        label = f"{names.get(int(cls_id), int(cls_id))} {conf:.2f}"
+        cv2.putText(img, label, (x1, max(y1 - 4, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    return img
+
+
+# ============================================================
+# 异步渲染：推理结果 -> 渲染线程池 -> 显示 / 录像 / MJPEG
+# ============================================================
+class RenderPool:
+    """
+    渲染线程池：按 display_fps 对每路限速后，在预分配画布上画框，再交给各输出。
+    限速和排队都在 submit 里丢帧，不会阻塞推理线程；cv2 绘图释放 GIL，多线程能并行。
+    """
+
+    def __init__(self, num_streams, names=None, num_workers=2, display_fps=15.0, outputs=(), max_queue=None,
+                 tracer=None):
+        """
+        :param display_fps: 每路最大渲染帧率，<=0 表示不限速
+        :param outputs: 渲染结果的去向，需实现 write(stream_index, image)
+        :param tracer: tracing.Tracer，记录每帧 render 阶段耗时
+        """
+        self.names = names or {}
+        self.tracer = tracer
+        self.outputs = list(outputs)
+        self.min_interval = 1.0 / display_fps if display_fps and display_fps > 0 else 0.0
+        self.tasks = queue.Queue(maxsize=max_queue or num_workers * 2)
+
+        # 每路一组轮换使用的画布，数量足够覆盖 正在画 + 等待显示 的帧
+        self.num_canvases = num_workers + 2
+        self.canvases = [[] for _ in range(num_streams)]
+        self.next_canvas = [0] * num_streams
+        self.last_accepted = [0.0] * num_streams
+
+        self.latest = [None] * num_streams   # 每路最新的渲染结果，供主线程 imshow
+        self.lock = threading.Lock()
+
+        self.num_rendered = 0
+        self.num_skipped = 0                 # 限速跳过
+        self.num_dropped = 0                 # 渲染队列满丢弃
+
+        self.stop_event = threading.Event()
+        self.workers = [threading.Thread(target=self._run, name=f"render-{i}", daemon=True)
+                        for i in range(num_workers)]
+
+    def start(self):
+        for w in self.workers:
+            w.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        for w in self.workers:
+            w.join()
+        for out in self.outputs:
+            out.close()
+
+    def submit(self, stream_index, frame, det, on_copied=None):
+        """
+        提交一帧待渲染，被限速或队列满时返回 False（此时不会调用 on_copied）
+        :param on_copied: 帧拷进画布后回调，用于尽早归还共享内存槽位
+        """
+        now = time.perf_counter()
+        if now - self.last_accepted[stream_index] < self.min_interval:
+            self.num_skipped += 1
+            return False
+        try:
+            self.tasks.put_nowait((stream_index, frame, det, on_copied))
+        except queue.Full:
+            self.num_dropped += 1
+            return False
+        self.last_accepted[stream_index] = now
+        return True
+
+    def pop_latest(self):
+        """取走各路新渲染好的画面：[(stream_index, image), ...]"""
+        with self.lock:
+            ready = [(i, img) for i, img in enumerate(self.latest) if img is not None]
+            self.latest = [None] * len(self.latest)
+        return ready
+
+    def _canvas(self, stream_index, shape):
+        with self.lock:
+            canvases = self.canvases[stream_index]
+            if not canvases or canvases[0].shape != shape:
+                canvases[:] = [np.empty(shape, np.uint8) for _ in range(self.num_canvases)]
+            k = self.next_canvas[stream_index]
+            self.next_canvas[stream_index] = (k + 1) % self.num_canvases
+            return canvases[k]
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                stream_index, frame, det, on_copied = self.tasks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            started = time.perf_counter_ns()
+
+            canvas = self._canvas(stream_index, frame.shape)
+            np.copyto(canvas, frame)
+            if on_copied is not None:
+                on_copied()
+            draw_detections(canvas, det, self.names, copy=False)
+
+            for out in self.outputs:
+                out.write(stream_index, canvas)
+            with self.lock:
+                self.latest[stream_index] = canvas
+                self.num_rendered += 1
+            if self.tracer is not None:
+                self.tracer.record(stream_index, "render", started, time.perf_counter_ns())
+
+
+class VideoRecorder:
+    """把每路渲染结果写成视频文件，path_pattern 中的 {stream} 替换为路号"""
+
+    def __init__(self, path_pattern, fps=15.0, fourcc="mp4v"):
+        self.path_pattern = path_pattern
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.writers = {}
+        self.lock = threading.Lock()
+
+    def write(self, stream_index, image):
+        with self.lock:
+            writer = self.writers.get(stream_index)
+            if writer is None:
+                path = self.path_pattern.format(stream=stream_index)
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                h, w = image.shape[:2]
+                writer = cv2.VideoWriter(path, self.fourcc, self.fps, (w, h))
+                self.writers[stream_index] = writer
+            writer.write(image)
+
+    def close(self):
+        with self.lock:
+            for writer in self.writers.values():
+                writer.release()
+            self.writers.clear()
+
+
+class MjpegServer:
+    """
+    MJPEG 推流：http://host:port/stream/<路号>
+    渲染线程只编码并替换每路最新一帧，客户端各自按自己的速度取，慢客户端不影响渲染
+    """
+
+    def __init__(self, host="0.0.0.0", port=8080, quality=80):
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.frames = {}
+        self.cond = threading.Condition()
+        self.closed = False
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if len(parts) != 2 or parts[0] != "stream" or not parts[1].isdigit():
+                    self.send_error(404)
+                    return
+                server._serve(self, int(parts[1]))
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mjpeg", daemon=True)
+        self.thread.start()
+
+    def write(self, stream_index, image):
+        ok, jpg = cv2.imencode(".jpg", image, self.params)
+        if not ok:
+            return
+        with self.cond:
+            seq = self.frames.get(stream_index, (0, None))[0] + 1
+            self.frames[stream_index] = (seq, jpg.tobytes())
+            self.cond.notify_all()
+
+    def _serve(self, handler, stream_index):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+        handler.end_headers()
+        last_seq = 0
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.closed or self.frames.get(stream_index, (0,))[0] > last_seq,
+                                       timeout=1.0)
+                    if self.closed:
+                        return
+                    if stream_index not in self.frames:
+                        continue
+                    last_seq, jpg = self.frames[stream_index]
+                handler.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n"
+                                    b"Content-Length: " + str(len(jpg)).encode() + b"\r\n\r\n" + jpg + b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,354 @@
+import argparse
+import ast
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCES = [os.path.join(HERE, "data")]
+
+# 一路的实际送达帧率不低于目标帧率的该比例，才算这一配置“跟得上”
+KEEP_UP_RATIO = 0.95
+
+
+# ============================================================
+# 资源占用
+# ============================================================
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _rss_mb():
+    """当前 RSS，只在有 /proc 的系统上可用"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# ============================================================
+# 单个配置：在子进程里按配置改好 main_tensorRT1201 的全局量，跑完整条线程解码流水线
+# ============================================================
+def _configure(M, num_streams, batch_size, rate, sources, overrides):
+    """与 main_tensorRT1201 启动时的顺序一致：先改常量，再重建依赖常量的模块级对象"""
+    for name, value in overrides.items():
+        if not hasattr(M, name):
+            raise ValueError(f"main_tensorRT1201 没有配置项 {name}")
+        setattr(M, name, value)
+    M.NUM_STREAMS = num_streams
+    M.MAX_BATCH_SIZE = batch_size
+    M.DECODE_RATE = rate
+    M.DISPLAY_MODE = "headless"
+    M.ADMISSION = False
+    if any(os.path.isdir(s) for s in sources):
+        M.CAPTURE_CANDIDATES = ("images",) + tuple(M.CAPTURE_CANDIDATES)
+
+    M.frame_queue = M.FrameBuffer(M.BACKPRESSURE, num_streams, capacity=num_streams * 5,
+                                  max_lag_ms=M.MAX_LAG_MS, on_drop=M.release_dropped)
+    M.stream_controls = [M.StreamControl() for _ in range(num_streams)]
+    M.tracer = M.Tracer(num_streams)
+    M.source_scales = [None] * num_streams
+    M.motion_gate = M.MotionGate(num_streams, M.MOTION_METHOD, M.MOTION_THRESHOLD,
+                                 keepalive_s=M.MOTION_KEEPALIVE_S) if M.MOTION_GATE else None
+    if M.ROI_SOURCE:
+        M.roi_engine = M.create_roi_engine()
+    if M.TRACKING or M.ADAPTIVE_SAMPLING:
+        M.tracking, _ = M.create_tracking({}, None)
+    if M.ADAPTIVE_SAMPLING:
+        M.sampler = M.create_sampler()
+
+
+def _target_fps(source, rate, every_n):
+    """每路应送达的帧率：回放帧率（未指定时取源帧率，图片目录按 25）/ 抽帧间隔"""
+    if not rate:
+        rate = 25.0 if os.path.isdir(source) else _probe_fps(source)
+    return rate / every_n
+
+
+def _probe_fps(source):
+    from capture import probe_source
+    return probe_source(source)[2]
+
+
+def _raw_counters(counters):
+    return [{name: getattr(c, name) for name in c.__slots__} for c in counters]
+
+
+def _counter_delta(counter_type, before, after):
+    """
+    计时窗口内的增量：整数计数取两次打点之差，其余（如指数平均）取窗口结束时的值，
+    再交给计数器自己的 as_dict() 算比例
+    """
+    out = []
+    for start, end in zip(before, after):
+        d = counter_type()
+        for name, value in end.items():
+            setattr(d, name, value - start[name] if isinstance(value, int) and isinstance(start[name], int) else value)
+        out.append(d.as_dict())
+    return out
+
+
+def _sample(M, scheduler):
+    cpu = os.times()
+    sample = {
+        "t": time.perf_counter(),
+        "cpu": cpu.user + cpu.system,
+        "frames": scheduler.num_frames,
+        "batches": scheduler.num_batches,
+        "rejected": scheduler.num_rejected,
+        "failed": scheduler.num_failed,
+        "callback_errors": scheduler.num_callback_errors,
+        "requests": [c.as_dict() for c in scheduler.requests.counters],
+        "results": [c.as_dict() for c in M.frame_queue.counters],
+    }
+    if M.motion_gate is not None:
+        sample["motion_gate"] = _raw_counters(M.motion_gate.counters)
+    if M.sampler is not None:
+        sample["sampling"] = _raw_counters(M.sampler.counters)
+    return sample
+
+
+def _monitor(M, scheduler, warmup, duration, max_frames, marks):
+    """
+    等每一路都送出第一帧结果（各路打开视频源、解码器就绪的时间不计入），再预热 warmup 秒，
+    然后清零延迟统计并打点；到时长或推理帧数后再打点，最后停掉整条流水线
+    """
+    started = time.perf_counter()
+    while not all(c.processed for c in M.frame_queue.counters):
+        if M.stop_event.wait(0.05):
+            return
+    marks["startup_s"] = time.perf_counter() - started
+    if M.stop_event.wait(warmup):
+        return
+    M.tracer.reset()
+    marks["start"] = start = _sample(M, scheduler)
+    deadline = start["t"] + duration if duration else None
+    while not M.stop_event.wait(0.1):
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        if max_frames and scheduler.num_frames - start["frames"] >= max_frames:
+            break
+    marks["end"] = _sample(M, scheduler)
+    marks["latency"] = M.tracer.snapshot()["total"]
+    marks["rss_mb"] = _rss_mb()
+    M.stop_event.set()
+
+
+def _run_config(args):
+    """子进程任务：每个配置独立进程，模块级状态、显存和 peak RSS 互不干扰"""
+    num_streams, batch_size, rate, sources, warmup, duration, max_frames, overrides, quiet = args
+    sys.path.insert(0, HERE)
+    os.chdir(HERE)
+    if quiet:
+        # 流水线各线程每秒打印一次状态，压测时只保留汇总
+        sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    import main_tensorRT1201 as M
+
+    config = {"streams": num_streams, "batch_size": batch_size, "rate": rate}
+    try:
+        _configure(M, num_streams, batch_size, rate, sources, overrides)
+        backend = M.load_backend()
+    except Exception as e:
+        return dict(config, skipped=f"{type(e).__name__}: {e}")
+
+    stream_sources = [sources[i % len(sources)] for i in range(num_streams)]
+    targets = [_target_fps(s, rate, M.DECODE_EVERY_N) for s in stream_sources]
+
+    scheduler = M.create_scheduler(backend)
+    threads = [threading.Thread(target=M.decode_stream, args=(i, source, scheduler), daemon=True)
+               for i, source in enumerate(stream_sources)]
+    marks = {}
+    monitor = threading.Thread(target=_monitor, args=(M, scheduler, warmup, duration, max_frames, marks), daemon=True)
+    for t in threads:
+        t.start()
+    monitor.start()
+    try:
+        M.consume_results(None, threads, show=False)
+    finally:
+        M.stop_event.set()
+        for t in threads:
+            t.join(timeout=5)
+        scheduler.stop(timeout=5)
+    monitor.join()
+    if "end" not in marks:
+        return dict(config, skipped="解码线程在计时开始前全部退出")
+
+    start, end = marks["start"], marks["end"]
+    elapsed = end["t"] - start["t"]
+
+    def delta(stage, key):
+        return [end[stage][i][key] - start[stage][i][key] for i in range(num_streams)]
+
+    inferred = delta("requests", "processed")
+    delivered = delta("results", "processed")
+    per_stream = []
+    for i in range(num_streams):
+        fps = delivered[i] / elapsed
+        per_stream.append({
+            "source": os.path.relpath(stream_sources[i], HERE),
+            "target_fps": round(targets[i], 2),
+            "delivered_fps": round(fps, 2),
+            "inferred_fps": round(inferred[i] / elapsed, 2),
+            "keeps_up": fps >= KEEP_UP_RATIO * targets[i],
+        })
+
+    frames = end["frames"] - start["frames"]
+    batches = end["batches"] - start["batches"]
+    result = dict(
+        config,
+        startup_s=round(marks["startup_s"], 3),
+        elapsed_s=round(elapsed, 3),
+        offered_fps=round(sum(targets), 2),
+        delivered_fps=round(sum(delivered) / elapsed, 2),
+        inference_fps=round(frames / elapsed, 2),
+        avg_batch_size=round(frames / batches, 2) if batches else 0.0,
+        keeps_up=all(s["keeps_up"] for s in per_stream),
+        drops={
+            "inference_dropped": sum(delta("requests", "dropped")),
+            "decode_skipped": sum(delta("requests", "skipped")),
+            "decode_discarded": sum(delta("requests", "discarded")),
+            "result_dropped": sum(delta("results", "dropped")),
+            "rejected": end["rejected"] - start["rejected"],
+            "inference_failed": end["failed"] - start["failed"],
+            "callback_errors": end["callback_errors"] - start["callback_errors"],
+        },
+        latency=marks["latency"],
+        cpu_cores=round((end["cpu"] - start["cpu"]) / elapsed, 3),
+        rss_mb=marks["rss_mb"],
+        peak_rss_mb=_peak_rss_mb(),
+        backend=backend.name,
+        per_stream=per_stream,
+    )
+    if M.motion_gate is not None:
+        result["motion_gate"] = _counter_delta(type(M.motion_gate.counters[0]), start["motion_gate"], end["motion_gate"])
+    if M.sampler is not None:
+        sampling = _counter_delta(type(M.sampler.counters[0]), start["sampling"], end["sampling"])
+        result["sampling"] = [dict(d, k=M.sampler.k[i]) for i, d in enumerate(sampling)]
+    return result
+
+
+# ============================================================
+# 扫描：路数 x batch，找出每个 batch 下还能跟上目标帧率的最大路数（拐点）
+# ============================================================
+def find_knees(results):
+    knees = {}
+    for r in results:
+        if "skipped" in r:
+            continue
+        k = knees.setdefault(str(r["batch_size"]), {"max_streams": 0, "peak_inference_fps": 0.0})
+        if r["keeps_up"]:
+            k["max_streams"] = max(k["max_streams"], r["streams"])
+        k["peak_inference_fps"] = max(k["peak_inference_fps"], r["inference_fps"])
+    return knees
+
+
+def run_sweep(streams, batch_sizes, rate=None, sources=None, warmup=5.0, duration=30.0, max_frames=None,
+              overrides=None, quiet=True):
+    """
+    :param streams: 要测的路数列表
+    :param batch_sizes: 要测的 MAX_BATCH_SIZE 列表
+    :param rate: 每路回放帧率，None 为源帧率
+    :param sources: 录像文件 / 图片目录，按路轮流分配
+    :param warmup: 所有路都出第一帧结果之后再预热的秒数
+    :param duration: 每个配置预热后的计时时长（秒），与 max_frames 先到先停
+    :param max_frames: 每个配置预热后推理的帧数上限
+    :param overrides: 覆盖 main_tensorRT1201 的配置项，如 {"MOTION_GATE": True}
+    """
+    sources = [os.path.abspath(s) for s in (sources or DEFAULT_SOURCES)]
+    overrides = overrides or {}
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "sources": [os.path.relpath(s, HERE) for s in sources],
+        "rate": rate,
+        "warmup_s": warmup,
+        "duration_s": duration,
+        "max_frames": max_frames,
+        "overrides": overrides,
+        "keep_up_ratio": KEEP_UP_RATIO,
+        "results": [],
+    }
+
+    ctx = multiprocessing.get_context("spawn")
+    for batch_size in batch_sizes:
+        for num_streams in sorted(streams):
+            with ctx.Pool(1) as pool:
+                result = pool.apply(_run_config, ((num_streams, batch_size, rate, sources, warmup, duration,
+                                                   max_frames, overrides, quiet),))
+            report["results"].append(result)
+
+            tag = f"[streams={num_streams:<3} batch={batch_size:<3}]"
+            if "skipped" in result:
+                print(f"{tag} 跳过: {result['skipped']}")
+                continue
+            inference = result["latency"].get("inference", {})
+            queue_wait = result["latency"].get("queue_wait", {})
+            drops = result["drops"]
+            print(f"{tag} 送达 {result['delivered_fps']:7.1f}/{result['offered_fps']:.1f} fps  "
+                  f"推理 {result['inference_fps']:7.1f} fps  平均 batch {result['avg_batch_size']:.2f}  "
+                  f"推理 p50 {inference.get('p50_ms', 0):.1f} / p99 {inference.get('p99_ms', 0):.1f} ms  "
+                  f"排队 p99 {queue_wait.get('p99_ms', 0):.1f} ms  "
+                  f"丢帧 {drops['inference_dropped']} 跳过 {drops['decode_skipped']}  "
+                  f"CPU {result['cpu_cores']:.2f} 核  RSS {result['rss_mb'] or 0:.0f} MB"
+                  + ("" if result["keeps_up"] else "  (跟不上)"))
+
+    report["knees"] = find_knees(report["results"])
+    for batch_size, k in report["knees"].items():
+        print(f"[batch={batch_size}] 最多 {k['max_streams']} 路跟得上目标帧率，推理峰值 {k['peak_inference_fps']:.1f} fps")
+    return report
+
+
+def _parse_override(text):
+    name, _, value = text.partition("=")
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass  # 当作字符串
+    return name.strip(), value
+
+
+if __name__ == "__main__":
+    # 例：python replay_bench.py test1.mp4 --streams 1 2 4 8 --batch 1 4 8 --rate 25 --duration 20
+    ap = argparse.ArgumentParser(description="多路回放压测：按固定帧率把录像 / 图片目录喂给 N 路流水线，扫描路数与 batch")
+    ap.add_argument("sources", nargs="*", help="录像文件或图片目录，按路轮流分配（默认 data/ 下的图片）")
+    ap.add_argument("-o", "--output", default="replay_benchmark.json", help="JSON 结果输出路径")
+    ap.add_argument("--streams", type=int, nargs="+", default=[1, 2, 4, 8], help="要测的路数")
+    ap.add_argument("--batch", type=int, nargs="+", default=[1, 4, 8], help="要测的 MAX_BATCH_SIZE")
+    ap.add_argument("--rate", type=float, default=25.0, help="每路回放帧率，0 为源帧率")
+    ap.add_argument("--warmup", type=float, default=5.0, help="所有路出第一帧后的预热秒数，不计入结果")
+    ap.add_argument("--duration", type=float, default=30.0, help="每个配置的计时秒数，0 为不限")
+    ap.add_argument("--frames", type=int, default=None, help="每个配置推理到该帧数即停")
+    ap.add_argument("--set", dest="overrides", action="append", default=[], metavar="NAME=VALUE",
+                    help="覆盖 main_tensorRT1201 的配置项，可重复，如 --set MOTION_GATE=True")
+    ap.add_argument("-v", "--verbose", action="store_true", help="保留流水线自身的输出")
+    args = ap.parse_args()
+    if not args.duration and not args.frames:
+        ap.error("--duration 和 --frames 至少指定一个")
+
+    report = run_sweep(args.streams, args.batch, rate=args.rate or None, sources=args.sources,
+                       warmup=args.warmup, duration=args.duration or None, max_frames=args.frames,
+                       overrides=dict(_parse_override(o) for o in args.overrides), quiet=not args.verbose)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
@@ -0,0 +1,398 @@
+import json
+
+import cv2
+import numpy as np
+
+from backends import Detections
+
+# 配置界面 region_camera_ranges.description 里的区域属性
+CATEGORIES = ("等待区", "行人区", "禁行区")
+
+
+# ============================================================
+# 区域配置：calibration_range 解析与加载
+# ============================================================
+class Region:
+    """一个摄像头上的一块区域；points 为 (k, 2) float32，normalized 时取值 0~1"""
+    __slots__ = ("region_id", "category", "points", "normalized")
+
+    def __init__(self, region_id, category, points, normalized):
+        self.region_id = region_id
+        self.category = category
+        self.points = points
+        self.normalized = normalized
+
+    def pixel_points(self, frame_size, source_size=None):
+        """
+        映射到当前帧的像素坐标
+        :param frame_size: 当前帧 (w, h)，解码端可能已缩放
+        :param source_size: 源分辨率 (w, h)；像素坐标的配置按源分辨率标定，为空时视为当前帧坐标
+        """
+        w, h = frame_size
+        if self.normalized:
+            return self.points * np.float32([w, h])
+        if source_size and source_size[0] and source_size[1]:
+            return self.points * np.float32([w / source_size[0], h / source_size[1]])
+        return self.points.copy()
+
+
+def parse_calibration_range(value):
+    """
+    兼容两种配置格式：
+    - 多边形 [[x, y], ...]（配置界面画的，按画布归一化到 0~1）
+    - 矩形 [x1, y1, x2, y2]（早期手填的像素坐标）；后两项不大于前两项时按 [x, y, w, h] 处理
+    :return: (points, normalized)
+    """
+    pts = json.loads(value) if isinstance(value, (str, bytes)) else value
+    arr = np.asarray(pts, np.float32)
+    if arr.ndim == 1 and arr.size == 4:
+        x1, y1, x2, y2 = arr
+        if x2 <= x1 or y2 <= y1:
+            x2, y2 = x1 + x2, y1 + y2
+        arr = np.float32([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+    elif arr.ndim != 2 or arr.shape[1] != 2 or len(arr) < 3:
+        raise ValueError(f"无法识别的 calibration_range: {value}")
+    normalized = bool(arr.min() >= 0 and arr.max() <= 1.0)
+    return arr, normalized
+
+
+def regions_from_rows(rows):
+    """
+    :param rows: region_camera_ranges 的行，含 camera_id / region_id / calibration_range / description
+    :return: {camera_id: [Region, ...]}
+    """
+    regions = {}
+    for r in rows:
+        try:
+            points, normalized = parse_calibration_range(r["calibration_range"])
+        except (ValueError, TypeError) as e:
+            print(f"[ROI] 跳过区域 {r.get('region_id')} / 摄像头 {r.get('camera_id')}: {e}")
+            continue
+        regions.setdefault(r["camera_id"], []).append(
+            Region(r["region_id"], r.get("description"), points, normalized))
+    return regions
+
+
+def load_regions_from_json(path):
+    """读取导出的 region_camera_ranges（行列表的 JSON 文件）"""
+    with open(path, encoding="utf-8") as f:
+        return regions_from_rows(json.load(f))
+
+
+def load_regions_from_db(camera_ids=None, host="localhost", user="root", password="1234", database="test_db"):
+    """从配置库读取（需要 pymysql，连接参数与配置界面 dao_db 一致）"""
+    import pymysql
+
+    sql = "SELECT region_id, camera_id, calibration_range, description FROM region_camera_ranges"
+    params = None
+    if camera_ids:
+        sql += " WHERE camera_id IN (" + ", ".join(["%s"] * len(camera_ids)) + ")"
+        params = list(camera_ids)
+    conn = pymysql.connect(host=host, user=user, password=password, database=database, charset="utf8mb4",
+                           cursorclass=pymysql.cursors.DictCursor)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            return regions_from_rows(cursor.fetchall())
+    finally:
+        conn.close()
+
+
+# ============================================================
+# 几何
+# ============================================================
+def points_in_polygon(points, polygon):
+    """
+    射线法，所有点对所有边一次广播完成
+    :param points: (n, 2)
+    :param polygon: (k, 2)
+    :return: (n,) bool
+    """
+    if len(points) == 0:
+        return np.zeros(0, bool)
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at_y = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(crosses & (x < x_at_y), axis=1) % 2 == 1
+
+
+def anchor_points(xyxy, anchor="bottom"):
+    """检测框的落点：bottom 为底边中点（行人脚下 / 车轮接地处），center 为框中心"""
+    cx = (xyxy[:, 0] + xyxy[:, 2]) * 0.5
+    cy = xyxy[:, 3] if anchor == "bottom" else (xyxy[:, 1] + xyxy[:, 3]) * 0.5
+    return np.stack([cx, cy], axis=1)
+
+
+def _merge_boxes(boxes):
+    """把相交的矩形反复合并，直到两两不相交"""
+    boxes = [list(b) for b in boxes]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+
+# ============================================================
+# ROI 引擎
+# ============================================================
+class RoiPlan:
+    """
+    某一路在某个帧尺寸下的裁剪方案（按帧尺寸缓存）
+    mode: full 整帧 / crop 裁到所有区域的外接框 / mosaic 各块分别裁出后拼成一张图
+    tiles: [(sx1, sy1, sx2, sy2, mx, my)]，源图矩形及其在输入图中的左上角
+    """
+    __slots__ = ("frame_shape", "mode", "mask", "polygons", "tiles", "input_size")
+
+    def __init__(self, frame_shape, mode, mask, polygons, tiles, input_size):
+        self.frame_shape = frame_shape
+        self.mode = mode
+        self.mask = mask
+        self.polygons = polygons
+        self.tiles = tiles
+        self.input_size = input_size
+
+    def pixel_ratio(self):
+        h, w = self.frame_shape[:2]
+        return self.input_size[0] * self.input_size[1] / (w * h)
+
+
+class RoiEngine:
+    """
+    按路的感兴趣区域：
+    - 推理前 crop()：区域多边形栅格化成掩码（按帧尺寸缓存），裁到所有区域的外接框；
+      几块区域相距较远时各自裁出、拼成一张更紧凑的图（拼图的长边明显短于外接框时才拼），
+      这样送进模型的像素几乎都在区域附近，letterbox 后区域的有效分辨率更高；
+    - 推理后 restore()：把框映射回整帧坐标，只保留落点在任一多边形内的检测。
+    没有配置区域的路原样通过。crop / restore 只在推理线程里调用。
+    """
+
+    def __init__(self, stream_regions, pad=16, pad_top=80, tile_gap=8, mosaic_ratio=0.75, fill_outside=False,
+                 anchor="bottom"):
+        """
+        :param stream_regions: 每路一个 [Region, ...]，空列表表示不限制
+        :param pad: 区域外扩的像素（目标可能只有落点在区域内，框本身伸出区域）
+        :param pad_top: 向上外扩的像素：落点在区域内的行人 / 车辆，框主要向上伸出区域
+        :param tile_gap: 拼图时块之间的间隔，避免跨块误检
+        :param mosaic_ratio: 拼图长边 < 外接框长边 * mosaic_ratio 时才拼图
+        :param fill_outside: 把裁剪范围内、区域外的像素涂成灰色（多一次拷贝，可压掉区域外的误检）
+        :param anchor: 判断检测是否在区域内用的落点，见 anchor_points
+        """
+        self.stream_regions = [list(r) for r in stream_regions]
+        self.pad = pad
+        self.pad_top = pad_top
+        self.tile_gap = tile_gap
+        self.mosaic_ratio = mosaic_ratio
+        self.fill_outside = fill_outside
+        self.anchor = anchor
+        num_streams = len(self.stream_regions)
+        self.source_sizes = [None] * num_streams
+        self.plans = [None] * num_streams
+        self.kept = [0] * num_streams
+        self.filtered = [0] * num_streams
+
+    def set_source_size(self, stream_index, size):
+        """源分辨率变化时（如重连后）丢掉缓存的方案"""
+        if self.source_sizes[stream_index] != tuple(size):
+            self.source_sizes[stream_index] = tuple(size)
+            self.plans[stream_index] = None
+
+    def regions(self, stream_index):
+        return self.stream_regions[stream_index]
+
+    def plan(self, stream_index, frame_shape):
+        plan = self.plans[stream_index]
+        if plan is None or plan.frame_shape != frame_shape:
+            plan = self.plans[stream_index] = self._build_plan(stream_index, frame_shape)
+        return plan
+
+    def _build_plan(self, stream_index, frame_shape):
+        h, w = frame_shape[:2]
+        regions = self.stream_regions[stream_index]
+        if not regions:
+            return RoiPlan(frame_shape, "full", None, [], [(0, 0, w, h, 0, 0)], (w, h))
+
+        polygons = [r.pixel_points((w, h), self.source_sizes[stream_index]) for r in regions]
+        mask = np.zeros((h, w), np.uint8)
+        cv2.fillPoly(mask, [np.round(p).astype(np.int32) for p in polygons], 255)
+
+        boxes = []
+        for p in polygons:
+            x1, y1 = np.floor(p.min(axis=0)).astype(int) - (self.pad, self.pad_top)
+            x2, y2 = np.ceil(p.max(axis=0)).astype(int) + self.pad
+            x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+            if x2 > x1 and y2 > y1:
+                boxes.append((x1, y1, x2, y2))
+        if not boxes:
+            # 区域全在画面外
+            return RoiPlan(frame_shape, "crop", mask, polygons, [], (0, 0))
+
+        ux1, uy1 = min(b[0] for b in boxes), min(b[1] for b in boxes)
+        ux2, uy2 = max(b[2] for b in boxes), max(b[3] for b in boxes)
+        union_long = max(ux2 - ux1, uy2 - uy1)
+        if (ux2 - ux1) * (uy2 - uy1) >= 0.95 * w * h:
+            return RoiPlan(frame_shape, "full", mask, polygons, [(0, 0, w, h, 0, 0)], (w, h))
+
+        clusters = _merge_boxes(boxes)
+        if len(clusters) > 1:
+            # 横排 / 竖排两种拼法取长边较短的（letterbox 的缩放由长边决定）
+            widths = [b[2] - b[0] for b in clusters]
+            heights = [b[3] - b[1] for b in clusters]
+            gap = self.tile_gap * (len(clusters) - 1)
+            horizontal = (sum(widths) + gap, max(heights))
+            vertical = (max(widths), sum(heights) + gap)
+            size = min(horizontal, vertical, key=max)
+            if max(size) < union_long * self.mosaic_ratio:
+                tiles = []
+                offset = 0
+                for (x1, y1, x2, y2), tw, th in zip(clusters, widths, heights):
+                    if size == horizontal:
+                        tiles.append((x1, y1, x2, y2, offset, 0))
+                        offset += tw + self.tile_gap
+                    else:
+                        tiles.append((x1, y1, x2, y2, 0, offset))
+                        offset += th + self.tile_gap
+                return RoiPlan(frame_shape, "mosaic", mask, polygons, tiles, size)
+
+        return RoiPlan(frame_shape, "crop", mask, polygons, [(ux1, uy1, ux2, uy2, 0, 0)],
+                       (ux2 - ux1, uy2 - uy1))
+
+    def crop(self, stream_index, frame):
+        """
+        :return: (送进模型的图, plan)；crop 模式且不涂灰时是 frame 的视图，不拷贝
+        """
+        plan = self.plan(stream_index, frame.shape)
+        if plan.mode == "full" or not plan.tiles:
+            return frame, plan
+        if plan.mode == "crop":
+            sx1, sy1, sx2, sy2, _, _ = plan.tiles[0]
+            image = frame[sy1:sy2, sx1:sx2]
+            if self.fill_outside:
+                image = image.copy()
+                image[plan.mask[sy1:sy2, sx1:sx2] == 0] = 114
+            return image, plan
+
+        w, h = plan.input_size
+        image = np.full((h, w, 3), 114, np.uint8)
+        for sx1, sy1, sx2, sy2, mx, my in plan.tiles:
+            dst = image[my:my + sy2 - sy1, mx:mx + sx2 - sx1]
+            dst[:] = frame[sy1:sy2, sx1:sx2]
+            if self.fill_outside:
+                dst[plan.mask[sy1:sy2, sx1:sx2] == 0] = 114
+        return image, plan
+
+    def restore(self, stream_index, det, plan):
+        """输入图坐标 -> 整帧坐标，并去掉落点不在任何区域内的检测"""
+        if plan.mode == "full" and not plan.polygons:
+            return det
+        if not plan.tiles or len(det) == 0:
+            self.filtered[stream_index] += len(det)
+            return Detections.empty()
+
+        xyxy = det.xyxy.copy()
+        keep = np.zeros(len(det), bool)
+        if plan.mode == "mosaic":
+            # 按框中心所在的块平移回源图，落在间隔里的丢掉
+            cx = (xyxy[:, 0] + xyxy[:, 2]) * 0.5
+            cy = (xyxy[:, 1] + xyxy[:, 3]) * 0.5
+            for sx1, sy1, sx2, sy2, mx, my in plan.tiles:
+                tw, th = sx2 - sx1, sy2 - sy1
+                inside = (cx >= mx) & (cx < mx + tw) & (cy >= my) & (cy < my + th)
+                xyxy[inside, 0::2] = (xyxy[inside, 0::2] - mx).clip(0, tw) + sx1
+                xyxy[inside, 1::2] = (xyxy[inside, 1::2] - my).clip(0, th) + sy1
+                keep |= inside
+        else:
+            sx1, sy1, _, _, _, _ = plan.tiles[0]
+            xyxy[:, 0::2] += sx1
+            xyxy[:, 1::2] += sy1
+            keep[:] = True
+
+        if plan.polygons:
+            points = anchor_points(xyxy, self.anchor)
+            in_any = np.zeros(len(det), bool)
+            for polygon in plan.polygons:
+                in_any |= points_in_polygon(points, polygon)
+            keep &= in_any
+
+        n_keep = int(np.count_nonzero(keep))
+        self.kept[stream_index] += n_keep
+        self.filtered[stream_index] += len(det) - n_keep
+        return Detections(xyxy[keep], det.conf[keep], det.cls[keep])
+
+    def detect(self, detect_fn, stream_indexes, frames):
+        """批量推理的 ROI 版本：各帧先裁剪，整批推理后再映射回原图"""
+        crops = [self.crop(s, f) for s, f in zip(stream_indexes, frames)]
+        results = detect_fn([image for image, _ in crops])
+        return [self.restore(s, det, plan) for s, det, (_, plan) in zip(stream_indexes, results, crops)]
+
+    def membership(self, stream_index, xyxy, frame_shape):
+        """
+        各检测落在哪些区域
+        :return: (n, 区域数) bool，列顺序同 regions(stream_index)
+        """
+        plan = self.plan(stream_index, frame_shape)
+        points = anchor_points(xyxy, self.anchor)
+        if not plan.polygons:
+            return np.zeros((len(points), 0), bool)
+        return np.stack([points_in_polygon(points, p) for p in plan.polygons], axis=1)
+
+    def stats(self):
+        out = []
+        for i, plan in enumerate(self.plans):
+            out.append({
+                "regions": len(self.stream_regions[i]),
+                "mode": plan.mode if plan is not None else None,
+                "pixel_ratio": round(float(plan.pixel_ratio()), 3) if plan is not None else None,
+                "kept": self.kept[i],
+                "filtered": self.filtered[i],
+            })
+        return out
+
+
+if __name__ == "__main__":
+    # 自检：两块相距较远的区域走拼图，检测框映射回原图后按多边形过滤
+    rows = [
+        {"camera_id": "cam", "region_id": "r1", "description": "行人区",
+         "calibration_range": "[[0.05, 0.1], [0.25, 0.1], [0.25, 0.3], [0.05, 0.3]]"},
+        {"camera_id": "cam", "region_id": "r2", "description": "等待区",
+         "calibration_range": [1500, 800, 1800, 1000]},   # 1920x1080 源上的像素矩形
+    ]
+    regions = regions_from_rows(rows)["cam"]
+    assert regions[0].normalized and not regions[1].normalized
+
+    engine = RoiEngine([regions, []], pad=8, pad_top=8)
+    engine.set_source_size(0, (1920, 1080))
+    frame = np.zeros((360, 640, 3), np.uint8)
+    image, plan = engine.crop(0, frame)
+    assert plan.mode == "mosaic" and len(plan.tiles) == 2, plan.mode
+    assert plan.pixel_ratio() < 0.25, plan.pixel_ratio()
+    assert engine.crop(1, frame)[1].mode == "full"
+
+    # 在拼图坐标系里造三个框：块 1 内、块 2 内、块 1 内但落点在多边形外
+    t1, t2 = plan.tiles
+    det = Detections(np.float32([
+        [t1[4] + 30, t1[5] + 20, t1[4] + 50, t1[5] + 60],
+        [t2[4] + 40, t2[5] + 20, t2[4] + 60, t2[5] + 50],
+        [t1[4] + 1, t1[5] + 1, t1[4] + 5, t1[5] + 5],
+    ]), np.float32([0.9, 0.8, 0.7]), np.int32([0, 1, 2]))
+    out = engine.restore(0, det, plan)
+    assert len(out) == 2 and engine.filtered[0] == 1
+    member = engine.membership(0, out.xyxy, frame.shape)
+    assert member.tolist() == [[True, False], [False, True]], member
+
+    pts = np.float32([[5, 5], [12, 5], [15, 15], [50, 50]])
+    tri = np.float32([[0, 0], [20, 0], [0, 20]])
+    assert points_in_polygon(pts, tri).tolist() == [True, True, False, False]
+    print("roi 自检通过", engine.stats())
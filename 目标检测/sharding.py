@@ -0,0 +1,161 @@
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+
+
+def split_streams(num_streams, num_shards):
+    """按路号轮流分片：[[0, 2], [1, 3]]，每个分片负载尽量均衡"""
+    return [list(range(i, num_streams, num_shards)) for i in range(num_shards)]
+
+
+def split_cpus(num_shards, cpus=None):
+    """把可用核按连续区间均分给各分片；核数不足时多个分片共用"""
+    if cpus is None:
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    if not cpus:
+        return [None] * num_shards
+    if len(cpus) < num_shards:
+        return [[cpus[i % len(cpus)]] for i in range(num_shards)]
+    per_shard = len(cpus) // num_shards
+    return [cpus[i * per_shard:(i + 1) * per_shard] for i in range(num_shards)]
+
+
+def _shard_main(target, shard_id, stream_indexes, cpus, result_queue, stop_event):
+    """子进程入口：先绑核再执行 target"""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    target(shard_id, stream_indexes, result_queue, stop_event)
+
+
+class ShardSupervisor:
+    """
+    多进程分片：把 num_streams 路分到 num_shards 个工作进程（各自加载模型、解码、推理），
+    每个进程绑定一组 CPU；进程异常退出时按退避时间重启；
+    结果与指标经同一个队列汇总到父进程的 collector 线程。
+
+    target(shard_id, stream_indexes, result_queue, stop_event) 在子进程里运行，需可被 pickle
+    （模块级函数），往 result_queue 放：
+        ("result", stream_index, ts, detections)
+        ("metrics", shard_id, dict)
+    """
+
+    def __init__(self, target, num_streams, num_shards, cpus=None, on_result=None,
+                 max_restarts=5, restart_backoff=2.0, result_queue_size=1024):
+        """
+        :param cpus: 每个分片的 CPU 列表；为空时把当前进程可用的核均分
+        :param on_result: 结果回调 on_result(stream_index, ts, detections)，在 collector 线程里调用
+        :param max_restarts: 单个分片最多重启次数，超过后不再拉起
+        """
+        self.ctx = mp.get_context("spawn")  # 父进程可能已初始化 CUDA，不能 fork
+        self.target = target
+        self.shards = split_streams(num_streams, num_shards)
+        self.cpus = cpus or split_cpus(num_shards)
+        self.on_result = on_result
+        self.max_restarts = max_restarts
+        self.restart_backoff = restart_backoff
+
+        self.result_queue = self.ctx.Queue(maxsize=result_queue_size)
+        self.stop_event = self.ctx.Event()
+        self.processes = [None] * num_shards
+        self.restarts = [0] * num_shards
+        self.died_at = [None] * num_shards
+
+        self.num_results = [0] * num_streams
+        self.shard_metrics = {}
+        self.lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for shard_id in range(len(self.shards)):
+            self._spawn(shard_id)
+        for fn, name in ((self._collect, "shard-collector"), (self._supervise, "shard-supervisor")):
+            t = threading.Thread(target=fn, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        for p in self.processes:
+            if p is not None:
+                p.join(timeout)
+                if p.is_alive():
+                    p.terminate()
+                    p.join()
+        for t in self._threads:
+            t.join()
+        self.result_queue.cancel_join_thread()
+
+    def alive(self):
+        return [p is not None and p.is_alive() for p in self.processes]
+
+    def metrics(self):
+        """各分片的最新指标 + 进程状态，streams 为所有分片上报的逐路指标合并"""
+        with self.lock:
+            shard_metrics = dict(self.shard_metrics)
+            num_results = list(self.num_results)
+        shards = {}
+        streams = {}
+        for shard_id, stream_indexes in enumerate(self.shards):
+            p = self.processes[shard_id]
+            m = shard_metrics.get(shard_id, {})
+            shards[shard_id] = {
+                "streams": stream_indexes,
+                "cpus": self.cpus[shard_id],
+                "pid": p.pid if p is not None else None,
+                "alive": p is not None and p.is_alive(),
+                "restarts": self.restarts[shard_id],
+                **{k: v for k, v in m.items() if k != "streams"},
+            }
+            streams.update(m.get("streams", {}))
+        for i, n in enumerate(num_results):
+            streams.setdefault(str(i), {})["collected"] = n
+        return {"shards": shards, "streams": streams}
+
+    def _spawn(self, shard_id):
+        p = self.ctx.Process(
+            target=_shard_main,
+            args=(self.target, shard_id, self.shards[shard_id], self.cpus[shard_id],
+                  self.result_queue, self.stop_event),
+            name=f"shard-{shard_id}",
+            daemon=True,
+        )
+        p.start()
+        self.processes[shard_id] = p
+        self.died_at[shard_id] = None
+        print(f"[Shard {shard_id}] pid {p.pid}，路 {self.shards[shard_id]}，CPU {self.cpus[shard_id]}")
+
+    def _supervise(self):
+        while not self.stop_event.wait(0.5):
+            for shard_id, p in enumerate(self.processes):
+                if p is None or p.is_alive():
+                    continue
+                if self.died_at[shard_id] is None:
+                    self.died_at[shard_id] = time.time()
+                    print(f"[Shard {shard_id}] 进程退出，exitcode={p.exitcode}")
+                if self.restarts[shard_id] >= self.max_restarts:
+                    continue
+                # 连续崩溃时退避时间翻倍，避免反复拉起占满 CPU
+                backoff = self.restart_backoff * (2 ** self.restarts[shard_id])
+                if time.time() - self.died_at[shard_id] >= backoff:
+                    self.restarts[shard_id] += 1
+                    self._spawn(shard_id)
+
+    def _collect(self):
+        while not self.stop_event.is_set():
+            try:
+                msg = self.result_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if msg[0] == "result":
+                _, stream_index, ts, detections = msg
+                with self.lock:
+                    self.num_results[stream_index] += 1
+                if self.on_result is not None:
+                    self.on_result(stream_index, ts, detections)
+            elif msg[0] == "metrics":
+                _, shard_id, metrics = msg
+                with self.lock:
+                    self.shard_metrics[shard_id] = metrics
@@ -0,0 +1,309 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# 一条检测一行，列式存储；框坐标拆成 x1/y1/x2/y2 四列，方便各种格式直接落盘
+COLUMNS = {
+    "stream": np.int16,
+    "ts": np.float64,      # 结果产生时的 Unix 时间
+    "cls": np.int16,
+    "conf": np.float32,
+    "x1": np.float32,
+    "y1": np.float32,
+    "x2": np.float32,
+    "y2": np.float32,
+}
+ROW_BYTES = sum(np.dtype(t).itemsize for t in COLUMNS.values())
+
+
+def empty_columns(rows):
+    return {name: np.empty(rows, dtype) for name, dtype in COLUMNS.items()}
+
+
+# ============================================================
+# 各种落盘 / 推送目标：write(columns, n) 写入前 n 行，close() 收尾
+# ============================================================
+class JsonlSink:
+    """每条检测一行 JSON"""
+
+    def __init__(self, path):
+        self.f = open(path, "a", encoding="utf-8")
+
+    def write(self, columns, n):
+        cols = {name: columns[name][:n].tolist() for name in COLUMNS}
+        lines = [json.dumps(dict(zip(COLUMNS, row)), separators=(",", ":"))
+                 for row in zip(*(cols[name] for name in COLUMNS))]
+        self.f.write("\n".join(lines) + "\n")
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetSink:
+    """
+    Parquet 文件（需要 pyarrow），每 rotate_rows 行换一个文件，文件名带起始时间（到毫秒）和序号；
+    独占创建，同名文件已存在（如快速重启）时序号加一，不会覆盖
+    """
+
+    def __init__(self, directory, rotate_rows=1_000_000, compression="zstd"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa, self.pq = pa, pq
+        self.directory = directory
+        self.rotate_rows = rotate_rows
+        self.compression = compression
+        self.schema = pa.schema([(name, pa.from_numpy_dtype(dtype)) for name, dtype in COLUMNS.items()])
+        self.writer = None
+        self.rows_in_file = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, columns, n):
+        if self.writer is None or self.rows_in_file >= self.rotate_rows:
+            self._rotate()
+        table = self.pa.Table.from_arrays([self.pa.array(columns[name][:n]) for name in COLUMNS], schema=self.schema)
+        self.writer.write_table(table)
+        self.rows_in_file += n
+
+    def _rotate(self):
+        if self.writer is not None:
+            self.writer.close()
+        now = time.time()
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+        seq = 0
+        while True:
+            path = os.path.join(self.directory, f"detections_{stamp}_{seq:03d}.parquet")
+            try:
+                # 先独占创建占住文件名，再交给 ParquetWriter 写
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                seq += 1
+        self.writer = self.pq.ParquetWriter(path, self.schema, compression=self.compression)
+        self.rows_in_file = 0
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class SqliteSink:
+    """SQLite 表 detections，WAL 模式，每个 batch 一个事务"""
+
+    def __init__(self, path, table="detections"):
+        # 只在写线程里使用，但连接在主线程创建
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        types = {np.int16: "INTEGER", np.float64: "REAL", np.float32: "REAL"}
+        cols = ", ".join(f"{name} {types[dtype]}" for name, dtype in COLUMNS.items())
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols})")
+        self.insert = f"INSERT INTO {table} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+    def write(self, columns, n):
+        rows = zip(*(columns[name][:n].tolist() for name in COLUMNS))
+        with self.conn:
+            self.conn.executemany(self.insert, rows)
+
+    def close(self):
+        self.conn.close()
+
+
+class LocalBroker:
+    """进程内的 MQTT 替身：同样的 publish / subscribe 接口，本机联调时不用起 broker"""
+
+    def __init__(self):
+        self.subscribers = {}
+
+    def subscribe(self, topic, callback):
+        self.subscribers.setdefault(topic, []).append(callback)
+
+    def publish(self, topic, payload, qos=0):
+        for callback in self.subscribers.get(topic, []):
+            callback(topic, payload)
+
+
+class MqttSink:
+    """
+    按路推送到 MQTT 主题 {topic_prefix}/{stream}，payload 为列式 JSON
+    client 为 paho.mqtt 客户端（已 connect + loop_start）或 LocalBroker
+    """
+
+    def __init__(self, client, topic_prefix="detections", qos=0):
+        self.client = client
+        self.topic_prefix = topic_prefix
+        self.qos = qos
+
+    def write(self, columns, n):
+        stream = columns["stream"][:n]
+        for s in np.unique(stream):
+            mask = stream == s
+            payload = {name: columns[name][:n][mask].round(2 if name != "ts" else 3).tolist()
+                       for name in COLUMNS if name != "stream"}
+            self.client.publish(f"{self.topic_prefix}/{int(s)}", json.dumps(payload, separators=(",", ":")),
+                                qos=self.qos)
+
+    def close(self):
+        pass
+
+
+def create_sink(kind, target):
+    """
+    :param kind: jsonl / parquet / sqlite / mqtt
+    :param target: 文件路径 / 目录；mqtt 为 "host:port"，"local" 表示进程内替身
+    """
+    if kind == "jsonl":
+        return JsonlSink(target)
+    if kind == "parquet":
+        return ParquetSink(target)
+    if kind == "sqlite":
+        return SqliteSink(target)
+    if kind == "mqtt":
+        if target == "local":
+            return MqttSink(LocalBroker())
+        import paho.mqtt.client as mqtt
+        host, _, port = target.partition(":")
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        client.connect(host, int(port or 1883))
+        client.loop_start()
+        return MqttSink(client)
+    raise ValueError(f"未知的结果输出类型 {kind}")
+
+
+# ============================================================
+# 批量写出：推理线程只往列缓冲里拷数据，攒满或超时后交给写线程
+# ============================================================
+class ResultWriter:
+    """
+    推理结果 -> 列式 batch -> 写线程 -> 各 sink
+    待写 batch 总量受 max_pending_bytes 限制，超出时直接丢弃新 batch 并计数，推理线程永不阻塞
+    """
+
+    def __init__(self, sinks, batch_rows=4096, flush_interval=1.0, max_pending_bytes=64 * 1024 * 1024):
+        self.sinks = list(sinks)
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        max_batches = max(1, max_pending_bytes // (batch_rows * ROW_BYTES))
+        self.pending = queue.Queue(maxsize=max_batches)
+
+        self.lock = threading.Lock()
+        self.columns = empty_columns(batch_rows)
+        self.rows = 0
+        self.last_flush = time.perf_counter()
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches_dropped = 0
+
+        self.stop_event = threading.Event()
+        self.worker = threading.Thread(target=self._run, name="result-writer", daemon=True)
+
+    def start(self):
+        self.worker.start()
+        return self
+
+    def add(self, stream_index, ts, det):
+        """追加一帧的检测结果（backends.Detections），只做数组拷贝"""
+        n = len(det)
+        if n == 0:
+            return
+        with self.lock:
+            if self.rows + n > len(self.columns["ts"]):
+                self._flush_locked()
+                if n > len(self.columns["ts"]):
+                    self.columns = empty_columns(n)
+            c, r = self.columns, self.rows
+            c["stream"][r:r + n] = stream_index
+            c["ts"][r:r + n] = ts
+            c["cls"][r:r + n] = det.cls
+            c["conf"][r:r + n] = det.conf
+            c["x1"][r:r + n] = det.xyxy[:, 0]
+            c["y1"][r:r + n] = det.xyxy[:, 1]
+            c["x2"][r:r + n] = det.xyxy[:, 2]
+            c["y2"][r:r + n] = det.xyxy[:, 3]
+            self.rows += n
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self.rows:
+            try:
+                self.pending.put_nowait((self.columns, self.rows))
+            except queue.Full:
+                self.batches_dropped += 1
+                self.rows_dropped += self.rows
+            self.columns = empty_columns(self.batch_rows)
+            self.rows = 0
+        self.last_flush = time.perf_counter()
+
+    def _run(self):
+        while True:
+            try:
+                columns, n = self.pending.get(timeout=0.1)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    break
+                if time.perf_counter() - self.last_flush > self.flush_interval:
+                    self.flush()
+                continue
+            for sink in self.sinks:
+                try:
+                    sink.write(columns, n)
+                except Exception as e:
+                    print(f"[ResultWriter] {type(sink).__name__} 写入失败: {e}")
+            self.rows_written += n
+
+    def close(self):
+        """写完剩余数据后关闭各 sink"""
+        self.flush()
+        self.stop_event.set()
+        self.worker.join()
+        for sink in self.sinks:
+            sink.close()
+
+
+if __name__ == "__main__":
+    # 自检：同一批数据写 JSONL / SQLite / Parquet / 本地 MQTT 后读回核对
+    import tempfile
+    from backends import Detections
+
+    tmp = tempfile.mkdtemp()
+    broker = LocalBroker()
+    received = []
+    broker.subscribe("detections/1", lambda topic, payload: received.append(json.loads(payload)))
+    sinks = [JsonlSink(os.path.join(tmp, "d.jsonl")), SqliteSink(os.path.join(tmp, "d.db")), MqttSink(broker)]
+    try:
+        sinks.append(ParquetSink(os.path.join(tmp, "parquet")))
+    except ImportError:
+        print("未安装 pyarrow，跳过 Parquet")
+
+    writer = ResultWriter(sinks, batch_rows=64, flush_interval=0.05).start()
+    rng = np.random.default_rng(0)
+    total = total_stream1 = 0
+    for i in range(100):
+        n = int(rng.integers(0, 6))
+        xy = rng.uniform(0, 600, (n, 2)).astype(np.float32)
+        det = Detections(np.hstack([xy, xy + 20]), rng.uniform(0.3, 1, n).astype(np.float32),
+                         rng.integers(0, 3, n).astype(np.int32))
+        writer.add(i % 2, 1700000000.0 + i, det)
+        total += n
+        total_stream1 += n if i % 2 else 0
+    writer.close()
+
+    with open(os.path.join(tmp, "d.jsonl"), encoding="utf-8") as f:
+        assert sum(1 for _ in f) == total
+    assert sqlite3.connect(os.path.join(tmp, "d.db")).execute("SELECT COUNT(*) FROM detections").fetchone()[0] == total
+    assert sum(len(p["ts"]) for p in received) == total_stream1
+    if len(sinks) == 4:
+        import pyarrow.parquet as pq
+        assert sum(pq.read_table(os.path.join(tmp, "parquet", f)).num_rows
+                   for f in os.listdir(os.path.join(tmp, "parquet"))) == total
+    print(f"sinks 自检通过：{total} 行，写入 {writer.rows_written}，丢弃 {writer.rows_dropped}")
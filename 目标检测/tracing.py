@@ -0,0 +1,224 @@
+import collections
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# 每帧经过的阶段（时间戳均为 time.perf_counter_ns）
+# capture:     VideoCapture.grab()，取流 + 解封装（FFmpeg 后端的解码也在这里完成）
+# decode:      VideoCapture.retrieve()，转成 BGR 帧
+# queue_wait:  提交到推理队列 -> 所在 batch 开始推理
+# preprocess / inference / postprocess:  DetectorBackend.detect 内部三段（整 batch 共用）
+# render:      渲染线程画框 + 输出
+STAGES = ("capture", "decode", "queue_wait", "preprocess", "inference", "postprocess", "render")
+
+
+class LatencyHistogram:
+    """
+    HDR 风格的对数-线性直方图（单位 us）：64us 以内逐 us 计数，
+    之后每个 2 的幂区间再分 32 个桶，相对误差约 3%，内存固定、记录 O(1)
+    """
+    SUB_BUCKETS = 32
+    NUM_BUCKETS = 2 * SUB_BUCKETS + 36 * SUB_BUCKETS
+
+    def __init__(self):
+        self.counts = np.zeros(self.NUM_BUCKETS, np.int64)
+        self.total = 0
+        self.sum_us = 0
+        self.max_us = 0
+
+    @classmethod
+    def bucket_index(cls, us):
+        if us < 2 * cls.SUB_BUCKETS:
+            return us
+        shift = us.bit_length() - 6
+        return min(2 * cls.SUB_BUCKETS + (shift - 1) * cls.SUB_BUCKETS + (us >> shift) - cls.SUB_BUCKETS,
+                   cls.NUM_BUCKETS - 1)
+
+    @classmethod
+    def bucket_value(cls, index):
+        """桶的代表值（区间中点）"""
+        if index < 2 * cls.SUB_BUCKETS:
+            return float(index)
+        shift = (index - 2 * cls.SUB_BUCKETS) // cls.SUB_BUCKETS + 1
+        base = ((index - 2 * cls.SUB_BUCKETS) % cls.SUB_BUCKETS + cls.SUB_BUCKETS) << shift
+        return base + (1 << shift) / 2
+
+    def record(self, us):
+        us = max(int(us), 0)
+        self.counts[self.bucket_index(us)] += 1
+        self.total += 1
+        self.sum_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def percentile(self, p):
+        if self.total == 0:
+            return 0.0
+        rank = max(1, int(np.ceil(self.total * p / 100.0)))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self.bucket_value(index), float(self.max_us))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total += other.total
+        self.sum_us += other.sum_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def summary(self):
+        """毫秒为单位的统计摘要"""
+        return {
+            "count": self.total,
+            "mean_ms": self.sum_us / self.total / 1000.0 if self.total else 0.0,
+            "p50_ms": self.percentile(50) / 1000.0,
+            "p90_ms": self.percentile(90) / 1000.0,
+            "p99_ms": self.percentile(99) / 1000.0,
+            "max_ms": self.max_us / 1000.0,
+        }
+
+
+class Tracer:
+    """
+    流水线逐帧打点：每路每阶段一个 LatencyHistogram，外加最近 ring_size 条原始事件的环形缓冲
+    （可导出 Chrome trace 格式，在 chrome://tracing 或 Perfetto 里看火焰图）
+    enabled=False 时 record 直接返回，调用方不用判断
+    """
+
+    def __init__(self, num_streams, ring_size=100000, enabled=True):
+        self.num_streams = num_streams
+        self.enabled = enabled
+        self.histograms = [{stage: LatencyHistogram() for stage in STAGES} for _ in range(num_streams)]
+        self.events = collections.deque(maxlen=ring_size)  # (stream_index, stage, start_ns, dur_ns)
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.t0_ns = time.perf_counter_ns()
+
+        self._httpd = None
+        self._dump_stop = threading.Event()
+        self._dump_thread = None
+
+    def record(self, stream_index, stage, start_ns, end_ns):
+        if not self.enabled:
+            return
+        dur_ns = end_ns - start_ns
+        with self.lock:
+            self.histograms[stream_index][stage].record(dur_ns // 1000)
+            self.events.append((stream_index, stage, start_ns, dur_ns))
+
+    def record_stages(self, stream_index, stages):
+        """批量记录 {stage: (start_ns, end_ns)}，如 DetectorBackend.last_timings"""
+        for stage, (start_ns, end_ns) in stages.items():
+            self.record(stream_index, stage, start_ns, end_ns)
+
+    def reset(self):
+        """清空已记录的直方图和事件（如压测预热结束时）"""
+        with self.lock:
+            self.histograms = [{stage: LatencyHistogram() for stage in STAGES} for _ in range(self.num_streams)]
+            self.events.clear()
+            self.started_at = time.time()
+            self.t0_ns = time.perf_counter_ns()
+
+    # ---------- 导出 ----------
+    def snapshot(self):
+        """各路各阶段的延迟摘要，外加所有路合并后的 total"""
+        with self.lock:
+            streams = {}
+            total = {stage: LatencyHistogram() for stage in STAGES}
+            for i, hists in enumerate(self.histograms):
+                streams[str(i)] = {stage: h.summary() for stage, h in hists.items() if h.total}
+                for stage, h in hists.items():
+                    total[stage].merge(h)
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "uptime_s": time.time() - self.started_at,
+            "streams": streams,
+            "total": {stage: h.summary() for stage, h in total.items() if h.total},
+        }
+
+    def chrome_trace(self):
+        with self.lock:
+            events = list(self.events)
+        return {
+            "traceEvents": [
+                {"name": stage, "ph": "X", "pid": 0, "tid": stream_index,
+                 "ts": (start_ns - self.t0_ns) / 1000.0, "dur": dur_ns / 1000.0}
+                for stream_index, stage, start_ns, dur_ns in events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def dump_json(self, path):
+        write_json_atomic(path, self.snapshot())
+
+    def export_chrome_trace(self, path):
+        write_json_atomic(path, self.chrome_trace())
+
+    def start_periodic_dump(self, path, interval_s=5.0):
+        def loop():
+            while not self._dump_stop.wait(interval_s):
+                self.dump_json(path)
+
+        self._dump_thread = threading.Thread(target=loop, name="trace-dump", daemon=True)
+        self._dump_thread.start()
+
+    def serve(self, host="0.0.0.0", port=9100):
+        """拉取接口：GET /metrics 返回 snapshot，GET /trace 返回 Chrome trace"""
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = tracer.snapshot()
+                elif self.path == "/trace":
+                    body = tracer.chrome_trace()
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name="trace-http", daemon=True).start()
+
+    def close(self):
+        self._dump_stop.set()
+        if self._dump_thread is not None:
+            self._dump_thread.join()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+
+def write_json_atomic(path, obj):
+    # 先写临时文件再替换，外部读取方不会读到写了一半的文件
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+if __name__ == "__main__":
+    # 自检：直方图分位数误差在桶精度以内
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(mean=8, sigma=1.0, size=20000).astype(np.int64)
+    h = LatencyHistogram()
+    for v in values:
+        h.record(int(v))
+    for p in (50, 90, 99):
+        exact = np.percentile(values, p)
+        approx = h.percentile(p)
+        assert abs(approx - exact) / exact < 0.04, (p, exact, approx)
+    for i in range(LatencyHistogram.NUM_BUCKETS - 1):
+        assert LatencyHistogram.bucket_index(int(LatencyHistogram.bucket_value(i))) == i
+    print("tracing 自检通过", h.summary())